@@ -0,0 +1,308 @@
+"""Reproducible throughput/latency benchmark over the cookbook workloads.
+
+Runs locally against `EphemeralClient` or `PersistentClient` on a synthetic,
+seeded dataset and measures:
+
+- add and upsert throughput (records/s)
+- p50/p95/p99 latency of get-by-ID, filtered get (`where`), vector query,
+  filtered query and keyword query (`where_document` `$contains`)
+- recall@k of the HNSW index against exact brute-force search
+- peak RSS and on-disk footprint
+
+Each size runs in its own subprocess (and, with `--persistent`, its own
+temporary directory), so peak RSS and disk usage are per-size values rather
+than maxima carried over from earlier sizes.
+
+Results are written as JSON so runs can be compared across Chroma versions
+or HNSW configurations.
+
+Usage:
+    python benchmark_suite.py --sizes 10000 100000 --output run.json
+    python benchmark_suite.py --sizes 100000 --ef-construction 200 --max-neighbors 32 \\
+        --persistent --output tuned.json
+    python benchmark_suite.py --compare run.json tuned.json
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import platform
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Callable
+
+import chromadb
+import numpy as np
+
+CATEGORIES = [f"cat-{i}" for i in range(10)]
+WORDS = ["learning", "quantum", "energy", "security", "storage", "network", "pricing", "latency"]
+
+
+def percentiles(samples: list[float]) -> dict[str, float]:
+    values = np.asarray(samples) * 1000
+    return {
+        "p50_ms": float(np.percentile(values, 50)),
+        "p95_ms": float(np.percentile(values, 95)),
+        "p99_ms": float(np.percentile(values, 99)),
+        "mean_ms": float(values.mean()),
+    }
+
+
+def timed(fn: Callable[[], Any], repeats: int) -> list[float]:
+    samples = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+def make_dataset(size: int, dim: int, seed: int) -> dict[str, Any]:
+    """Clustered float32 vectors with scalar metadata and keyword-bearing documents."""
+
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(64, dim)).astype(np.float32)
+    labels = rng.integers(0, len(centers), size=size)
+    vectors = centers[labels] + rng.normal(scale=0.3, size=(size, dim)).astype(np.float32)
+    words = rng.integers(0, len(WORDS), size=(size, 2))
+    return {
+        "ids": [f"rec-{i:08d}" for i in range(size)],
+        "embeddings": vectors,
+        "documents": [f"doc {i} about {WORDS[a]} and {WORDS[b]}" for i, (a, b) in enumerate(words)],
+        "metadatas": [
+            {"category": CATEGORIES[i % len(CATEGORIES)], "year": 2015 + i % 10, "n": i}
+            for i in range(size)
+        ],
+    }
+
+
+def brute_force_top_k(vectors: np.ndarray, queries: np.ndarray, k: int) -> np.ndarray:
+    """Exact squared-L2 top-k, computed in chunks to bound memory."""
+
+    best_d = np.full((len(queries), k), np.inf, dtype=np.float32)
+    best_i = np.zeros((len(queries), k), dtype=np.int64)
+    q_norms = (queries**2).sum(axis=1)[:, None]
+    for start in range(0, len(vectors), 100_000):
+        chunk = vectors[start : start + 100_000]
+        dists = q_norms - 2 * queries @ chunk.T + (chunk**2).sum(axis=1)[None, :]
+        merged_d = np.concatenate([best_d, dists], axis=1)
+        merged_i = np.concatenate(
+            [best_i, np.broadcast_to(np.arange(start, start + len(chunk)), dists.shape)], axis=1
+        )
+        order = np.argsort(merged_d, axis=1)[:, :k]
+        best_d = np.take_along_axis(merged_d, order, axis=1)
+        best_i = np.take_along_axis(merged_i, order, axis=1)
+    return best_i
+
+
+def dir_size(path: str) -> int:
+    return sum(p.stat().st_size for p in Path(path).rglob("*") if p.is_file())
+
+
+def run_size(client: Any, size: int, args: argparse.Namespace, persist_dir: str | None) -> dict[str, Any]:
+    data = make_dataset(size, args.dim, args.seed)
+    name = f"bench_{size}"
+    try:
+        client.delete_collection(name)
+    except Exception:
+        pass
+    hnsw = {"space": "l2", "ef_construction": args.ef_construction, "max_neighbors": args.max_neighbors}
+    if args.ef_search is not None:
+        hnsw["ef_search"] = args.ef_search
+    collection = client.create_collection(
+        name, configuration={"hnsw": hnsw}, embedding_function=None
+    )
+    batch_size = min(args.batch_size, client.get_max_batch_size())
+
+    def write(method: str, rows: range) -> float:
+        started = time.perf_counter()
+        for start in range(rows.start, rows.stop, batch_size):
+            end = min(start + batch_size, rows.stop)
+            getattr(collection, method)(
+                ids=data["ids"][start:end],
+                embeddings=data["embeddings"][start:end],
+                documents=data["documents"][start:end],
+                metadatas=data["metadatas"][start:end],
+            )
+        return len(rows) / (time.perf_counter() - started)
+
+    add_rate = write("add", range(0, size))
+    upsert_rows = range(0, min(size, args.upsert_rows))
+    upsert_rate = write("upsert", upsert_rows)
+
+    rng = random.Random(args.seed)
+    vectors = data["embeddings"]
+    query_idx = np.random.default_rng(args.seed + 1).integers(0, size, size=args.queries)
+    queries = vectors[query_idx] + np.random.default_rng(args.seed + 2).normal(
+        scale=0.05, size=(args.queries, args.dim)
+    ).astype(np.float32)
+
+    latencies = {
+        "get_by_id": timed(
+            lambda: collection.get(ids=rng.sample(data["ids"], 10), include=["metadatas"]),
+            args.queries,
+        ),
+        "get_where": timed(
+            lambda: collection.get(
+                where={"$and": [{"category": rng.choice(CATEGORIES)}, {"year": {"$gte": 2020}}]},
+                limit=10,
+                include=["metadatas"],
+            ),
+            args.queries,
+        ),
+        "query": timed(
+            lambda: collection.query(
+                query_embeddings=[queries[rng.randrange(len(queries))]], n_results=args.k
+            ),
+            args.queries,
+        ),
+        "query_where": timed(
+            lambda: collection.query(
+                query_embeddings=[queries[rng.randrange(len(queries))]],
+                n_results=args.k,
+                where={"category": rng.choice(CATEGORIES)},
+            ),
+            args.queries,
+        ),
+        "query_keyword": timed(
+            lambda: collection.query(
+                query_embeddings=[queries[rng.randrange(len(queries))]],
+                n_results=args.k,
+                where_document={"$contains": rng.choice(WORDS)},
+            ),
+            args.queries,
+        ),
+    }
+
+    truth = brute_force_top_k(vectors, queries, args.k)
+    found = collection.query(query_embeddings=queries, n_results=args.k, include=[])["ids"]
+    hits = sum(
+        len({data["ids"][i] for i in truth_row} & set(found_row))
+        for truth_row, found_row in zip(truth, found)
+    )
+
+    result = {
+        "size": size,
+        "add_records_per_sec": add_rate,
+        "upsert_records_per_sec": upsert_rate,
+        "latency": {op: percentiles(samples) for op, samples in latencies.items()},
+        f"recall_at_{args.k}": hits / (len(queries) * args.k),
+        # ru_maxrss is KiB on Linux and bytes on macOS.
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        / (1024 * 1024 if sys.platform == "darwin" else 1024),
+        "disk_mb": dir_size(persist_dir) / 1_000_000 if persist_dir else None,
+    }
+    client.delete_collection(name)
+    return result
+
+
+def compare(old_path: str, new_path: str) -> None:
+    old = {r["size"]: r for r in json.loads(Path(old_path).read_text())["results"]}
+    new = {r["size"]: r for r in json.loads(Path(new_path).read_text())["results"]}
+
+    def row(label: str, before: float | None, after: float | None) -> None:
+        if before is None or after is None:
+            return
+        change = (after - before) / before * 100 if before else 0.0
+        print(f"  {label:<32} {before:>12.3f} {after:>12.3f} {change:>+8.1f}%")
+
+    for size in sorted(old.keys() & new.keys()):
+        a, b = old[size], new[size]
+        print(f"size={size}")
+        row("add_records_per_sec", a["add_records_per_sec"], b["add_records_per_sec"])
+        row("upsert_records_per_sec", a["upsert_records_per_sec"], b["upsert_records_per_sec"])
+        for op in (op for op in a["latency"] if op in b["latency"]):
+            for p in ("p50_ms", "p99_ms"):
+                row(f"{op}.{p}", a["latency"][op][p], b["latency"][op][p])
+        recall = next(k for k in a if k.startswith("recall_at_"))
+        row(recall, a[recall], b.get(recall))
+        row("peak_rss_mb", a["peak_rss_mb"], b["peak_rss_mb"])
+        row("disk_mb", a["disk_mb"], b["disk_mb"])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Chroma cookbook benchmark suite.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--dim", type=int, default=128)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--upsert-rows", type=int, default=10_000)
+    parser.add_argument("--ef-construction", type=int, default=100)
+    parser.add_argument("--max-neighbors", type=int, default=16)
+    parser.add_argument("--ef-search", type=int, default=None)
+    parser.add_argument("--persistent", action="store_true", help="use PersistentClient")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"))
+    parser.add_argument("--size", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    if args.size is not None:
+        persist_dir = tempfile.mkdtemp(prefix="chroma-bench-") if args.persistent else None
+        try:
+            if persist_dir:
+                client = chromadb.PersistentClient(path=persist_dir)
+            else:
+                client = chromadb.EphemeralClient()
+            print(json.dumps(run_size(client, args.size, args, persist_dir)))
+        finally:
+            if persist_dir:
+                shutil.rmtree(persist_dir, ignore_errors=True)
+        return
+
+    forwarded = [
+        f"--{key.replace('_', '-')}={value}"
+        for key, value in vars(args).items()
+        if key not in ("sizes", "size", "persistent", "output", "compare") and value is not None
+    ]
+    if args.persistent:
+        forwarded.append("--persistent")
+    results = []
+    for size in args.sizes:
+        out = subprocess.run(
+            [sys.executable, __file__, "--size", str(size), *forwarded],
+            check=True,
+            capture_output=True,
+            text=True,
+        )
+        result = json.loads(out.stdout.strip().splitlines()[-1])
+        results.append(result)
+        print(
+            f"size={size} add={result['add_records_per_sec']:,.0f}/s "
+            f"query p50={result['latency']['query']['p50_ms']:.2f}ms "
+            f"p99={result['latency']['query']['p99_ms']:.2f}ms "
+            f"recall@{args.k}={result[f'recall_at_{args.k}']:.3f}"
+        )
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "chromadb": chromadb.__version__,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "client": "persistent" if args.persistent else "ephemeral",
+            "config": {k: v for k, v in vars(args).items() if k not in ("output", "compare", "size")},
+        },
+        "results": results,
+    }
+    Path(args.output).write_text(json.dumps(report, indent=2))
+    print(f"\nwrote {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -13,6 +13,11 @@ import random
 
 import chromadb
 
+from collection_copy import clone_collection, clone_subset, copy_collection
+from collection_iterator import iter_collection
+from metadata_rewrite import rewrite_metadata
+from reembed import EmbeddingCache, reembed_collection
+
 client = chromadb.HttpClient()
 
 DIM = 3
@@ -154,15 +159,10 @@ print(f"constrained query returned {len(constrained['ids'][0])} results (max 3 f
 
 # ── Iterating over a Collection (batched) ──
 
-existing_count = col.count()
-batch_size = 5
-for i in range(0, existing_count, batch_size):
-    batch = col.get(
-        include=["metadatas", "documents", "embeddings"],
-        limit=batch_size,
-        offset=i,
-    )
-    print(f"  batch offset={i}: {len(batch['ids'])} items")
+# Pages by the last-seen ID instead of limit/offset, prefetching the next page
+# in the background. See collection_iterator.py.
+for batch in iter_collection(col, batch_size=5):
+    print(f"  batch: {len(batch['ids'])} items")
 
 # ── Copy Collection ──
 
@@ -177,21 +177,9 @@ source.add(
 )
 dest = client.create_collection("copy_dest", metadata=source.metadata)
 
-existing_count = source.count()
-batch_size = 10
-for i in range(0, existing_count, batch_size):
-    batch = source.get(
-        include=["metadatas", "documents", "embeddings"],
-        limit=batch_size,
-        offset=i,
-    )
-    dest.add(
-        ids=batch["ids"],
-        documents=batch["documents"],
-        metadatas=batch["metadatas"],
-        embeddings=batch["embeddings"],
-    )
-print(f"copied: {dest.count()} items")
+# One reader and N writers joined by a bounded queue. See collection_copy.py.
+stats = copy_collection(source, dest, batch_size=10, writers=2)
+print(f"copied: {dest.count()} items ({stats})")
 
 # ── Clone Collection (change distance function) ──
 
@@ -203,25 +191,15 @@ clone_src.add(
     documents=[f"document {i}" for i in range(100)],
     embeddings=[rand_emb() for _ in range(100)],
 )
-clone_dst = client.create_collection(
-    "clone_cosine", configuration={"hnsw": {"space": "cosine"}}
+clone_dst, stats = clone_collection(
+    clone_src,
+    client,
+    "clone_cosine",
+    configuration={"hnsw": {"space": "cosine"}},
+    batch_size=10,
+    writers=4,
 )
-
-existing_count = clone_src.count()
-batch_size = 10
-for i in range(0, existing_count, batch_size):
-    batch = clone_src.get(
-        include=["metadatas", "documents", "embeddings"],
-        limit=batch_size,
-        offset=i,
-    )
-    clone_dst.add(
-        ids=batch["ids"],
-        documents=batch["documents"],
-        metadatas=batch["metadatas"],
-        embeddings=batch["embeddings"],
-    )
-print(f"cloned: {clone_dst.count()} items with cosine distance")
+print(f"cloned: {clone_dst.count()} items with cosine distance ({stats})")
 
 # ── Change Embedding Function (requires OPENAI_API_KEY) ──
 
@@ -243,17 +221,14 @@ if os.getenv("OPENAI_API_KEY"):
     # Destination re-embeds documents with OpenAI
     ef_dst = client.create_collection("ef_openai", embedding_function=openai_ef)
 
-    count = ef_src.count()
-    for i in range(0, count, 10):
-        batch = ef_src.get(
-            include=["metadatas", "documents"], limit=10, offset=i
-        )
-        ef_dst.add(
-            ids=batch["ids"],
-            documents=batch["documents"],
-            metadatas=batch["metadatas"],
-        )
-    print(f"re-embedded: {ef_dst.count()} items with OpenAI embeddings")
+    # Embeddings are cached by (model, content hash), so re-runs and duplicate
+    # documents are not embedded again. See reembed.py.
+    cache = EmbeddingCache("embedding_cache.sqlite")
+    stats = reembed_collection(
+        ef_src, ef_dst, openai_ef, "openai/text-embedding-3-small", cache, batch_size=10
+    )
+    cache.close()
+    print(f"re-embedded: {ef_dst.count()} items with OpenAI embeddings ({stats})")
 else:
     print("skipped: change embedding function (set OPENAI_API_KEY to enable)")
 
@@ -268,30 +243,20 @@ subset_src.add(
     metadatas=[{"category": "a" if i % 2 == 0 else "b"} for i in range(100)],
     embeddings=[rand_emb() for _ in range(100)],
 )
-subset_dst = client.create_collection(
-    "subset_dest", configuration={"hnsw": {"space": "cosine"}}
-)
 
 query_where = {"category": "a"}
 query_where_document = {"$contains": "document"}
-select_ids = subset_src.get(
-    where_document=query_where_document, where=query_where, include=[]
+# The filter runs once to snapshot matching IDs; records are then fetched by ID
+# in parallel chunks. See collection_copy.py.
+subset_dst, stats = clone_subset(
+    subset_src,
+    client,
+    "subset_dest",
+    where=query_where,
+    where_document=query_where_document,
+    configuration={"hnsw": {"space": "cosine"}},
+    batch_size=10,
 )
-batch_size = 10
-for i in range(0, len(select_ids["ids"]), batch_size):
-    batch = subset_src.get(
-        include=["metadatas", "documents", "embeddings"],
-        limit=batch_size,
-        offset=i,
-        where=query_where,
-        where_document=query_where_document,
-    )
-    subset_dst.add(
-        ids=batch["ids"],
-        documents=batch["documents"],
-        metadatas=batch["metadatas"],
-        embeddings=batch["embeddings"],
-    )
 print(f"cloned subset: {subset_dst.count()} items (category=a only)")
 
 # ── Update Document/Record Metadata ──
@@ -310,15 +275,10 @@ def update_metadata(metadata: dict):
     return {k: v.strip() if isinstance(v, str) else v for k, v in metadata.items()}
 
 
-count = meta_col.count()
-for i in range(0, count, 10):
-    batch = meta_col.get(include=["metadatas"], limit=10, offset=i)
-    meta_col.update(
-        ids=batch["ids"],
-        metadatas=[update_metadata(m) for m in batch["metadatas"]],
-    )
+# Only rows whose metadata actually changed are written. See metadata_rewrite.py.
+stats = rewrite_metadata(meta_col, update_metadata, batch_size=10)
 result = meta_col.get(include=["metadatas"])
-print(f"updated metadata: {result['metadatas']}")
+print(f"updated metadata: {result['metadatas']} ({stats})")
 
 # ── Getting IDs Only ──
 
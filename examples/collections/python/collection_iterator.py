@@ -0,0 +1,145 @@
+"""Keyset-cursor iteration over a Chroma collection.
+
+`collection.get(limit=..., offset=...)` makes every page skip over all the rows
+before it, so walking a whole collection page by page is quadratic. Chroma
+`where` filters cannot range over record IDs, so this helper takes one cheap
+ID-only snapshot (`include=[]`), sorts it, and then pages through it by the
+last-seen ID, fetching each page with `get(ids=...)`. The next page is
+prefetched on a background thread while the caller handles the current one.
+
+Usage:
+    from collection_iterator import iter_collection
+
+    for batch in iter_collection(collection, batch_size=1000):
+        ...  # batch["ids"], batch["documents"], ...
+
+Run the offset vs keyset benchmark (local, no server needed):
+    python collection_iterator.py --sizes 10000 100000 1000000
+"""
+
+from __future__ import annotations
+
+import argparse
+import bisect
+import random
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Iterator, Sequence
+
+import chromadb
+
+DEFAULT_INCLUDE = ("metadatas", "documents", "embeddings")
+
+
+def snapshot_ids(collection: Any) -> list[str]:
+    """Return all record IDs of a collection in sorted (cursor) order."""
+
+    return sorted(collection.get(include=[])["ids"])
+
+
+def iter_collection(
+    collection: Any,
+    batch_size: int = 1000,
+    include: Sequence[str] = DEFAULT_INCLUDE,
+    start_after: str | None = None,
+    ids: Sequence[str] | None = None,
+    prefetch: bool = True,
+    workers: int = 1,
+) -> Iterator[dict[str, Any]]:
+    """Yield `get()` results page by page, ordered by record ID.
+
+    `start_after` resumes the walk after a previously seen ID (the cursor).
+    `ids` lets callers pass an existing sorted ID snapshot instead of taking a
+    new one. Records deleted after the snapshot are silently skipped.
+    `workers` fetches up to that many pages ahead in parallel; pages are still
+    yielded in cursor order.
+    """
+
+    if batch_size < 1:
+        raise ValueError("batch_size must be >= 1")
+    if workers < 1:
+        raise ValueError("workers must be >= 1")
+
+    all_ids = list(ids) if ids is not None else snapshot_ids(collection)
+    start = bisect.bisect_right(all_ids, start_after) if start_after is not None else 0
+    pages = [all_ids[i : i + batch_size] for i in range(start, len(all_ids), batch_size)]
+    include = list(include)
+
+    def fetch(page: list[str]) -> dict[str, Any]:
+        return collection.get(ids=page, include=include)
+
+    if not prefetch:
+        for page in pages:
+            yield fetch(page)
+        return
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="chroma-prefetch") as pool:
+        pending = deque(pool.submit(fetch, page) for page in pages[:workers])
+        for next_page in pages[workers:] + [None] * min(workers, len(pages)):
+            batch = pending.popleft().result()
+            if next_page is not None:
+                pending.append(pool.submit(fetch, next_page))
+            yield batch
+
+
+def iter_offset(
+    collection: Any, batch_size: int = 1000, include: Sequence[str] = DEFAULT_INCLUDE
+) -> Iterator[dict[str, Any]]:
+    """The limit/offset loop from `collection_examples.py`, kept for comparison."""
+
+    existing_count = collection.count()
+    for i in range(0, existing_count, batch_size):
+        yield collection.get(include=list(include), limit=batch_size, offset=i)
+
+
+def _seed(collection: Any, size: int, dim: int, max_batch_size: int) -> None:
+    for start in range(0, size, max_batch_size):
+        end = min(start + max_batch_size, size)
+        collection.add(
+            ids=[f"rec-{i:08d}" for i in range(start, end)],
+            documents=[f"document {i}" for i in range(start, end)],
+            metadatas=[{"n": i} for i in range(start, end)],
+            embeddings=[[random.random() for _ in range(dim)] for _ in range(start, end)],
+        )
+
+
+def _walk(batches: Iterator[dict[str, Any]]) -> tuple[int, float]:
+    started = time.perf_counter()
+    total = sum(len(batch["ids"]) for batch in batches)
+    return total, time.perf_counter() - started
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Compare offset and keyset iteration.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--dim", type=int, default=32)
+    args = parser.parse_args()
+
+    client = chromadb.EphemeralClient()
+    for size in args.sizes:
+        name = f"iter_bench_{size}"
+        try:
+            client.delete_collection(name)
+        except Exception:
+            pass
+        collection = client.create_collection(name, embedding_function=None)
+        _seed(collection, size, args.dim, client.get_max_batch_size())
+
+        offset_total, offset_secs = _walk(iter_offset(collection, args.batch_size))
+        keyset_total, keyset_secs = _walk(iter_collection(collection, args.batch_size))
+        if offset_total != size or keyset_total != size:
+            raise AssertionError(f"expected {size} records, got {offset_total}/{keyset_total}")
+
+        print(
+            f"size={size:>9} offset={offset_secs:8.2f}s keyset={keyset_secs:8.2f}s "
+            f"speedup={offset_secs / keyset_secs:5.1f}x"
+        )
+        client.delete_collection(name)
+
+    print("\npython: collection iterator benchmark passed")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,218 @@
+"""Diff-aware bulk metadata rewrite for a Chroma collection.
+
+The "Update Document/Record Metadata" loop in `collection_examples.py` sends
+every row back with `update()`, even when the transform changed nothing, and
+each of those rows still costs a write, a WAL entry and an index touch. This
+helper runs fetch, transform and write as concurrent stages joined by bounded
+queues, and only writes the rows whose metadata actually changed.
+
+Chroma merges metadata on `update()` and drops keys set to `None`, so each
+changed row is sent as a delta: new or modified keys, plus `None` for keys the
+transform removed.
+
+Usage:
+    from metadata_rewrite import rewrite_metadata
+
+    def strip_strings(metadata: dict) -> dict:
+        return {k: v.strip() if isinstance(v, str) else v for k, v in metadata.items()}
+
+    print(rewrite_metadata(collection, strip_strings))
+
+Run the demo (local, no server needed):
+    python metadata_rewrite.py --size 100000
+"""
+
+from __future__ import annotations
+
+import argparse
+import queue
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Mapping
+
+import chromadb
+
+from collection_iterator import iter_collection
+
+Metadata = Mapping[str, Any]
+_DONE = object()
+
+
+@dataclass
+class RewriteStats:
+    """Row counts of a metadata rewrite."""
+
+    scanned: int = 0
+    changed: int = 0
+    skipped: int = 0
+    writes: int = 0
+    started: float = field(default_factory=time.perf_counter)
+
+    @property
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    def __str__(self) -> str:
+        return (
+            f"scanned={self.scanned} changed={self.changed} skipped={self.skipped} "
+            f"writes={self.writes} elapsed={self.elapsed:.2f}s"
+        )
+
+
+def metadata_delta(old: Metadata | None, new: Metadata | None) -> dict[str, Any] | None:
+    """Return the `update()` payload turning `old` into `new`, or None if equal."""
+
+    old = old or {}
+    new = new or {}
+    delta = {k: v for k, v in new.items() if k not in old or old[k] != v}
+    delta.update({k: None for k in old if k not in new})
+    return delta or None
+
+
+def rewrite_metadata(
+    collection: Any,
+    transform: Callable[[dict[str, Any]], dict[str, Any]],
+    batch_size: int = 1000,
+    queue_size: int = 4,
+    where: dict[str, Any] | None = None,
+) -> RewriteStats:
+    """Apply `transform` to every record's metadata and write back only the changes.
+
+    `transform` receives a copy of each metadata dict and returns the new one.
+    Changed rows are coalesced into writes of up to `batch_size` rows.
+    """
+
+    stats = RewriteStats()
+    fetched: queue.Queue[Any] = queue.Queue(maxsize=queue_size)
+    changed: queue.Queue[Any] = queue.Queue(maxsize=queue_size)
+    errors: list[BaseException] = []
+    stop = threading.Event()
+
+    ids = None
+    if where is not None:
+        ids = sorted(collection.get(where=where, include=[])["ids"])
+
+    def fetch_stage() -> None:
+        try:
+            for batch in iter_collection(collection, batch_size, ["metadatas"], ids=ids):
+                if stop.is_set():
+                    break
+                fetched.put(batch)
+        except BaseException as exc:
+            errors.append(exc)
+            stop.set()
+        finally:
+            fetched.put(_DONE)
+
+    def transform_stage() -> None:
+        try:
+            while (batch := fetched.get()) is not _DONE:
+                if stop.is_set():
+                    continue
+                out_ids: list[str] = []
+                out_metas: list[dict[str, Any]] = []
+                for record_id, metadata in zip(batch["ids"], batch["metadatas"]):
+                    delta = metadata_delta(metadata, transform(dict(metadata or {})))
+                    if delta is not None:
+                        out_ids.append(record_id)
+                        out_metas.append(delta)
+                stats.scanned += len(batch["ids"])
+                stats.skipped += len(batch["ids"]) - len(out_ids)
+                if out_ids:
+                    changed.put((out_ids, out_metas))
+        except BaseException as exc:
+            errors.append(exc)
+            stop.set()
+            while fetched.get() is not _DONE:  # unblock the fetch stage
+                pass
+        finally:
+            changed.put(_DONE)
+
+    def write(ids_: list[str], metadatas: list[dict[str, Any]]) -> None:
+        collection.update(ids=ids_, metadatas=metadatas)
+        stats.changed += len(ids_)
+        stats.writes += 1
+
+    stages = [
+        threading.Thread(target=fetch_stage, name="metadata-rewrite-fetch", daemon=True),
+        threading.Thread(target=transform_stage, name="metadata-rewrite-transform", daemon=True),
+    ]
+    for stage in stages:
+        stage.start()
+
+    # The write stage runs on the calling thread and coalesces sparse changes.
+    pending_ids: list[str] = []
+    pending_metas: list[dict[str, Any]] = []
+    try:
+        while (item := changed.get()) is not _DONE:
+            if stop.is_set():
+                continue
+            pending_ids.extend(item[0])
+            pending_metas.extend(item[1])
+            while len(pending_ids) >= batch_size:
+                write(pending_ids[:batch_size], pending_metas[:batch_size])
+                del pending_ids[:batch_size], pending_metas[:batch_size]
+        if pending_ids and not stop.is_set():
+            write(pending_ids, pending_metas)
+    except BaseException:
+        stop.set()
+        while changed.get() is not _DONE:  # unblock the upstream stages
+            pass
+        raise
+    finally:
+        for stage in stages:
+            stage.join()
+
+    if errors:
+        raise errors[0]
+    return stats
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Diff-aware metadata rewrite demo.")
+    parser.add_argument("--size", type=int, default=20_000)
+    parser.add_argument("--dirty-every", type=int, default=20, help="1 in N rows needs a change")
+    args = parser.parse_args()
+
+    client = chromadb.EphemeralClient()
+    try:
+        client.delete_collection("meta_rewrite")
+    except Exception:
+        pass
+    collection = client.create_collection("meta_rewrite", embedding_function=None)
+    max_batch_size = client.get_max_batch_size()
+    for start in range(0, args.size, max_batch_size):
+        end = min(start + max_batch_size, args.size)
+        collection.add(
+            ids=[f"rec-{i:08d}" for i in range(start, end)],
+            embeddings=[[float(i), 0.0, 1.0] for i in range(start, end)],
+            metadatas=[
+                {"tag": "  spaces  " if i % args.dirty_every == 0 else "clean", "n": i}
+                for i in range(start, end)
+            ],
+        )
+
+    def update_metadata(metadata: dict[str, Any]) -> dict[str, Any]:
+        return {k: v.strip() if isinstance(v, str) else v for k, v in metadata.items()}
+
+    stats = rewrite_metadata(collection, update_metadata)
+    print(f"rewrite: {stats}")
+
+    expected_changed = len(range(0, args.size, args.dirty_every))
+    if stats.changed != expected_changed or stats.scanned != args.size:
+        raise AssertionError(f"expected {expected_changed} changed of {args.size}, got {stats}")
+    remaining = collection.get(where={"tag": "  spaces  "}, include=[])
+    if remaining["ids"]:
+        raise AssertionError(f"{len(remaining['ids'])} rows were not rewritten")
+
+    stats = rewrite_metadata(collection, update_metadata)
+    print(f"second pass (nothing to change): {stats}")
+    if stats.writes != 0:
+        raise AssertionError("an idempotent transform must not write")
+
+    print("\npython: metadata rewrite example passed")
+
+
+if __name__ == "__main__":
+    main()
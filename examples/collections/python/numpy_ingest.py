@@ -0,0 +1,244 @@
+"""NumPy ingestion and retrieval helpers for Chroma collections.
+
+The examples build embeddings as Python lists (`rand_emb()`), and a list of
+1536 Python floats per row costs far more memory and CPU than the 6 KB of
+float32 it carries. The Chroma client normalizes every embedding into a
+float32 NumPy row anyway, so passing a contiguous `float32` 2-D array lets it
+take row views instead of converting each float. These helpers keep data in
+that form end to end:
+
+- `add_embeddings()` / `upsert_embeddings()` accept any array-like, including a
+  memory-mapped `.npy` file, and slice it into batch-sized chunks without
+  copying;
+- `get_embeddings()` and `query_embeddings()` return `float32` arrays instead
+  of nested lists.
+
+Usage:
+    from numpy_ingest import add_embeddings, get_embeddings, load_embeddings
+
+    vectors = load_embeddings("vectors.npy")  # memory-mapped, read-only
+    add_embeddings(collection, ids, vectors)
+    ids, matrix = get_embeddings(collection, ids=ids[:100])
+
+Run the list vs NumPy benchmark (each path runs in its own process so peak
+RSS is measured independently):
+    python numpy_ingest.py --rows 100000 --dim 1536
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Sequence
+
+import chromadb
+import numpy as np
+
+
+def as_float32_matrix(embeddings: Any) -> np.ndarray:
+    """Return `embeddings` as a C-contiguous float32 2-D array, copying only if needed."""
+
+    matrix = np.ascontiguousarray(embeddings, dtype=np.float32)
+    if matrix.ndim != 2:
+        raise ValueError(f"expected a 2-D embeddings array, got shape {matrix.shape}")
+    return matrix
+
+
+def load_embeddings(path: str) -> np.ndarray:
+    """Memory-map a float32 `.npy` file; pages are read lazily as chunks are sent."""
+
+    matrix = np.load(path, mmap_mode="r")
+    if matrix.dtype != np.float32 or matrix.ndim != 2:
+        raise ValueError(f"{path}: expected a 2-D float32 array, got {matrix.dtype} {matrix.shape}")
+    return matrix
+
+
+def _write_embeddings(
+    collection: Any,
+    method: str,
+    ids: Sequence[str],
+    embeddings: Any,
+    documents: Sequence[str] | None,
+    metadatas: Sequence[dict[str, Any]] | None,
+    batch_size: int,
+) -> None:
+    matrix = as_float32_matrix(embeddings)
+    if len(ids) != matrix.shape[0]:
+        raise ValueError(f"got {len(ids)} ids for {matrix.shape[0]} embeddings")
+
+    write = getattr(collection, method)
+    for start in range(0, len(ids), batch_size):
+        end = min(start + batch_size, len(ids))
+        write(
+            ids=list(ids[start:end]),
+            # Slicing a (memory-mapped) array is a view; only this chunk is paged in.
+            embeddings=np.ascontiguousarray(matrix[start:end], dtype=np.float32),
+            documents=list(documents[start:end]) if documents is not None else None,
+            metadatas=list(metadatas[start:end]) if metadatas is not None else None,
+        )
+
+
+def add_embeddings(
+    collection: Any,
+    ids: Sequence[str],
+    embeddings: Any,
+    documents: Sequence[str] | None = None,
+    metadatas: Sequence[dict[str, Any]] | None = None,
+    batch_size: int = 1000,
+) -> None:
+    """`collection.add()` for an (n, dim) float32 array, in chunks of `batch_size` rows.
+
+    `batch_size` must not exceed `client.get_max_batch_size()`.
+    """
+
+    _write_embeddings(collection, "add", ids, embeddings, documents, metadatas, batch_size)
+
+
+def upsert_embeddings(
+    collection: Any,
+    ids: Sequence[str],
+    embeddings: Any,
+    documents: Sequence[str] | None = None,
+    metadatas: Sequence[dict[str, Any]] | None = None,
+    batch_size: int = 1000,
+) -> None:
+    """`collection.upsert()` for an (n, dim) float32 array, in chunks of `batch_size` rows."""
+
+    _write_embeddings(collection, "upsert", ids, embeddings, documents, metadatas, batch_size)
+
+
+def get_embeddings(collection: Any, **get_kwargs: Any) -> tuple[list[str], np.ndarray]:
+    """`collection.get(include=["embeddings"])` returning the IDs and an (n, dim) float32 array."""
+
+    result = collection.get(include=["embeddings"], **get_kwargs)
+    embeddings = result["embeddings"]
+    if embeddings is None or len(embeddings) == 0:
+        return result["ids"], np.empty((0, 0), dtype=np.float32)
+    return result["ids"], as_float32_matrix(embeddings)
+
+
+def query_embeddings(
+    collection: Any, queries: Any, n_results: int = 10, **query_kwargs: Any
+) -> tuple[list[list[str]], np.ndarray]:
+    """`collection.query()` for an (q, dim) array, returning IDs and a (q, k) distance array.
+
+    Distances are padded with `inf` when a query returns fewer than `n_results`.
+    """
+
+    result = collection.query(
+        query_embeddings=as_float32_matrix(queries),
+        n_results=n_results,
+        include=["distances"],
+        **query_kwargs,
+    )
+    distances = np.full((len(result["ids"]), n_results), np.inf, dtype=np.float32)
+    for row, values in enumerate(result["distances"]):
+        distances[row, : len(values)] = values
+    return result["ids"], distances
+
+
+def _run_path(mode: str, rows: int, npy_path: str) -> dict[str, Any]:
+    client = chromadb.EphemeralClient()
+    collection = client.create_collection(f"numpy_bench_{mode}", embedding_function=None)
+    ids = [f"rec-{i:08d}" for i in range(rows)]
+    batch_size = client.get_max_batch_size()
+
+    vectors = load_embeddings(npy_path)
+    if mode == "list":
+        # Both paths ingest the same `.npy` data; only the `add()` calls are timed, not
+        # building each batch's nested lists, which stands in for data the caller already holds.
+        add_secs = 0.0
+        for start in range(0, rows, batch_size):
+            end = min(start + batch_size, rows)
+            batch = vectors[start:end].tolist()
+            started = time.perf_counter()
+            collection.add(ids=ids[start:end], embeddings=batch)
+            add_secs += time.perf_counter() - started
+            del batch
+    else:
+        started = time.perf_counter()
+        add_embeddings(collection, ids, vectors, batch_size=batch_size)
+        add_secs = time.perf_counter() - started
+
+    started = time.perf_counter()
+    for start in range(0, rows, batch_size):
+        chunk = ids[start : start + batch_size]
+        if mode == "list":
+            result = collection.get(ids=chunk, include=["embeddings"])
+            vectors = [[float(v) for v in row] for row in result["embeddings"]]
+        else:
+            _, vectors = get_embeddings(collection, ids=chunk)
+        del vectors
+    get_secs = time.perf_counter() - started
+
+    return {
+        "mode": mode,
+        "add_rows_per_sec": rows / add_secs,
+        "get_rows_per_sec": rows / get_secs,
+        # ru_maxrss is reported in KiB on Linux.
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Compare list-based and NumPy ingestion.")
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--mode", choices=["list", "numpy"], help=argparse.SUPPRESS)
+    parser.add_argument("--npy", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        print(json.dumps(_run_path(args.mode, args.rows, args.npy)))
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        npy_path = os.path.join(tmp, "vectors.npy")
+        vectors = np.lib.format.open_memmap(
+            npy_path, mode="w+", dtype=np.float32, shape=(args.rows, args.dim)
+        )
+        rng = np.random.default_rng(0)
+        for start in range(0, args.rows, 10_000):
+            end = min(start + 10_000, args.rows)
+            vectors[start:end] = rng.random((end - start, args.dim), dtype=np.float32)
+        vectors.flush()
+        del vectors
+
+        for mode in ("list", "numpy"):
+            out = subprocess.run(
+                [sys.executable, __file__, "--mode", mode, "--rows", str(args.rows),
+                 "--dim", str(args.dim), "--npy", npy_path],
+                check=True,
+                capture_output=True,
+                text=True,
+            )
+            stats = json.loads(out.stdout.strip().splitlines()[-1])
+            print(
+                f"{mode:>5}: add={stats['add_rows_per_sec']:,.0f} rows/s "
+                f"get={stats['get_rows_per_sec']:,.0f} rows/s "
+                f"peak_rss={stats['peak_rss_mb']:,.0f} MB"
+            )
+
+    client = chromadb.EphemeralClient()
+    collection = client.create_collection("numpy_roundtrip", embedding_function=None)
+    matrix = np.random.default_rng(1).random((50, 8), dtype=np.float32)
+    upsert_embeddings(collection, [f"id-{i}" for i in range(50)], matrix)
+    ids, fetched = get_embeddings(collection, ids=["id-3", "id-7"])
+    order = [int(i.split("-")[1]) for i in ids]
+    if fetched.dtype != np.float32 or not np.array_equal(fetched, matrix[order]):
+        raise AssertionError("round-tripped embeddings differ")
+    top_ids, distances = query_embeddings(collection, matrix[:2], n_results=1)
+    if [row[0] for row in top_ids] != ["id-0", "id-1"] or distances.shape != (2, 1):
+        raise AssertionError(f"unexpected query result: {top_ids} {distances}")
+
+    print("\npython: numpy ingestion example passed")
+
+
+if __name__ == "__main__":
+    main()
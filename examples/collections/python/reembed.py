@@ -0,0 +1,309 @@
+"""Re-embed a collection through a persistent content-hash embedding cache.
+
+The "Change Embedding Function" loop in `collection_examples.py` embeds every
+document again, a few rows at a time and one call after another. Re-running a
+migration, or migrating a collection with many duplicate documents, pays for
+every embedding again. This helper:
+
+1. keeps a local SQLite cache of embeddings keyed by (model id, SHA-256 of the
+   text), evicting least recently used entries once a size budget is exceeded;
+2. embeds each distinct text of a batch only once;
+3. calls the embedding function for several batches concurrently.
+
+Usage:
+    from reembed import EmbeddingCache, reembed_collection
+
+    cache = EmbeddingCache("embedding_cache.sqlite", max_bytes=2_000_000_000)
+    stats = reembed_collection(src, dst, openai_ef, "openai/text-embedding-3-small", cache)
+    print(stats)
+
+Run the offline demo (deterministic fake embedding function, no API key):
+    python reembed.py --size 20000
+"""
+
+from __future__ import annotations
+
+import argparse
+import hashlib
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from array import array
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Callable, Sequence
+
+import chromadb
+
+from collection_iterator import iter_collection
+
+EmbeddingFunction = Callable[[list[str]], Sequence[Sequence[float]]]
+
+
+def content_hash(text: str) -> bytes:
+    return hashlib.sha256(text.encode()).digest()
+
+
+class EmbeddingCache:
+    """Persistent (model id, content hash) -> embedding cache with LRU size eviction."""
+
+    def __init__(self, path: str, max_bytes: int = 1_000_000_000) -> None:
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.executescript(
+            """
+            PRAGMA journal_mode=WAL;
+            CREATE TABLE IF NOT EXISTS embeddings (
+                model TEXT NOT NULL,
+                hash BLOB NOT NULL,
+                vector BLOB NOT NULL,
+                last_used REAL NOT NULL,
+                PRIMARY KEY (model, hash)
+            );
+            CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used);
+            """
+        )
+        self._size = self._conn.execute(
+            "SELECT COALESCE(SUM(LENGTH(vector)), 0) FROM embeddings"
+        ).fetchone()[0]
+
+    @property
+    def size_bytes(self) -> int:
+        return self._size
+
+    def get_many(self, model: str, hashes: Sequence[bytes]) -> dict[bytes, list[float]]:
+        found: dict[bytes, list[float]] = {}
+        now = time.time()
+        with self._lock:
+            # Stay well below SQLite's bound-parameter limit.
+            for i in range(0, len(hashes), 500):
+                chunk = list(hashes[i : i + 500])
+                marks = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT hash, vector FROM embeddings WHERE model = ? AND hash IN ({marks})",
+                    [model, *chunk],
+                ).fetchall()
+                for digest, blob in rows:
+                    found[digest] = array("f", blob).tolist()
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE model = ? AND hash = ?",
+                    [(now, model, digest) for digest, _ in rows],
+                )
+            self._conn.commit()
+        return found
+
+    def put_many(self, model: str, items: dict[bytes, Sequence[float]]) -> None:
+        now = time.time()
+        rows = [(model, digest, array("f", vector).tobytes(), now) for digest, vector in items.items()]
+        with self._lock:
+            for row in rows:
+                inserted = self._conn.execute(
+                    "INSERT OR IGNORE INTO embeddings (model, hash, vector, last_used) "
+                    "VALUES (?, ?, ?, ?)",
+                    row,
+                ).rowcount
+                self._size += len(row[2]) if inserted else 0
+            if self._size > self.max_bytes:
+                self._evict()
+            self._conn.commit()
+
+    def _evict(self) -> None:
+        # Drop least recently used entries until 90% of the budget is free.
+        target = int(self.max_bytes * 0.9)
+        cursor = self._conn.execute(
+            "SELECT rowid, LENGTH(vector) FROM embeddings ORDER BY last_used"
+        )
+        doomed: list[tuple[int]] = []
+        for rowid, size in cursor:
+            if self._size <= target:
+                break
+            doomed.append((rowid,))
+            self._size -= size
+        self._conn.executemany("DELETE FROM embeddings WHERE rowid = ?", doomed)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+@dataclass
+class ReembedStats:
+    """Cache and throughput counters of a re-embedding run."""
+
+    records: int = 0
+    unique_texts: int = 0
+    cache_hits: int = 0
+    embedded: int = 0
+    skipped: int = 0
+    started: float = field(default_factory=time.perf_counter)
+
+    @property
+    def hit_rate(self) -> float:
+        return self.cache_hits / self.unique_texts if self.unique_texts else 0.0
+
+    @property
+    def records_per_sec(self) -> float:
+        elapsed = time.perf_counter() - self.started
+        return self.records / elapsed if elapsed else 0.0
+
+    def __str__(self) -> str:
+        return (
+            f"records={self.records} unique={self.unique_texts} hits={self.cache_hits} "
+            f"embedded={self.embedded} skipped={self.skipped} hit_rate={self.hit_rate:.1%} "
+            f"rate={self.records_per_sec:,.0f} records/s"
+        )
+
+
+def embed_with_cache(
+    texts: Sequence[str],
+    embedding_function: EmbeddingFunction,
+    model_id: str,
+    cache: EmbeddingCache,
+    stats: ReembedStats | None = None,
+) -> list[list[float]]:
+    """Embed `texts`, computing each distinct uncached text exactly once."""
+
+    hashes = [content_hash(text) for text in texts]
+    unique: dict[bytes, str] = dict(zip(hashes, texts))
+    vectors = cache.get_many(model_id, list(unique))
+    misses = [digest for digest in unique if digest not in vectors]
+    if misses:
+        fresh = embedding_function([unique[digest] for digest in misses])
+        computed = {digest: list(map(float, vector)) for digest, vector in zip(misses, fresh)}
+        cache.put_many(model_id, computed)
+        vectors.update(computed)
+    if stats is not None:
+        stats.records += len(texts)
+        stats.unique_texts += len(unique)
+        stats.cache_hits += len(unique) - len(misses)
+        stats.embedded += len(misses)
+    return [vectors[digest] for digest in hashes]
+
+
+def reembed_collection(
+    source: Any,
+    destination: Any,
+    embedding_function: EmbeddingFunction,
+    model_id: str,
+    cache: EmbeddingCache,
+    batch_size: int = 100,
+    workers: int = 4,
+) -> ReembedStats:
+    """Copy `source` into `destination`, re-embedding documents with `embedding_function`.
+
+    `model_id` must change whenever the model (or its settings) changes, since
+    it scopes the cache. Up to `workers` batches are embedded and written
+    concurrently. Records without a document have nothing to re-embed, so
+    they are not copied; they are counted in `skipped`.
+    """
+
+    stats = ReembedStats()
+    lock = threading.Lock()
+
+    def process(batch: dict[str, Any]) -> None:
+        batch_stats = ReembedStats()
+        rows = [i for i, document in enumerate(batch["documents"]) if document is not None]
+        batch_stats.skipped = len(batch["ids"]) - len(rows)
+        if rows:
+            documents = [batch["documents"][i] for i in rows]
+            embeddings = embed_with_cache(documents, embedding_function, model_id, cache, batch_stats)
+            destination.upsert(
+                ids=[batch["ids"][i] for i in rows],
+                documents=documents,
+                metadatas=[batch["metadatas"][i] for i in rows],
+                embeddings=embeddings,
+            )
+        with lock:
+            stats.records += batch_stats.records
+            stats.unique_texts += batch_stats.unique_texts
+            stats.cache_hits += batch_stats.cache_hits
+            stats.embedded += batch_stats.embedded
+            stats.skipped += batch_stats.skipped
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="reembed") as pool:
+        in_flight: deque[Future[None]] = deque()
+        for batch in iter_collection(source, batch_size, ["documents", "metadatas"]):
+            if len(in_flight) >= workers * 2:
+                in_flight.popleft().result()
+            in_flight.append(pool.submit(process, batch))
+        for future in in_flight:
+            future.result()
+    return stats
+
+
+class FakeEmbeddingFunction:
+    """Deterministic offline embedding function with a simulated per-call latency."""
+
+    def __init__(self, dim: int = 64, latency: float = 0.02) -> None:
+        self.dim = dim
+        self.latency = latency
+        self.calls = 0
+        self.texts = 0
+
+    def __call__(self, input: list[str]) -> list[list[float]]:
+        self.calls += 1
+        self.texts += len(input)
+        time.sleep(self.latency)
+        out = []
+        for text in input:
+            digest = hashlib.sha256(text.encode()).digest()
+            out.append([digest[i % len(digest)] / 255.0 for i in range(self.dim)])
+        return out
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Offline re-embedding cache demo.")
+    parser.add_argument("--size", type=int, default=20_000)
+    parser.add_argument("--distinct", type=int, default=5_000, help="distinct document texts")
+    args = parser.parse_args()
+
+    client = chromadb.EphemeralClient()
+    for name in ("reembed_src", "reembed_dst"):
+        try:
+            client.delete_collection(name)
+        except Exception:
+            pass
+    source = client.create_collection("reembed_src", embedding_function=None)
+    max_batch_size = client.get_max_batch_size()
+    for start in range(0, args.size, max_batch_size):
+        end = min(start + max_batch_size, args.size)
+        source.add(
+            ids=[f"rec-{i:08d}" for i in range(start, end)],
+            documents=[f"document {i // 4 % args.distinct}" for i in range(start, end)],
+            metadatas=[{"n": i} for i in range(start, end)],
+            embeddings=[[float(i), 0.0, 1.0] for i in range(start, end)],
+        )
+    source.add(ids=["rec-no-text"], metadatas=[{"n": -1}], embeddings=[[0.0, 0.0, 1.0]])
+    distinct_texts = len({i // 4 % args.distinct for i in range(args.size)})
+
+    fake_ef = FakeEmbeddingFunction()
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = EmbeddingCache(os.path.join(tmp, "embeddings.sqlite"))
+        for run in ("cold", "warm"):
+            try:
+                client.delete_collection("reembed_dst")
+            except Exception:
+                pass
+            destination = client.create_collection("reembed_dst", embedding_function=None)
+            stats = reembed_collection(source, destination, fake_ef, "fake/dim-64", cache)
+            print(f"{run}: {stats} ef_texts={fake_ef.texts}")
+            if stats.skipped != 1 or destination.count() != args.size:
+                raise AssertionError(f"expected {args.size} records, got {destination.count()}")
+        cache.close()
+
+    if fake_ef.texts != distinct_texts:
+        raise AssertionError(f"expected {distinct_texts} embedded texts, got {fake_ef.texts}")
+    sample = destination.get(ids=["rec-00000000"], include=["embeddings"])
+    expected = fake_ef(["document 0"])[0]
+    if [round(float(v), 5) for v in sample["embeddings"][0]] != [round(v, 5) for v in expected]:
+        raise AssertionError("cached embedding differs from a fresh one")
+
+    print("\npython: re-embedding cache example passed")
+
+
+if __name__ == "__main__":
+    main()
@@ -10,24 +10,59 @@ If copied into your own project:
 
 import chromadb
 
+from query_cache import QueryCache
+from write_behind import WriteBehindBuffer
+
 
 class EmbeddedKnowledgeBase:
-    def __init__(self, path: str = "./chroma_data") -> None:
+    def __init__(self, path: str = "./chroma_data", write_behind: bool = False, query_cache: bool = False) -> None:
         self.client = chromadb.PersistentClient(path=path)
         self.collection = self.client.get_or_create_collection(
             name="support_kb",
             embedding_function=None,  # using explicit embeddings below
         )
+        # Opt-in group commit: add_article() buffers, a background thread upserts in batches.
+        max_batch_size = self.client.get_max_batch_size()
+        self.buffer = (
+            WriteBehindBuffer(self.collection, max_records=max_batch_size, max_batch_size=max_batch_size)
+            if write_behind
+            else None
+        )
+        # Opt-in result cache, invalidated by every add_article().
+        self.cache = QueryCache() if query_cache else None
 
     def add_article(self, article_id: str, text: str, embedding: list[float], product: str) -> None:
-        self.collection.upsert(
-            ids=[article_id],
-            documents=[text],
-            embeddings=[embedding],
-            metadatas=[{"product": product}],
-        )
+        if self.buffer is not None:
+            self.buffer.upsert(article_id, embedding, document=text, metadata={"product": product})
+        else:
+            self.collection.upsert(
+                ids=[article_id],
+                documents=[text],
+                embeddings=[embedding],
+                metadatas=[{"product": product}],
+            )
+        if self.cache is not None:
+            self.cache.bump(self.collection)  # after the write, so no query can cache its old result
+
+    def flush(self) -> None:
+        if self.buffer is not None:
+            self.buffer.flush()
+
+    def close(self) -> None:
+        if self.buffer is not None:
+            self.buffer.close()
 
     def search(self, query_embedding: list[float], product: str, n_results: int = 2) -> dict:
+        if self.cache is not None:
+            return self.cache.query(
+                self.collection,
+                query_embedding,
+                where={"product": product},
+                n_results=n_results,
+                include=["documents", "metadatas", "distances"],
+                on_miss=self.flush,
+            )
+        self.flush()  # read your own buffered writes
         return self.collection.query(
             query_embeddings=[query_embedding],
             where={"product": product},
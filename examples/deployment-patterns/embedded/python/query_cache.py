@@ -0,0 +1,260 @@
+"""In-process LRU/TTL cache for single-vector `query()` results.
+
+Support-bot traffic repeats the same questions, and every repeat pays for a
+full index search. `QueryCache` keeps results keyed by (collection, quantized
+query embedding, `where`, `where_document`, `n_results`, `include`) and
+evicts least-recently-used entries once `max_bytes` of results are held or an
+entry is older than `ttl` seconds.
+
+Invalidation uses a per-collection write generation: call `bump(collection)`
+after every write you make to it. Each entry remembers the generation it was
+read at (captured before the query runs), so an entry is never served once a
+write has been bumped, even if the write raced with the query that filled it.
+Writes made by other processes are not seen; with a shared server, `ttl`
+bounds how stale their effect can be.
+
+Usage:
+    from query_cache import QueryCache
+
+    cache = QueryCache(max_bytes=32 * 1024 * 1024, ttl=300)
+    result = cache.query(collection, embedding, n_results=2, where={"product": "billing"})
+    collection.upsert(...)
+    cache.bump(collection)          # after the write returns
+    print(cache.stats.hit_rate, cache.stats.saved_seconds)
+
+Cached results are shared between callers; treat them as read-only.
+
+Benchmark a repeating question workload through `EmbeddedKnowledgeBase.search`:
+    python query_cache.py --articles 20000 --searches 5000
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import pickle
+import shutil
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable, Sequence
+
+import numpy as np
+
+DEFAULT_INCLUDE = ("metadatas", "documents", "distances")
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    invalidated: int = 0
+    expired: int = 0
+    evicted: int = 0
+    saved_seconds: float = 0.0
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+
+@dataclass
+class _Entry:
+    generation: int
+    stored_at: float
+    cost: float
+    size: int
+    result: dict[str, Any]
+
+
+class QueryCache:
+    """Thread-safe result cache invalidated by per-collection write generations."""
+
+    def __init__(self, max_bytes: int = 32 * 1024 * 1024, ttl: float = 300.0, decimals: int = 4) -> None:
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.decimals = decimals
+        self.stats = CacheStats()
+        self.nbytes = 0
+        self._entries: OrderedDict[tuple, _Entry] = OrderedDict()
+        self._generations: dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    def generation(self, collection: Any) -> int:
+        with self._lock:
+            return self._generations.get(str(collection.id), 0)
+
+    def bump(self, collection: Any) -> None:
+        """Invalidate every cached result for `collection`; call after each write to it."""
+
+        with self._lock:
+            key = str(collection.id)
+            self._generations[key] = self._generations.get(key, 0) + 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
+
+    def _key(
+        self,
+        collection: Any,
+        query_embedding: Sequence[float],
+        n_results: int,
+        where: dict[str, Any] | None,
+        where_document: dict[str, Any] | None,
+        include: Sequence[str],
+    ) -> tuple:
+        quantized = np.round(np.asarray(query_embedding, dtype=np.float32), self.decimals) + 0.0  # -0.0 -> 0.0
+        return (
+            str(collection.id),
+            quantized.tobytes(),
+            n_results,
+            json.dumps(where, sort_keys=True),
+            json.dumps(where_document, sort_keys=True),
+            tuple(include),
+        )
+
+    def _drop(self, key: tuple) -> None:
+        self.nbytes -= self._entries.pop(key).size
+
+    def query(
+        self,
+        collection: Any,
+        query_embedding: Sequence[float],
+        n_results: int = 10,
+        where: dict[str, Any] | None = None,
+        where_document: dict[str, Any] | None = None,
+        include: Sequence[str] = DEFAULT_INCLUDE,
+        on_miss: Callable[[], None] | None = None,
+    ) -> dict[str, Any]:
+        """Cached one-vector `collection.query()`.
+
+        `on_miss` runs after the generation is captured and before the query,
+        e.g. to flush a write-behind buffer so the query sees buffered writes.
+        """
+
+        key = self._key(collection, query_embedding, n_results, where, where_document, include)
+        now = time.monotonic()
+        with self._lock:
+            generation = self._generations.get(key[0], 0)
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry.generation != generation:
+                    self.stats.invalidated += 1
+                    self._drop(key)
+                elif now - entry.stored_at > self.ttl:
+                    self.stats.expired += 1
+                    self._drop(key)
+                else:
+                    self._entries.move_to_end(key)
+                    self.stats.hits += 1
+                    self.stats.saved_seconds += entry.cost
+                    return entry.result
+            self.stats.misses += 1
+
+        if on_miss is not None:
+            on_miss()
+        started = time.perf_counter()
+        result = collection.query(
+            query_embeddings=[query_embedding],
+            n_results=n_results,
+            where=where,
+            where_document=where_document,
+            include=list(include),
+        )
+        cost = time.perf_counter() - started
+        size = len(pickle.dumps(result, protocol=pickle.HIGHEST_PROTOCOL))
+        if size > self.max_bytes:
+            return result
+
+        with self._lock:
+            # A write bumped during the query makes this result stale: don't keep it.
+            if self._generations.get(key[0], 0) != generation:
+                return result
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = _Entry(generation, now, cost, size, result)
+            self.nbytes += size
+            while self.nbytes > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+                self.stats.evicted += 1
+        return result
+
+
+def main() -> None:
+    from app_embedded import EmbeddedKnowledgeBase
+
+    parser = argparse.ArgumentParser(description="Benchmark cached and uncached knowledge-base searches.")
+    parser.add_argument("--articles", type=int, default=20_000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--questions", type=int, default=500, help="distinct questions in the workload")
+    parser.add_argument("--searches", type=int, default=5_000)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    products = ["billing", "platform", "security"]
+    questions = rng.random((args.questions, args.dim), dtype=np.float32).tolist()
+    # Zipf-like popularity: a few questions make up most of the traffic.
+    weights = 1.0 / np.arange(1, args.questions + 1)
+    workload = rng.choice(args.questions, size=args.searches, p=weights / weights.sum())
+
+    path = tempfile.mkdtemp(prefix="kb-query-cache-")
+    try:
+        plain = EmbeddedKnowledgeBase(path=path)
+        batch_size = plain.client.get_max_batch_size()
+        for start in range(0, args.articles, batch_size):
+            end = min(start + batch_size, args.articles)
+            plain.collection.add(
+                ids=[f"a{i}" for i in range(start, end)],
+                embeddings=rng.random((end - start, args.dim), dtype=np.float32),
+                documents=[f"article {i}" for i in range(start, end)],
+                metadatas=[{"product": products[i % 3]} for i in range(start, end)],
+            )
+        cached = EmbeddedKnowledgeBase(path=path, query_cache=True)
+
+        timings = {}
+        for name, kb in (("uncached", plain), ("cached", cached)):
+            latencies = []
+            for q in workload:
+                started = time.perf_counter()
+                result = kb.search(questions[q], product=products[q % 3], n_results=5)
+                latencies.append(time.perf_counter() - started)
+            timings[name] = np.asarray(latencies) * 1000
+            if name == "uncached":
+                expected = result["ids"]
+            elif result["ids"] != expected:
+                raise AssertionError("cached result differs from an uncached search")
+
+        # A write must be visible to the very next search, cached or not.
+        q = int(workload[-1])
+        cached.add_article("fresh", "brand new article", questions[q], products[q % 3])
+        if cached.search(questions[q], product=products[q % 3], n_results=5)["ids"][0][0] != "fresh":
+            raise AssertionError("cache served a result from before the write")
+
+        for name, latencies in timings.items():
+            print(
+                f"{name:<9} mean={latencies.mean():7.3f}ms p50={np.percentile(latencies, 50):7.3f}ms "
+                f"p99={np.percentile(latencies, 99):7.3f}ms"
+            )
+        stats = cached.cache.stats
+        print(
+            f"hit rate {stats.hit_rate:.1%}, {stats.saved_seconds:.2f}s of query time saved, "
+            f"{len(cached.cache)} entries / {cached.cache.nbytes / 1024:.0f} KiB, "
+            f"{stats.invalidated} invalidated"
+        )
+    finally:
+        shutil.rmtree(path, ignore_errors=True)
+
+    print("\npython: query cache example passed")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,325 @@
+"""Write-behind group commit for single-record upserts.
+
+`EmbeddedKnowledgeBase.add_article()` upserts one article per call, and each
+call is its own SQLite transaction and WAL write. `WriteBehindBuffer` collects
+upserts in memory and writes them as one `upsert()` when any limit is hit:
+
+- `max_records` buffered records (capped at `max_batch_size`, normally
+  `client.get_max_batch_size()`),
+- `max_bytes` of buffered embeddings, documents and metadata,
+- `max_delay` seconds since the oldest buffered record.
+
+A later upsert of an ID that is still buffered replaces the earlier one, so
+only the last write per ID reaches Chroma. When `max_pending` records are
+buffered, `upsert()` blocks until the background writer catches up
+(backpressure). `flush()` returns once everything buffered so far is written;
+`close()` flushes and stops the writer. A failed write is raised from the
+next `upsert()` / `flush()` and its records stay buffered for a retry.
+
+Usage:
+    from write_behind import WriteBehindBuffer
+
+    buffer = WriteBehindBuffer(collection, max_batch_size=client.get_max_batch_size())
+    buffer.upsert("a1", embedding, document="...", metadata={"product": "billing"})
+    buffer.flush()   # durable from here on
+    buffer.close()
+
+Compare upserts/s of the buffered and per-call paths of `EmbeddedKnowledgeBase`:
+    python write_behind.py --articles 5000
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import shutil
+import tempfile
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Sequence
+
+import chromadb
+import numpy as np
+
+
+@dataclass
+class _Record:
+    embedding: Sequence[float]
+    document: str | None
+    metadata: dict[str, Any] | None
+    size: int
+
+
+class WriteBehindBuffer:
+    """Buffers upserts for one collection and writes them in batches from a background thread."""
+
+    def __init__(
+        self,
+        collection: Any,
+        max_records: int = 1000,
+        max_bytes: int = 8 * 1024 * 1024,
+        max_delay: float = 0.05,
+        max_pending: int | None = None,
+        max_batch_size: int | None = None,
+    ) -> None:
+        self.collection = collection
+        self.max_records = min(max_records, max_batch_size) if max_batch_size else max_records
+        self.max_bytes = max_bytes
+        self.max_delay = max_delay
+        self.max_pending = max_pending or 4 * self.max_records
+        self.written = 0
+        self.batches = 0
+        self._pending: dict[str, _Record] = {}
+        self._bytes = 0
+        self._oldest: float | None = None
+        self._error: BaseException | None = None
+        self._closed = False
+        self._cond = threading.Condition()
+        # Held while a batch is taken and written, so batches reach Chroma in order.
+        self._write_lock = threading.Lock()
+        self._writer = threading.Thread(target=self._run, daemon=True)
+        self._writer.start()
+
+    def __enter__(self) -> WriteBehindBuffer:
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.close()
+
+    def __len__(self) -> int:
+        with self._cond:
+            return len(self._pending)
+
+    def _raise_error(self) -> None:
+        if self._error is not None:
+            error, self._error = self._error, None
+            self._cond.notify_all()  # the writer resumes with the re-buffered records
+            raise RuntimeError("buffered upsert failed; records are still buffered") from error
+
+    def _full(self) -> bool:
+        return len(self._pending) >= self.max_records or self._bytes >= self.max_bytes
+
+    def upsert(
+        self,
+        record_id: str,
+        embedding: Sequence[float],
+        document: str | None = None,
+        metadata: dict[str, Any] | None = None,
+    ) -> None:
+        """Buffer one upsert, blocking while `max_pending` records are already buffered."""
+
+        size = 4 * len(embedding) + len((document or "").encode()) + len(json.dumps(metadata or {}))
+        with self._cond:
+            while len(self._pending) >= self.max_pending and record_id not in self._pending:
+                self._raise_error()
+                if self._closed:
+                    break
+                self._cond.wait()
+            self._raise_error()
+            if self._closed:
+                raise RuntimeError("WriteBehindBuffer is closed")
+            previous = self._pending.pop(record_id, None)
+            if previous is not None:
+                self._bytes -= previous.size
+            self._pending[record_id] = _Record(embedding, document, metadata, size)
+            self._bytes += size
+            if self._oldest is None:
+                self._oldest = time.monotonic()
+            self._cond.notify_all()
+
+    def _take(self) -> dict[str, _Record]:
+        """Remove up to `max_records` buffered records (caller holds `_cond`)."""
+
+        ids = list(self._pending)[: self.max_records]
+        batch = {record_id: self._pending.pop(record_id) for record_id in ids}
+        self._bytes -= sum(r.size for r in batch.values())
+        self._oldest = time.monotonic() if self._pending else None
+        self._cond.notify_all()
+        return batch
+
+    def _write(self, batch: dict[str, _Record], background: bool = False) -> None:
+        """Upsert `batch` (caller holds `_write_lock`); on failure put it back.
+
+        A background failure is recorded for the next `upsert()` / `flush()` in
+        the same critical section, so no waiter can miss it.
+        """
+
+        records = list(batch.values())
+        documents = [r.document for r in records]
+        metadatas = [r.metadata for r in records]
+        try:
+            self.collection.upsert(
+                ids=list(batch),
+                embeddings=np.asarray([r.embedding for r in records], dtype=np.float32),
+                documents=documents if any(d is not None for d in documents) else None,
+                metadatas=metadatas if any(m is not None for m in metadatas) else None,
+            )
+        except BaseException as exc:
+            with self._cond:
+                for record_id, record in batch.items():
+                    if record_id not in self._pending:  # a newer write wins
+                        self._pending[record_id] = record
+                        self._bytes += record.size
+                if self._oldest is None:
+                    self._oldest = time.monotonic()
+                if background:
+                    self._error = exc
+                self._cond.notify_all()  # wakes producers blocked on a full buffer
+            raise
+        with self._cond:
+            self.written += len(batch)
+            self.batches += 1
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while not self._closed:
+                    if self._error is None and self._pending:
+                        if self._full():
+                            break
+                        wait = self._oldest + self.max_delay - time.monotonic()
+                        if wait <= 0:
+                            break
+                        self._cond.wait(wait)
+                    else:
+                        self._cond.wait()
+                if self._closed:
+                    return
+            with self._write_lock:
+                with self._cond:
+                    batch = self._take()
+                if batch:
+                    try:
+                        self._write(batch, background=True)
+                    except BaseException:
+                        pass  # surfaced to the next upsert()/flush()
+
+    def flush(self) -> None:
+        """Write everything buffered so far; raises if a write failed.
+
+        A failure of a write made by `flush()` itself is raised directly, and
+        the next `flush()` retries it.
+        """
+
+        with self._write_lock:
+            while True:
+                with self._cond:
+                    self._raise_error()
+                    batch = self._take()
+                if not batch:
+                    return
+                self._write(batch)
+
+    def close(self) -> None:
+        """Flush and stop the background writer."""
+
+        try:
+            self.flush()
+        finally:
+            with self._cond:
+                self._closed = True
+                self._cond.notify_all()
+            self._writer.join()
+
+
+def main() -> None:
+    from app_embedded import EmbeddedKnowledgeBase
+
+    parser = argparse.ArgumentParser(description="Compare buffered and per-call article upserts.")
+    parser.add_argument("--articles", type=int, default=5_000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--threads", type=int, default=4)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    embeddings = rng.random((args.articles, args.dim), dtype=np.float32).tolist()
+    # Every tenth write re-upserts an earlier article, which the buffer coalesces.
+    article_ids = [f"a{i if i % 10 else i // 2}" for i in range(args.articles)]
+    products = ["billing", "platform", "security"]
+
+    for write_behind in (False, True):
+        path = tempfile.mkdtemp(prefix="kb-write-behind-")
+        try:
+            kb = EmbeddedKnowledgeBase(path=path, write_behind=write_behind)
+
+            def writer(offset: int) -> None:
+                for i in range(offset, args.articles, args.threads):
+                    kb.add_article(article_ids[i], f"article {i}", embeddings[i], products[i % 3])
+
+            started = time.perf_counter()
+            threads = [threading.Thread(target=writer, args=(t,)) for t in range(args.threads)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            kb.flush()
+            elapsed = time.perf_counter() - started
+
+            expected = len(set(article_ids))
+            if kb.collection.count() != expected:
+                raise AssertionError(f"expected {expected} articles, found {kb.collection.count()}")
+            label = "write-behind" if write_behind else "per-call"
+            extra = ""
+            if kb.buffer is not None:
+                extra = f" ({kb.buffer.batches} batches, {args.articles - kb.buffer.written} writes coalesced)"
+            print(f"{label:<12} {args.articles / elapsed:10,.0f} upserts/s{extra}")
+            kb.close()
+        finally:
+            shutil.rmtree(path, ignore_errors=True)
+
+    _check_failed_write_recovers()
+    print("\npython: write-behind example passed")
+
+
+class _FlakyCollection:
+    """Collection wrapper whose first `upsert()` fails."""
+
+    def __init__(self, collection: Any) -> None:
+        self.collection = collection
+        self.failures = 1
+
+    def upsert(self, **kwargs: Any) -> None:
+        if self.failures:
+            self.failures -= 1
+            time.sleep(0.2)  # let the producer fill the buffer and block on it
+            raise OSError("simulated write failure")
+        self.collection.upsert(**kwargs)
+
+
+def _check_failed_write_recovers() -> None:
+    """A failed background write must wake a blocked producer and be retried once surfaced."""
+
+    path = tempfile.mkdtemp(prefix="kb-write-behind-")
+    try:
+        client = chromadb.PersistentClient(path=path)
+        collection = client.create_collection("write_behind_retry", embedding_function=None)
+        buffer = WriteBehindBuffer(
+            _FlakyCollection(collection), max_records=10, max_pending=10, max_batch_size=client.get_max_batch_size()
+        )
+        errors: list[BaseException] = []
+
+        def producer() -> None:
+            for i in range(30):
+                while True:
+                    try:
+                        buffer.upsert(f"r{i}", [float(i), 1.0])
+                        break
+                    except RuntimeError as exc:  # the failed batch is still buffered; keep going
+                        errors.append(exc)
+
+        thread = threading.Thread(target=producer, daemon=True)
+        thread.start()
+        thread.join(timeout=10)
+        if thread.is_alive():
+            raise AssertionError(f"producer stuck after a failed write ({len(buffer)} records pending)")
+        buffer.close()
+        if len(errors) != 1 or collection.count() != 30:
+            raise AssertionError(f"expected 1 surfaced error and 30 records, got {len(errors)} / {collection.count()}")
+        print("failed write: surfaced once, retried, all 30 records written")
+    finally:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
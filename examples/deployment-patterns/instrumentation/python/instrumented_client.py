@@ -0,0 +1,453 @@
+"""Per-call latency instrumentation for Chroma clients and collections.
+
+When p99 spikes, a single end-to-end timer cannot tell whether the time went
+to embedding, serialization, the network or the server. `InstrumentedClient`
+wraps any Chroma client (`PersistentClient`, `EphemeralClient`, `HttpClient`);
+the collections it returns time every `add` / `upsert` / `get` / `query` and
+split the call into phases:
+
+- `embed`     - the collection's embedding function (`query_texts`, `documents`),
+- `build`     - validation and request serialization before the first byte is sent,
+- `transport` - request sent until response headers arrive (network + server),
+- `decode`    - response body read, JSON decode and result construction.
+
+`transport` and `decode` come from httpx event hooks on `HttpClient`'s
+session. Embedded clients have no transport, so their remaining time is
+recorded as `execute`. Every phase and the `total` go into HDR-style
+log-linear histograms (fixed relative error, O(1) record) per collection,
+operation and phase; sinks export them as Prometheus text, OpenTelemetry
+observable gauges or JSON.
+
+Usage:
+    from instrumented_client import InstrumentedClient, JSONSink, PrometheusTextSink
+
+    client = InstrumentedClient(chromadb.HttpClient(host="localhost", port=8000))
+    kb = client.get_or_create_collection("support_kb", embedding_function=None)
+    kb.query(query_embeddings=[[0.10, 0.21, 0.29]], n_results=1)
+    print(PrometheusTextSink().render(client.metrics))
+    JSONSink("latency.json").export(client.metrics)
+
+Measure wrapper overhead and show a phase breakdown (EphemeralClient, or the
+server from CHROMA_HOST/CHROMA_PORT/CHROMA_SSL with --http):
+    python instrumented_client.py
+    python instrumented_client.py --http
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable
+
+import chromadb
+import numpy as np
+
+PHASES = ("embed", "build", "transport", "decode", "execute", "total")
+OPERATIONS = ("add", "upsert", "get", "query")
+# Prometheus `le` bounds in seconds.
+PROMETHEUS_BUCKETS = (
+    0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+    0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)  # fmt: skip
+
+
+class LatencyHistogram:
+    """Log-linear histogram of nanosecond durations with relative error below 2**-precision.
+
+    Values below 2**precision ns get one bucket each; above that every power of
+    two is split into 2**precision sub-buckets, as in HdrHistogram. `record()`
+    takes no lock: it is a handful of integer operations under the GIL, and a
+    thread switch in the middle can at worst drop one sample, which is an
+    acceptable trade for monitoring data (a lock doubled the cost).
+    """
+
+    def __init__(self, precision: int = 5) -> None:
+        self.precision = precision
+        self._sub = 1 << precision
+        self.counts = [0] * (64 * self._sub)
+        self.sum = 0
+        self.max = 0
+
+    @property
+    def count(self) -> int:
+        return sum(self.counts)
+
+    def _index(self, value: int) -> int:
+        if value < self._sub:
+            return value
+        shift = value.bit_length() - self.precision - 1
+        return shift * self._sub + (value >> shift)
+
+    def _lowest(self, index: int) -> int:
+        if index < self._sub:
+            return index
+        shift = index // self._sub - 1
+        return (index % self._sub + self._sub) << shift
+
+    def record(self, ns: int) -> None:
+        if ns < self._sub:
+            index = max(ns, 0)
+        else:
+            shift = ns.bit_length() - self.precision - 1
+            index = shift * self._sub + (ns >> shift)
+        self.counts[index] += 1
+        self.sum += ns
+        if ns > self.max:
+            self.max = ns
+
+    def percentile(self, q: float) -> int:
+        """Upper bound (ns) of the bucket holding the q-th percentile."""
+
+        count = self.count
+        if not count:
+            return 0
+        target = max(1, int(np.ceil(count * q / 100)))
+        seen = 0
+        for index, n in enumerate(self.counts):
+            seen += n
+            if seen >= target:
+                return min(self._lowest(index + 1) - 1, self.max)
+        return self.max
+
+    def cumulative(self, bounds_ns: list[int]) -> list[int]:
+        """Counts of values <= each bound (bucket-resolution)."""
+
+        out = []
+        for bound in bounds_ns:
+            last = self._index(bound)
+            out.append(sum(self.counts[: last + 1]))
+        return out
+
+
+class ClientMetrics:
+    """Histograms keyed by (collection, operation, phase)."""
+
+    def __init__(self, precision: int = 5) -> None:
+        self.precision = precision
+        self.histograms: dict[tuple[str, str, str], LatencyHistogram] = {}
+        self._lock = threading.Lock()
+
+    def histogram(self, collection: str, operation: str, phase: str) -> LatencyHistogram:
+        key = (collection, operation, phase)
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            with self._lock:
+                histogram = self.histograms.setdefault(key, LatencyHistogram(self.precision))
+        return histogram
+
+    def snapshot(self) -> list[dict[str, Any]]:
+        rows = []
+        for (collection, operation, phase), h in sorted(self.histograms.items()):
+            count = h.count
+            if not count:
+                continue
+            rows.append(
+                {
+                    "collection": collection,
+                    "operation": operation,
+                    "phase": phase,
+                    "count": count,
+                    "mean_ms": h.sum / count / 1e6,
+                    "p50_ms": h.percentile(50) / 1e6,
+                    "p90_ms": h.percentile(90) / 1e6,
+                    "p99_ms": h.percentile(99) / 1e6,
+                    "p999_ms": h.percentile(99.9) / 1e6,
+                    "max_ms": h.max / 1e6,
+                }
+            )
+        return rows
+
+
+# ── Sinks ──
+
+
+class PrometheusTextSink:
+    """Renders histograms in the Prometheus text exposition format."""
+
+    def __init__(self, path: str | None = None, name: str = "chroma_client_latency_seconds") -> None:
+        self.path = path
+        self.name = name
+
+    def render(self, metrics: ClientMetrics) -> str:
+        bounds_ns = [int(b * 1e9) for b in PROMETHEUS_BUCKETS]
+        lines = [
+            f"# HELP {self.name} Chroma client call latency by phase.",
+            f"# TYPE {self.name} histogram",
+        ]
+        for (collection, operation, phase), h in sorted(metrics.histograms.items()):
+            if not h.count:
+                continue
+            labels = f'collection="{collection}",operation="{operation}",phase="{phase}"'
+            count = h.count
+            for bound, n in zip(PROMETHEUS_BUCKETS, h.cumulative(bounds_ns)):
+                lines.append(f'{self.name}_bucket{{{labels},le="{bound}"}} {n}')
+            lines.append(f'{self.name}_bucket{{{labels},le="+Inf"}} {count}')
+            lines.append(f"{self.name}_sum{{{labels}}} {h.sum / 1e9}")
+            lines.append(f"{self.name}_count{{{labels}}} {count}")
+        return "\n".join(lines) + "\n"
+
+    def export(self, metrics: ClientMetrics) -> None:
+        """Write the text file atomically (for node_exporter's textfile collector)."""
+
+        if self.path is None:
+            raise ValueError("PrometheusTextSink needs a path to export; use render() otherwise")
+        tmp = Path(self.path + ".tmp")
+        tmp.write_text(self.render(metrics))
+        os.replace(tmp, self.path)
+
+
+class JSONSink:
+    """Writes `ClientMetrics.snapshot()` as JSON."""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+
+    def export(self, metrics: ClientMetrics) -> None:
+        tmp = Path(self.path + ".tmp")
+        tmp.write_text(json.dumps(metrics.snapshot(), indent=2))
+        os.replace(tmp, self.path)
+
+
+class OpenTelemetrySink:
+    """Publishes percentiles as OpenTelemetry observable gauges, read on each collection cycle.
+
+    Requires `opentelemetry-api` (installed with chromadb); configure a
+    `MeterProvider` with your exporter as usual.
+    """
+
+    def __init__(self, meter: Any = None, percentiles: tuple[float, ...] = (50, 90, 99, 99.9)) -> None:
+        try:
+            from opentelemetry import metrics as otel_metrics
+        except ImportError as exc:
+            raise ImportError("OpenTelemetrySink requires opentelemetry-api: pip install opentelemetry-api") from exc
+        self._otel = otel_metrics
+        self.meter = meter or otel_metrics.get_meter("chroma.client")
+        self.percentiles = percentiles
+        self._metrics: ClientMetrics | None = None
+        self._registered = False
+
+    def _observe(self, options: Any) -> list[Any]:
+        observations = []
+        for (collection, operation, phase), h in list(self._metrics.histograms.items()):
+            if not h.count:
+                continue
+            for q in self.percentiles:
+                attributes = {"collection": collection, "operation": operation, "phase": phase, "quantile": round(q / 100, 4)}
+                observations.append(self._otel.Observation(h.percentile(q) / 1e9, attributes))
+        return observations
+
+    def export(self, metrics: ClientMetrics) -> None:
+        self._metrics = metrics
+        if not self._registered:
+            self.meter.create_observable_gauge(
+                "chroma.client.latency", callbacks=[self._observe], unit="s", description="Chroma client call latency"
+            )
+            self._registered = True
+
+
+# ── Wrappers ──
+
+
+class _CallTimer(threading.local):
+    """Phase timestamps of the call in progress on this thread."""
+
+    def __init__(self) -> None:
+        self.active = False
+        self.embed = 0
+        self.transport = 0
+        self.sent = 0
+        self.first_sent = 0
+        self.received = 0
+
+
+class InstrumentedCollection:
+    """Times `add`/`upsert`/`get`/`query`; everything else is passed through."""
+
+    def __init__(self, collection: Any, metrics: ClientMetrics, timer: _CallTimer, http: bool) -> None:
+        self._collection = collection
+        self._metrics = metrics
+        self._timer = timer
+        self._http = http
+        self._histograms = {
+            (op, phase): metrics.histogram(collection.name, op, phase) for op in OPERATIONS for phase in PHASES
+        }
+        embed = collection._embed  # covers explicit, configured and schema embedding functions
+
+        def timed_embed(*args: Any, **kwargs: Any) -> Any:
+            started = time.perf_counter_ns()
+            try:
+                return embed(*args, **kwargs)
+            finally:
+                timer.embed += time.perf_counter_ns() - started
+
+        collection._embed = timed_embed
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._collection, name)
+
+    def _call(self, operation: str, method: Callable[..., Any], kwargs: dict[str, Any]) -> Any:
+        timer = self._timer
+        timer.active = True
+        timer.embed = timer.transport = timer.first_sent = timer.received = 0
+        started = time.perf_counter_ns()
+        try:
+            return method(**kwargs)
+        finally:
+            ended = time.perf_counter_ns()
+            timer.active = False
+            h = self._histograms
+            h[operation, "total"].record(ended - started)
+            if timer.embed:
+                h[operation, "embed"].record(timer.embed)
+            if self._http and timer.received:
+                h[operation, "build"].record(timer.first_sent - started - timer.embed)
+                h[operation, "transport"].record(timer.transport)
+                h[operation, "decode"].record(ended - timer.received)
+            else:
+                h[operation, "execute"].record(ended - started - timer.embed)
+
+    def add(self, **kwargs: Any) -> Any:
+        return self._call("add", self._collection.add, kwargs)
+
+    def upsert(self, **kwargs: Any) -> Any:
+        return self._call("upsert", self._collection.upsert, kwargs)
+
+    def get(self, **kwargs: Any) -> Any:
+        return self._call("get", self._collection.get, kwargs)
+
+    def query(self, **kwargs: Any) -> Any:
+        return self._call("query", self._collection.query, kwargs)
+
+
+class InstrumentedClient:
+    """Wraps a Chroma client so the collections it returns are instrumented."""
+
+    def __init__(self, client: Any, metrics: ClientMetrics | None = None) -> None:
+        self._client = client
+        self.metrics = metrics or ClientMetrics()
+        self._timer = _CallTimer()
+        session = getattr(getattr(client, "_server", None), "_session", None)
+        self._http = session is not None and hasattr(session, "event_hooks")
+        if self._http:
+            timer = self._timer
+
+            def on_request(request: Any) -> None:
+                if timer.active:
+                    timer.sent = time.perf_counter_ns()
+                    timer.first_sent = timer.first_sent or timer.sent
+
+            def on_response(response: Any) -> None:
+                if timer.active:
+                    timer.received = time.perf_counter_ns()
+                    timer.transport += timer.received - timer.sent
+
+            session.event_hooks["request"].append(on_request)
+            session.event_hooks["response"].append(on_response)
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._client, name)
+
+    def _wrap(self, collection: Any) -> InstrumentedCollection:
+        return InstrumentedCollection(collection, self.metrics, self._timer, self._http)
+
+    def get_collection(self, *args: Any, **kwargs: Any) -> InstrumentedCollection:
+        return self._wrap(self._client.get_collection(*args, **kwargs))
+
+    def create_collection(self, *args: Any, **kwargs: Any) -> InstrumentedCollection:
+        return self._wrap(self._client.create_collection(*args, **kwargs))
+
+    def get_or_create_collection(self, *args: Any, **kwargs: Any) -> InstrumentedCollection:
+        return self._wrap(self._client.get_or_create_collection(*args, **kwargs))
+
+
+# ── Benchmark ──
+
+
+class _NullCollection:
+    """Collection stand-in whose calls return immediately, to isolate wrapper overhead."""
+
+    name = "null"
+
+    def _embed(self, input: Any, is_query: bool = False) -> Any:
+        return input
+
+    def query(self, **kwargs: Any) -> Any:
+        return kwargs
+
+
+def _overhead_ns(calls: int) -> float:
+    raw = _NullCollection()
+    wrapped = InstrumentedCollection(_NullCollection(), ClientMetrics(), _CallTimer(), http=False)
+    best = float("inf")
+    for _ in range(5):
+        started = time.perf_counter_ns()
+        for _ in range(calls):
+            raw.query(n_results=1)
+        raw_ns = time.perf_counter_ns() - started
+        started = time.perf_counter_ns()
+        for _ in range(calls):
+            wrapped.query(n_results=1)
+        best = min(best, (time.perf_counter_ns() - started - raw_ns) / calls)
+    return best
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Instrumentation overhead and phase breakdown.")
+    parser.add_argument("--http", action="store_true", help="use the server from CHROMA_HOST/CHROMA_PORT/CHROMA_SSL")
+    parser.add_argument("--records", type=int, default=10_000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=1_000)
+    args = parser.parse_args()
+
+    print(f"wrapper overhead: {_overhead_ns(100_000) / 1000:.2f} µs per call")
+
+    if args.http:
+        raw = chromadb.HttpClient(
+            host=os.getenv("CHROMA_HOST", "localhost"),
+            port=int(os.getenv("CHROMA_PORT", "8000")),
+            ssl=os.getenv("CHROMA_SSL", "false").lower() == "true",
+        )
+    else:
+        raw = chromadb.EphemeralClient()
+    client = InstrumentedClient(raw)
+    try:
+        client.delete_collection("instrumented_bench")
+    except Exception:
+        pass
+    collection = client.create_collection("instrumented_bench", embedding_function=None)
+    rng = np.random.default_rng(0)
+    batch_size = client.get_max_batch_size()
+    for start in range(0, args.records, batch_size):
+        end = min(start + batch_size, args.records)
+        collection.add(
+            ids=[f"doc-{i}" for i in range(start, end)],
+            embeddings=rng.random((end - start, args.dim), dtype=np.float32),
+            metadatas=[{"shard": i % 4} for i in range(start, end)],
+        )
+    for vector in rng.random((args.queries, args.dim), dtype=np.float32):
+        collection.query(query_embeddings=[vector], n_results=10, where={"shard": 1})
+    collection.get(ids=[f"doc-{i}" for i in range(100)], include=["metadatas"])
+
+    histogram = client.metrics.histogram("instrumented_bench", "query", "total")
+    if histogram.count != args.queries:
+        raise AssertionError(f"expected {args.queries} recorded queries, got {histogram.count}")
+    print(f"\n{'operation':<8} {'phase':<10} {'count':>6} {'p50 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+    for row in client.metrics.snapshot():
+        print(
+            f"{row['operation']:<8} {row['phase']:<10} {row['count']:>6} "
+            f"{row['p50_ms']:8.3f} {row['p99_ms']:8.3f} {row['max_ms']:8.3f}"
+        )
+    text = PrometheusTextSink().render(client.metrics)
+    if 'phase="total",le="+Inf"}' not in text:
+        raise AssertionError("Prometheus output is missing histogram buckets")
+
+    client.delete_collection("instrumented_bench")
+    print("\npython: instrumented client example passed")
+
+
+if __name__ == "__main__":
+    main()
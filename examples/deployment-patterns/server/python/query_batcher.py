@@ -0,0 +1,281 @@
+"""Coalesce concurrent single-vector queries into multi-vector `query()` calls.
+
+Request handlers usually call `collection.query(query_embeddings=[v], ...)`
+with one vector each, and against a server every call pays a full HTTP round
+trip plus per-request work in Chroma. `QueryBatcher` collects the calls made
+within a short window (2 ms by default) or until `max_batch_size` callers are
+waiting, merges calls that share `n_results`, `where`, `where_document` and
+`include` into one `query()` with all their vectors, and hands each caller its
+own slice of the result. Calls with different filters are sent as separate
+batches, so results are exactly what each caller would have got alone. While
+all `workers` are busy, due batches keep collecting callers instead of
+queueing, so batches grow with load.
+
+Usage:
+    from app_http import get_client
+    from query_batcher import QueryBatcher
+
+    collection = get_client().get_collection("support_kb")
+    with QueryBatcher(collection) as batcher:
+        # From many threads at once:
+        result = batcher.query([0.10, 0.21, 0.29], n_results=1, where={"product": "platform"})
+        result["ids"][0]  # same shape as a one-vector collection.query()
+
+Benchmark direct vs batched at 1, 16 and 256 concurrent callers:
+    python query_batcher.py                # local EphemeralClient
+    python query_batcher.py --http         # server from CHROMA_HOST/CHROMA_PORT/CHROMA_SSL
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Sequence
+
+import chromadb
+import numpy as np
+
+DEFAULT_INCLUDE = ("metadatas", "documents", "distances")
+
+
+@dataclass
+class _Batch:
+    deadline: float
+    kwargs: dict[str, Any]
+    embeddings: list[Any] = field(default_factory=list)
+    futures: list[Future] = field(default_factory=list)
+
+
+class QueryBatcher:
+    """Thread-safe front for `collection.query()` that batches concurrent calls."""
+
+    def __init__(
+        self,
+        collection: Any,
+        window_ms: float = 2.0,
+        max_batch_size: int = 64,
+        workers: int = 4,
+    ) -> None:
+        self.collection = collection
+        self.window = window_ms / 1000
+        self.max_batch_size = max_batch_size
+        self.requests = 0
+        self.batches = 0
+        self._workers = workers
+        self._in_flight = 0
+        self._pending: dict[tuple, _Batch] = {}
+        self._cond = threading.Condition()
+        self._closed = False
+        self._pool = ThreadPoolExecutor(max_workers=workers)
+        self._dispatcher = threading.Thread(target=self._dispatch_expired, daemon=True)
+        self._dispatcher.start()
+
+    def __enter__(self) -> QueryBatcher:
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.close()
+
+    @property
+    def mean_batch_size(self) -> float:
+        return self.requests / self.batches if self.batches else 0.0
+
+    def submit(
+        self,
+        query_embedding: Sequence[float],
+        n_results: int = 10,
+        where: dict[str, Any] | None = None,
+        where_document: dict[str, Any] | None = None,
+        include: Sequence[str] = DEFAULT_INCLUDE,
+    ) -> Future:
+        """Queue one query; the future resolves to a one-query `query()` result."""
+
+        key = (
+            n_results,
+            json.dumps(where, sort_keys=True),
+            json.dumps(where_document, sort_keys=True),
+            tuple(include),
+        )
+        future: Future = Future()
+        ready = None
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("QueryBatcher is closed")
+            batch = self._pending.get(key)
+            if batch is None:
+                batch = self._pending[key] = _Batch(
+                    deadline=time.perf_counter() + self.window,
+                    kwargs={
+                        "n_results": n_results,
+                        "where": where,
+                        "where_document": where_document,
+                        "include": list(include),
+                    },
+                )
+                self._cond.notify()
+            batch.embeddings.append(query_embedding)
+            batch.futures.append(future)
+            self.requests += 1
+            if len(batch.futures) >= self.max_batch_size:
+                ready = self._pending.pop(key)
+                self.batches += 1
+                self._in_flight += 1
+        if ready is not None:
+            self._pool.submit(self._run, ready)
+        return future
+
+    def query(self, query_embedding: Sequence[float], **kwargs: Any) -> dict[str, Any]:
+        """Blocking `submit()`."""
+
+        return self.submit(query_embedding, **kwargs).result()
+
+    def _dispatch_expired(self) -> None:
+        # While every worker is busy, expired batches keep filling instead of queueing.
+        while True:
+            with self._cond:
+                while not self._closed:
+                    if not self._pending or self._in_flight >= self._workers:
+                        self._cond.wait()
+                        continue
+                    timeout = min(b.deadline for b in self._pending.values()) - time.perf_counter()
+                    if timeout <= 0:
+                        break
+                    self._cond.wait(timeout)
+                now = time.perf_counter()
+                expired = sorted(
+                    (b.deadline, k) for k, b in self._pending.items() if self._closed or b.deadline <= now
+                )
+                if not self._closed:
+                    expired = expired[: self._workers - self._in_flight]
+                batches = [self._pending.pop(k) for _, k in expired]
+                self.batches += len(batches)
+                self._in_flight += len(batches)
+                closed = self._closed
+            for batch in batches:
+                self._pool.submit(self._run, batch)
+            if closed:
+                return
+
+    def _run(self, batch: _Batch) -> None:
+        try:
+            result = self.collection.query(query_embeddings=batch.embeddings, **batch.kwargs)
+        except Exception as exc:
+            for future in batch.futures:
+                future.set_exception(exc)
+            return
+        finally:
+            with self._cond:
+                self._in_flight -= 1
+                self._cond.notify()
+        for i, future in enumerate(batch.futures):
+            future.set_result(
+                {k: [v[i]] if isinstance(v, list) and k != "included" else v for k, v in result.items()}
+            )
+
+    def close(self) -> None:
+        """Send whatever is still queued and stop the dispatcher."""
+
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self._dispatcher.join()
+        self._pool.shutdown(wait=True)
+
+
+# ── Benchmark ──
+
+
+def _load(callers: int, seconds: float, send: Any, queries: np.ndarray) -> tuple[float, np.ndarray]:
+    latencies: list[float] = []
+    lock = threading.Lock()
+    stop = time.perf_counter() + seconds
+
+    def caller(seed: int) -> None:
+        local = []
+        i = seed
+        while time.perf_counter() < stop:
+            started = time.perf_counter()
+            send(queries[i % len(queries)], i % 4)
+            local.append(time.perf_counter() - started)
+            i += callers
+        with lock:
+            latencies.extend(local)
+
+    threads = [threading.Thread(target=caller, args=(seed,)) for seed in range(callers)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    return len(latencies) / elapsed, np.asarray(latencies) * 1000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark query coalescing against direct calls.")
+    parser.add_argument("--http", action="store_true", help="use app_http.get_client() instead of EphemeralClient")
+    parser.add_argument("--records", type=int, default=20_000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--callers", type=int, nargs="+", default=[1, 16, 256])
+    parser.add_argument("--window-ms", type=float, default=2.0)
+    parser.add_argument("--max-batch-size", type=int, default=64)
+    args = parser.parse_args()
+
+    if args.http:
+        from app_http import get_client
+
+        client = get_client()
+    else:
+        client = chromadb.EphemeralClient()
+    try:
+        client.delete_collection("query_batcher_bench")
+    except Exception:
+        pass
+    collection = client.create_collection("query_batcher_bench", embedding_function=None)
+    rng = np.random.default_rng(0)
+    batch_size = client.get_max_batch_size()
+    for start in range(0, args.records, batch_size):
+        end = min(start + batch_size, args.records)
+        collection.add(
+            ids=[f"doc-{i}" for i in range(start, end)],
+            embeddings=rng.random((end - start, args.dim), dtype=np.float32),
+            metadatas=[{"shard": i % 4} for i in range(start, end)],
+        )
+    queries = rng.random((1000, args.dim), dtype=np.float32)
+
+    # Four distinct filters, so batches only merge callers that share one.
+    def direct(vector: np.ndarray, shard: int) -> dict:
+        return collection.query(
+            query_embeddings=[vector], n_results=10, where={"shard": shard}, include=["distances"]
+        )
+
+    with QueryBatcher(collection, window_ms=args.window_ms, max_batch_size=args.max_batch_size) as batcher:
+        expected = direct(queries[0], 1)
+        got = batcher.query(queries[0], n_results=10, where={"shard": 1}, include=["distances"])
+        if got["ids"] != expected["ids"]:
+            raise AssertionError("batched result differs from a direct query")
+
+        def batched(vector: np.ndarray, shard: int) -> dict:
+            return batcher.query(vector, n_results=10, where={"shard": shard}, include=["distances"])
+
+        for callers in args.callers:
+            for name, send in (("direct", direct), ("batched", batched)):
+                batcher.requests = batcher.batches = 0
+                qps, latencies = _load(callers, args.seconds, send, queries)
+                extra = f" mean_batch={batcher.mean_batch_size:5.1f}" if name == "batched" else ""
+                print(
+                    f"callers={callers:<4} {name:<8} {qps:8,.0f} q/s "
+                    f"p50={np.percentile(latencies, 50):7.2f}ms p99={np.percentile(latencies, 99):7.2f}ms{extra}"
+                )
+
+    client.delete_collection("query_batcher_bench")
+    print("\npython: query batcher example passed")
+
+
+if __name__ == "__main__":
+    main()
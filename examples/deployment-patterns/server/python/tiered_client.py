@@ -0,0 +1,460 @@
+"""Tiered client: a local embedded read-mirror of server collections.
+
+Embedded and server mode are not either/or. `TieredClient` keeps a local
+`PersistentClient` mirror of chosen server collections and serves `query()`
+and `get()` from it, while `add()`, `upsert()`, `update()` and `delete()` go
+to the server. A background thread pulls changes into the mirror every
+`sync_interval` seconds:
+
+- every write through `TieredClient` stamps `_mirror_version` (wall-clock
+  seconds) into the records' metadata, and a sync fetches only records with a
+  version newer than the previous sync minus `lag` (re-reading a short
+  overlap catches writes that were stamped before, but committed after, the
+  previous sync);
+- deletes are recorded in a `<name>__tombstones` server collection, and a
+  later re-add of the same ID removes its tombstone;
+- the first sync copies the whole collection, including records written
+  before tiering was introduced. The sync cursor is saved next to the mirror,
+  so a restart resumes incrementally.
+
+Writes are also applied to the mirror right after the server accepts them,
+so a process reads its own writes. Writes from other processes become
+visible after their next sync. `staleness()` is the age of the last
+successful sync; while it exceeds `max_staleness` (sync failing or falling
+behind), reads go to the server instead.
+
+Every writer must go through `TieredClient`: writes made with a plain client
+carry no `_mirror_version` and are only picked up by a full resync. The stamp
+is stored in the server-side metadata, so plain clients see it in results;
+`TieredCollection.get()` / `query()` strip it.
+
+Usage:
+    from app_http import get_client
+    from tiered_client import TieredClient
+
+    with TieredClient(get_client(), "./chroma_mirror", ["support_kb"], max_staleness=5.0) as tiered:
+        kb = tiered.collection("support_kb")
+        kb.upsert(ids=["a3"], embeddings=[[0.09, 0.22, 0.28]], metadatas=[{"product": "platform"}])
+        result = kb.query(query_embeddings=[[0.10, 0.21, 0.29]], n_results=1)   # served by the mirror
+
+Check sync, deletes and fallback, and compare mirror and server read latency
+against the server from CHROMA_HOST/CHROMA_PORT/CHROMA_SSL:
+    python tiered_client.py --records 20000
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import shutil
+import tempfile
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Sequence
+
+import chromadb
+import numpy as np
+
+VERSION_KEY = "_mirror_version"
+TOMBSTONE_SUFFIX = "__tombstones"
+SYNC_INCLUDE = ["embeddings", "documents", "metadatas"]
+
+
+def _version(metadata: dict[str, Any] | None) -> float:
+    """The `_mirror_version` stamp of a record; records written before tiering have none."""
+
+    return float((metadata or {}).get(VERSION_KEY, float("-inf")))
+
+
+def _strip_version(result: dict[str, Any]) -> dict[str, Any]:
+    """Hide the internal version stamp from `get()` (flat) and `query()` (nested) metadata."""
+
+    metadatas = result.get("metadatas")
+    if metadatas:
+
+        def strip(metadata: dict[str, Any] | None) -> dict[str, Any] | None:
+            if metadata is None or VERSION_KEY not in metadata:
+                return metadata
+            return {k: v for k, v in metadata.items() if k != VERSION_KEY} or None
+
+        result["metadatas"] = [
+            [strip(m) for m in group] if isinstance(group, list) else strip(group) for group in metadatas
+        ]
+    return result
+
+
+@dataclass
+class SyncStats:
+    upserted: int = 0
+    deleted: int = 0
+    seconds: float = 0.0
+
+
+class TieredCollection:
+    """One mirrored collection: writes go to the server, reads to the mirror while it is fresh."""
+
+    def __init__(self, tiered: TieredClient, name: str, server: Any, tombstones: Any, mirror: Any) -> None:
+        self.name = name
+        self.server = server
+        self.mirror = mirror
+        self.mirror_reads = 0
+        self.server_reads = 0
+        self._tiered = tiered
+        self._tombstones = tombstones
+
+    def _stamp(self, ids: Sequence[str], metadatas: Sequence[dict[str, Any] | None] | None) -> list[dict[str, Any]]:
+        version = time.time()
+        if metadatas is None:
+            return [{VERSION_KEY: version} for _ in ids]
+        return [{**(m or {}), VERSION_KEY: version} for m in metadatas]
+
+    def _write(self, method: str, ids: Sequence[str], metadatas: Any, **kwargs: Any) -> None:
+        ids = list(ids)
+        stamped = self._stamp(ids, metadatas)
+        getattr(self.server, method)(ids=ids, metadatas=stamped, **kwargs)
+        self._tombstones.delete(ids=ids)
+        with self._tiered._apply_lock:
+            # The sync thread may have copied these IDs already, and add() skips existing IDs.
+            getattr(self.mirror, "upsert" if method == "add" else method)(ids=ids, metadatas=stamped, **kwargs)
+
+    def add(self, ids: Sequence[str], embeddings: Any, metadatas: Any = None, documents: Any = None) -> None:
+        self._write("add", ids, metadatas, embeddings=embeddings, documents=documents)
+
+    def upsert(self, ids: Sequence[str], embeddings: Any, metadatas: Any = None, documents: Any = None) -> None:
+        self._write("upsert", ids, metadatas, embeddings=embeddings, documents=documents)
+
+    def update(self, ids: Sequence[str], embeddings: Any = None, metadatas: Any = None, documents: Any = None) -> None:
+        self._write("update", ids, metadatas, embeddings=embeddings, documents=documents)
+
+    def delete(self, ids: Sequence[str]) -> None:
+        ids = list(ids)
+        version = time.time()
+        self._tombstones.upsert(
+            ids=ids, embeddings=np.zeros((len(ids), 1), dtype=np.float32), metadatas=[{VERSION_KEY: version}] * len(ids)
+        )
+        self.server.delete(ids=ids)
+        with self._tiered._apply_lock:
+            self.mirror.delete(ids=ids)
+
+    def _reader(self) -> Any:
+        if self._tiered.staleness(self.name) <= self._tiered.max_staleness:
+            self.mirror_reads += 1
+            return self.mirror
+        self.server_reads += 1
+        return self.server
+
+    def query(self, **kwargs: Any) -> dict[str, Any]:
+        return _strip_version(self._reader().query(**kwargs))
+
+    def get(self, **kwargs: Any) -> dict[str, Any]:
+        return _strip_version(self._reader().get(**kwargs))
+
+    def count(self) -> int:
+        return self._reader().count()
+
+
+class TieredClient:
+    """Mirrors `collections` of `server` into a `PersistentClient` at `mirror_path`."""
+
+    def __init__(
+        self,
+        server: Any,
+        mirror_path: str,
+        collections: Sequence[str],
+        max_staleness: float = 5.0,
+        sync_interval: float = 1.0,
+        lag: float = 5.0,
+        batch_size: int = 1000,
+    ) -> None:
+        self.server = server
+        self.max_staleness = max_staleness
+        self.sync_interval = sync_interval
+        self.lag = lag
+        self.batch_size = batch_size
+        self.mirror_client = chromadb.PersistentClient(path=mirror_path)
+        self._state_path = Path(mirror_path) / "mirror_state.json"
+        self._state: dict[str, dict[str, float]] = (
+            json.loads(self._state_path.read_text()) if self._state_path.exists() else {}
+        )
+        self._synced_at: dict[str, float] = {}
+        # Serializes mirror writes from the sync thread and from write-through.
+        self._apply_lock = threading.Lock()
+        # Serializes whole syncs (background thread and explicit callers) and the state file they write.
+        self._sync_lock = threading.Lock()
+        self._collections: dict[str, TieredCollection] = {}
+        for name in collections:
+            remote = server.get_collection(name, embedding_function=None)
+            tombstones = server.get_or_create_collection(name + TOMBSTONE_SUFFIX, embedding_function=None)
+            if name not in self._state:
+                # No cursor: start from an empty mirror and copy everything.
+                try:
+                    self.mirror_client.delete_collection(name)
+                except Exception:
+                    pass
+            mirror = self.mirror_client.get_or_create_collection(
+                name,
+                embedding_function=None,
+                configuration=remote.configuration,
+                metadata=remote.metadata,
+            )
+            self._collections[name] = TieredCollection(self, name, remote, tombstones, mirror)
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def __enter__(self) -> TieredClient:
+        self.start()
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.close()
+
+    def collection(self, name: str) -> TieredCollection:
+        return self._collections[name]
+
+    def staleness(self, name: str) -> float:
+        """Seconds since the start of the last successful sync (inf before the first)."""
+
+        synced_at = self._synced_at.get(name)
+        return float("inf") if synced_at is None else time.time() - synced_at
+
+    def start(self) -> None:
+        """Sync once, then keep syncing in the background."""
+
+        self.sync()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def close(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.sync_interval):
+            try:
+                self.sync()
+            except Exception:
+                pass  # reads fall back to the server once staleness exceeds max_staleness
+
+    def _pages(self, source: Any, where: dict[str, Any] | None, include: list[str]):
+        # Page by ID over one snapshot: with limit/offset a concurrent delete shifts later
+        # pages and skips live records, which a full copy would then never pick up.
+        ids = sorted(source.get(where=where, include=[])["ids"])
+        for start in range(0, len(ids), self.batch_size):
+            page = source.get(ids=ids[start : start + self.batch_size], include=include)
+            if page["ids"]:
+                yield page
+
+    @staticmethod
+    def _mirror_versions(mirror: Any, ids: list[str]) -> dict[str, dict[str, Any] | None]:
+        before = mirror.get(ids=ids, include=["metadatas"])
+        return dict(zip(before["ids"], before["metadatas"]))
+
+    def _apply(self, mirror: Any, page: dict[str, Any]) -> int:
+        """Upsert a fetched page into the mirror; returns how many records were applied.
+
+        The page was read before taking `_apply_lock`, so a write-through may
+        have landed since. Records whose mirror copy is at least as new are kept.
+        """
+
+        with self._apply_lock:
+            before = self._mirror_versions(mirror, page["ids"])
+            rows = [
+                i
+                for i, (record_id, metadata) in enumerate(zip(page["ids"], page["metadatas"]))
+                if _version(metadata) > _version(before.get(record_id)) or record_id not in before
+            ]
+            if not rows:
+                return 0
+            ids = [page["ids"][i] for i in rows]
+            metadatas = [page["metadatas"][i] for i in rows]
+            mirror.upsert(
+                ids=ids,
+                embeddings=[page["embeddings"][i] for i in rows],
+                documents=[page["documents"][i] for i in rows],
+                metadatas=metadatas,
+            )
+            # upsert merges metadata; drop keys the server no longer has.
+            current = dict(zip(ids, metadatas))
+            removed = {
+                i: {k: None for k in (before[i] or {}).keys() - (current[i] or {}).keys()}
+                for i in ids
+                if i in before
+            }
+            removed = {i: keys for i, keys in removed.items() if keys}
+            if removed:
+                mirror.update(ids=list(removed), metadatas=list(removed.values()))
+        return len(ids)
+
+    def _apply_tombstones(self, mirror: Any, page: dict[str, Any]) -> int:
+        """Delete tombstoned IDs from the mirror unless the mirror holds a newer re-add."""
+
+        with self._apply_lock:
+            before = self._mirror_versions(mirror, page["ids"])
+            ids = [
+                record_id
+                for record_id, metadata in zip(page["ids"], page["metadatas"])
+                if record_id in before and _version(before[record_id]) < _version(metadata)
+            ]
+            if ids:
+                mirror.delete(ids=ids)
+        return len(ids)
+
+    def sync(self, name: str | None = None) -> SyncStats:
+        """Pull changes since the last sync into the mirror (all collections by default)."""
+
+        with self._sync_lock:
+            return self._sync(name)
+
+    def _sync(self, name: str | None) -> SyncStats:
+        stats = SyncStats()
+        started = time.perf_counter()
+        for collection in [self._collections[name]] if name else self._collections.values():
+            sync_started = time.time()
+            cursor = self._state.get(collection.name, {}).get("cursor")
+            where = None if cursor is None else {VERSION_KEY: {"$gt": cursor - self.lag}}
+            if cursor is not None:
+                # Tombstones first, so a delete followed by a re-add ends with the record present.
+                for page in self._pages(collection._tombstones, where, ["metadatas"]):
+                    stats.deleted += self._apply_tombstones(collection.mirror, page)
+            for page in self._pages(collection.server, where, SYNC_INCLUDE):
+                stats.upserted += self._apply(collection.mirror, page)
+            self._state[collection.name] = {"cursor": sync_started}
+            self._synced_at[collection.name] = sync_started
+        tmp = self._state_path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(self._state))
+        tmp.replace(self._state_path)
+        stats.seconds = time.perf_counter() - started
+        return stats
+
+    def prune_tombstones(self, older_than: float = 86_400.0) -> None:
+        """Drop tombstones older than `older_than` seconds; mirrors that far behind need a full resync."""
+
+        for collection in self._collections.values():
+            collection._tombstones.delete(where={VERSION_KEY: {"$lt": time.time() - older_than}})
+
+
+# ── Benchmark ──
+
+
+def _latencies(send: Any, queries: np.ndarray) -> np.ndarray:
+    latencies = []
+    for vector in queries:
+        started = time.perf_counter()
+        send(vector)
+        latencies.append(time.perf_counter() - started)
+    return np.asarray(latencies) * 1000
+
+
+def main() -> None:
+    from app_http import get_client
+
+    parser = argparse.ArgumentParser(description="Check and benchmark the tiered read-mirror client.")
+    parser.add_argument("--records", type=int, default=20_000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=500)
+    args = parser.parse_args()
+
+    name = "tiered_bench"
+    server = get_client()
+    for stale in (name, name + TOMBSTONE_SUFFIX):
+        try:
+            server.delete_collection(stale)
+        except Exception:
+            pass
+    seed = server.create_collection(name, embedding_function=None)
+    rng = np.random.default_rng(0)
+    products = ["billing", "platform", "security"]
+    for start in range(0, args.records, server.get_max_batch_size()):
+        end = min(start + server.get_max_batch_size(), args.records)
+        seed.add(
+            ids=[f"doc-{i}" for i in range(start, end)],
+            embeddings=rng.random((end - start, args.dim), dtype=np.float32),
+            metadatas=[{"product": products[i % 3]} for i in range(start, end)],
+        )
+
+    mirror_a = tempfile.mkdtemp(prefix="tiered-a-")
+    mirror_b = tempfile.mkdtemp(prefix="tiered-b-")
+    try:
+        started = time.perf_counter()
+        a = TieredClient(server, mirror_a, [name], sync_interval=0.5, lag=1.0)
+        a.start()
+        print(f"initial sync of {args.records:,} records in {time.perf_counter() - started:.1f}s")
+        b = TieredClient(server, mirror_b, [name], sync_interval=0.5, lag=1.0)
+        b.start()
+        kb_a, kb_b = a.collection(name), b.collection(name)
+
+        # Writes through b reach a's mirror on a's next incremental sync.
+        fresh = rng.random((10, args.dim), dtype=np.float32)
+        kb_b.upsert(ids=[f"new-{i}" for i in range(10)], embeddings=fresh, metadatas=[{"product": "billing"}] * 10)
+        kb_b.delete(ids=["doc-0", "doc-1"])
+        kb_b.update(ids=["doc-2"], metadatas=[{"product": "moved"}])
+        if kb_b.get(ids=["new-0"])["ids"] != ["new-0"]:
+            raise AssertionError("writer does not read its own write")
+        stats = a.sync()
+        print(f"incremental sync: {stats.upserted} upserted, {stats.deleted} deleted in {stats.seconds * 1000:.0f}ms")
+        got = kb_a.mirror.get(ids=["new-0", "doc-0", "doc-2"], include=["metadatas"])
+        if sorted(got["ids"]) != ["doc-2", "new-0"] or got["metadatas"][got["ids"].index("doc-2")]["product"] != "moved":
+            raise AssertionError("mirror did not pick up the other client's writes")
+        if kb_a.mirror.count() != kb_a.server.count():
+            raise AssertionError("mirror and server counts differ")
+        if kb_b.get(ids=["doc-2"])["metadatas"] != [{"product": "moved"}]:
+            raise AssertionError(f"{VERSION_KEY} leaked into read results")
+
+        # A sync page read before this process's own write must not roll that write back,
+        # and a tombstone older than a re-add must not delete it.
+        stale_page = kb_b.server.get(ids=["doc-3"], include=SYNC_INCLUDE)
+        stale_tombstones = kb_b._tombstones.get(ids=["doc-1"], include=["metadatas"])
+        kb_b.upsert(ids=["doc-3"], embeddings=fresh[:1], metadatas=[{"product": "v2"}])
+        kb_b.add(ids=["doc-1"], embeddings=fresh[1:2], metadatas=[{"product": "readded"}])
+        if b._apply(kb_b.mirror, stale_page) or b._apply_tombstones(kb_b.mirror, stale_tombstones):
+            raise AssertionError("stale sync data was applied over newer local writes")
+        got = kb_b.get(ids=["doc-1", "doc-3"], include=["metadatas"])
+        if dict(zip(got["ids"], got["metadatas"])) != {"doc-1": {"product": "readded"}, "doc-3": {"product": "v2"}}:
+            raise AssertionError(f"mirror lost the process's own writes: {got}")
+
+        queries = rng.random((args.queries, args.dim), dtype=np.float32)
+        # Separately built HNSW graphs return different approximate neighbours, so compare each
+        # side's recall against exact search rather than the two result lists.
+        everything = kb_a.mirror.get(include=["embeddings"])
+        vectors = np.asarray(everything["embeddings"])
+        sample = queries[:50]
+        distances = (sample**2).sum(1)[:, None] - 2 * sample @ vectors.T + (vectors**2).sum(1)[None, :]
+        exact = [{everything["ids"][j] for j in row} for row in np.argsort(distances, axis=1)[:, :10]]
+        recall = {}
+        for label, source in (("mirror", kb_a.mirror), ("server", kb_a.server)):
+            got = source.query(query_embeddings=sample, n_results=10, include=["distances"])["ids"]
+            recall[label] = np.mean([len(e & set(g)) / 10 for e, g in zip(exact, got)])
+        print(f"recall@10 vs exact: mirror {recall['mirror']:.3f}, server {recall['server']:.3f}")
+        if recall["mirror"] < recall["server"] - 0.05:
+            raise AssertionError("mirror results are worse than the server's")
+
+        def read(vector: np.ndarray) -> Any:
+            return kb_a.query(query_embeddings=[vector], n_results=10, where={"product": "billing"})
+
+        kb_a.mirror_reads = kb_a.server_reads = 0
+        mirror_ms = _latencies(read, queries)
+        # Stop syncing and let the mirror age past max_staleness: reads fall back to the server.
+        a.close()
+        a.max_staleness = 0.0
+        server_ms = _latencies(read, queries)
+        if kb_a.mirror_reads != args.queries or kb_a.server_reads != args.queries:
+            raise AssertionError("reads were not routed by staleness")
+        for label, ms in (("mirror", mirror_ms), ("server", server_ms)):
+            print(
+                f"{label:<7} query p50={np.percentile(ms, 50):7.2f}ms p99={np.percentile(ms, 99):7.2f}ms"
+            )
+        b.close()
+    finally:
+        shutil.rmtree(mirror_a, ignore_errors=True)
+        shutil.rmtree(mirror_b, ignore_errors=True)
+        server.delete_collection(name)
+        server.delete_collection(name + TOMBSTONE_SUFFIX)
+
+    print("\npython: tiered client example passed")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,288 @@
+"""Startup warm-up with a readiness signal that waits for latency to settle.
+
+`/api/v2/heartbeat` only says the process is alive. After a restart, the first
+queries against each collection are slow while Chroma loads the HNSW index
+and metadata from disk, so sending traffic as soon as the heartbeat passes
+puts those slow queries on real users. `Warmup` runs before traffic arrives:
+
+1. loads each configured collection and samples a few stored embeddings
+   (spread over the collection with `get(limit, offset)`) to use as queries;
+2. runs rounds of synthetic queries (with an optional per-collection `where`)
+   and records each round's p95;
+3. marks a collection settled once the round p95 changed by at most
+   `tolerance` for `stable_rounds` rounds in a row, and sets `ready` when all
+   collections are settled or `max_rounds` is reached.
+
+`serve_readiness()` exposes that state on a separate port, so the orchestrator
+can keep using the heartbeat for liveness and `/ready` for readiness. Works the
+same with `PersistentClient` (embedded) and `HttpClient` (server; run it in the
+app or in a sidecar after the server restarts).
+
+Usage:
+    from warmup import Warmup
+
+    warmup = Warmup(client, ["support_kb"], where={"support_kb": {"product": "billing"}})
+    warmup.serve_readiness(port=8081)     # GET /ready -> 503 until settled, then 200
+    report = warmup.run()                 # or warmup.start() to run in the background
+    for stats in report.values():
+        print(stats)
+
+Cold-start vs warm latency per collection, using a fresh process on a
+persisted embedded database (or `--http` against CHROMA_HOST/CHROMA_PORT/CHROMA_SSL
+with existing collections):
+    python warmup.py --records 50000
+    python warmup.py --http --collections support_kb
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from dataclasses import asdict, dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Sequence
+
+import chromadb
+import numpy as np
+
+
+@dataclass
+class WarmupStats:
+    """Warm-up outcome of one collection; latencies in milliseconds."""
+
+    name: str
+    cold_ms: float = 0.0
+    round_p95_ms: list[float] = field(default_factory=list)
+    warm_p50_ms: float = 0.0
+    warm_p95_ms: float = 0.0
+    settled: bool = False
+    seconds: float = 0.0
+
+    def __str__(self) -> str:
+        if not self.round_p95_ms:  # empty collection, nothing to warm
+            return f"{self.name}: empty, settled={self.settled} in {self.seconds:.1f}s"
+        return (
+            f"{self.name}: cold={self.cold_ms:.1f}ms first-round p95={self.round_p95_ms[0]:.1f}ms "
+            f"warm p50={self.warm_p50_ms:.1f}ms p95={self.warm_p95_ms:.1f}ms "
+            f"rounds={len(self.round_p95_ms)} settled={self.settled} in {self.seconds:.1f}s"
+        )
+
+
+class Warmup:
+    """Warms `collections` with synthetic queries and signals readiness once p95 settles."""
+
+    def __init__(
+        self,
+        client: Any,
+        collections: Sequence[str],
+        where: dict[str, dict[str, Any]] | None = None,
+        samples: int = 16,
+        queries_per_round: int = 20,
+        max_rounds: int = 30,
+        tolerance: float = 0.15,
+        stable_rounds: int = 2,
+        n_results: int = 10,
+    ) -> None:
+        self.client = client
+        self.collections = list(collections)
+        self.where = where or {}
+        self.samples = samples
+        self.queries_per_round = queries_per_round
+        self.max_rounds = max_rounds
+        self.tolerance = tolerance
+        self.stable_rounds = stable_rounds
+        self.n_results = n_results
+        self.ready = threading.Event()
+        self.report: dict[str, WarmupStats] = {}
+        self._thread: threading.Thread | None = None
+        self._server: ThreadingHTTPServer | None = None
+
+    def _sample_queries(self, collection: Any) -> np.ndarray:
+        count = collection.count()
+        offsets = sorted({i * count // self.samples for i in range(self.samples)}) if count else []
+        vectors = [
+            collection.get(limit=1, offset=offset, include=["embeddings"])["embeddings"][0] for offset in offsets
+        ]
+        return np.asarray(vectors, dtype=np.float32)
+
+    def _query_ms(self, collection: Any, vector: np.ndarray) -> float:
+        started = time.perf_counter()
+        collection.query(
+            query_embeddings=[vector],
+            n_results=self.n_results,
+            where=self.where.get(collection.name),
+            include=["metadatas", "documents", "distances"],
+        )
+        return (time.perf_counter() - started) * 1000
+
+    def warm(self, name: str) -> WarmupStats:
+        """Warm one collection and return its stats."""
+
+        stats = WarmupStats(name)
+        started = time.perf_counter()
+        collection = self.client.get_collection(name)
+        # The first request that touches the index pays for loading it, whether it is
+        # a get() with embeddings or a query(); time one of each as the cold latency.
+        cold_started = time.perf_counter()
+        first = collection.get(limit=1, include=["embeddings"])["embeddings"]
+        if first is None or not len(first):
+            stats.settled = True
+            stats.seconds = time.perf_counter() - started
+            return stats
+        self._query_ms(collection, np.asarray(first[0], dtype=np.float32))
+        stats.cold_ms = (time.perf_counter() - cold_started) * 1000
+        vectors = self._sample_queries(collection)
+        rng = np.random.default_rng(0)
+        stable = 0
+        latencies: list[float] = []
+        for _ in range(self.max_rounds):
+            # Jitter the sampled vectors so each round walks a slightly different part of the graph.
+            picks = vectors[rng.integers(len(vectors), size=self.queries_per_round)]
+            scale = float(np.abs(vectors).mean()) * 0.05
+            picks = picks + rng.normal(0, scale, picks.shape).astype(np.float32)
+            latencies = [self._query_ms(collection, v) for v in picks]
+            p95 = float(np.percentile(latencies, 95))
+            if stats.round_p95_ms:
+                previous = stats.round_p95_ms[-1]
+                stable = stable + 1 if abs(p95 - previous) <= self.tolerance * previous else 0
+            stats.round_p95_ms.append(p95)
+            if stable >= self.stable_rounds:
+                stats.settled = True
+                break
+        stats.warm_p50_ms = float(np.percentile(latencies, 50))
+        stats.warm_p95_ms = float(np.percentile(latencies, 95))
+        stats.seconds = time.perf_counter() - started
+        return stats
+
+    def run(self) -> dict[str, WarmupStats]:
+        """Warm every collection, then set `ready` (even if some never settled within `max_rounds`)."""
+
+        for name in self.collections:
+            self.report[name] = self.warm(name)
+        self.ready.set()
+        return self.report
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self.run, daemon=True)
+        self._thread.start()
+
+    def serve_readiness(self, port: int = 8081, host: str = "0.0.0.0") -> ThreadingHTTPServer:
+        """Serve `GET /ready` (503 until warm, then 200 with the report as JSON)."""
+
+        warmup = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args: Any) -> None:
+                pass
+
+            def do_GET(self) -> None:
+                if self.path != "/ready":
+                    self.send_error(404)
+                    return
+                ready = warmup.ready.is_set()
+                body = json.dumps(
+                    {"ready": ready, "collections": {k: asdict(v) for k, v in warmup.report.items()}}
+                ).encode()
+                self.send_response(200 if ready else 503)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self._server
+
+    def close(self) -> None:
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+
+
+# ── Benchmark ──
+
+
+def _child(args: argparse.Namespace) -> None:
+    """Runs in a fresh process, so indexes start unloaded."""
+
+    if args.http:
+        client = chromadb.HttpClient(
+            host=os.getenv("CHROMA_HOST", "localhost"),
+            port=int(os.getenv("CHROMA_PORT", "8000")),
+            ssl=os.getenv("CHROMA_SSL", "false").lower() == "true",
+        )
+    else:
+        client = chromadb.PersistentClient(path=args.path)
+    warmup = Warmup(client, args.collections)
+    server = warmup.serve_readiness(port=0, host="127.0.0.1")
+    url = f"http://127.0.0.1:{server.server_address[1]}/ready"
+    try:
+        urllib.request.urlopen(url)
+        raise AssertionError("/ready answered 200 before warm-up")
+    except urllib.error.HTTPError as exc:
+        if exc.code != 503:
+            raise
+    warmup.run()
+    if urllib.request.urlopen(url).status != 200:
+        raise AssertionError("/ready did not turn 200 after warm-up")
+    warmup.close()
+    print(json.dumps({k: asdict(v) for k, v in warmup.report.items()}))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Cold-start vs warm query latency per collection.")
+    parser.add_argument("--http", action="store_true", help="warm existing collections on CHROMA_HOST/CHROMA_PORT")
+    parser.add_argument("--collections", nargs="+", default=["warmup_small", "warmup_large"])
+    parser.add_argument("--records", type=int, default=50_000, help="records in the largest seeded collection")
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--path", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        _child(args)
+        return
+
+    path = None
+    if not args.http:
+        path = tempfile.mkdtemp(prefix="chroma-warmup-")
+        client = chromadb.PersistentClient(path=path)
+        rng = np.random.default_rng(0)
+        for i, name in enumerate(args.collections):
+            size = max(1_000, args.records // 10 ** (len(args.collections) - 1 - i))
+            collection = client.create_collection(name, embedding_function=None)
+            for start in range(0, size, client.get_max_batch_size()):
+                end = min(start + client.get_max_batch_size(), size)
+                collection.add(
+                    ids=[f"doc-{j}" for j in range(start, end)],
+                    embeddings=rng.random((end - start, args.dim), dtype=np.float32),
+                    metadatas=[{"product": ["billing", "platform"][j % 2]} for j in range(start, end)],
+                )
+            print(f"seeded {name} with {size:,} records")
+        del client
+
+    try:
+        command = [sys.executable, __file__, "--child", "--collections", *args.collections]
+        command += ["--http"] if args.http else ["--path", path]
+        output = subprocess.run(command, check=True, capture_output=True, text=True).stdout
+        report = json.loads(output.strip().splitlines()[-1])
+        for stats in report.values():
+            print(WarmupStats(**stats))
+    finally:
+        if path is not None:
+            shutil.rmtree(path, ignore_errors=True)
+
+    print("\npython: warmup example passed")
+
+
+if __name__ == "__main__":
+    main()
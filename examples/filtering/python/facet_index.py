@@ -0,0 +1,566 @@
+"""In-memory bitmap facet index kept beside a Chroma collection.
+
+Faceted navigation over array metadata (`authors`, `topics`, `review_scores`
+in `filter_examples.py`, `categories` in the multi-category strategy) needs a
+count per facet value, and Chroma answers that with one `get(where=...)` per
+value. `FacetIndex` maps every (field, value) pair to a compressed bitmap of
+record rows instead, so counts and boolean combinations are answered in
+memory and the matching IDs can be passed to `query(ids=...)`.
+
+Bitmaps follow the Roaring layout: rows are split into 2^16-row chunks and
+each chunk is stored either as a sorted `uint16` array (up to 4096 rows) or
+as a 1024-word `uint64` bitmap, whichever is smaller.
+
+The index understands the equality-style subset of the filter language
+(`$eq`, `$ne`, `$in`, `$nin`, `$contains`, `$not_contains`, `$and`, `$or`)
+with Chroma's semantics; range operators raise `ValueError` and should go
+to Chroma.
+
+Usage:
+    from facet_index import IndexedCollection
+
+    indexed = IndexedCollection(collection, fields=["authors", "topics"])
+    indexed.facet_counts("topics", where={"authors": {"$contains": "Chen"}})
+    ids = indexed.index.ids({"topics": {"$contains": "ml"}})
+    if ids:
+        results = collection.query(query_embeddings=[q], ids=ids, n_results=10)
+    indexed.upsert(ids=["doc-1"], metadatas=[{"topics": ["energy"]}])  # index follows writes
+
+Run the benchmark against repeated `get(where=...)` calls (local, no server):
+    python facet_index.py --rows 200000
+"""
+
+from __future__ import annotations
+
+import argparse
+import random
+import time
+from typing import Any, Iterable, Sequence
+
+import chromadb
+import numpy as np
+
+from filter_compiler import parse_where
+
+ARRAY_MAX = 4096
+
+
+def _to_words(container: np.ndarray) -> np.ndarray:
+    if container.dtype == np.uint64:
+        return container
+    bits = np.zeros(1 << 16, dtype=bool)
+    bits[container] = True
+    return np.packbits(bits, bitorder="little").view(np.uint64)
+
+
+def _to_array(words: np.ndarray) -> np.ndarray:
+    return np.flatnonzero(np.unpackbits(words.view(np.uint8), bitorder="little")).astype(np.uint16)
+
+
+_BYTE_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def _cardinality(container: np.ndarray) -> int:
+    if container.dtype == np.uint16:
+        return len(container)
+    if hasattr(np, "bitwise_count"):  # NumPy >= 2.0
+        return int(np.bitwise_count(container).sum())
+    return int(_BYTE_POPCOUNT[container.view(np.uint8)].sum())
+
+
+def _shrink(container: np.ndarray) -> np.ndarray | None:
+    """Pick the smaller representation; `None` for an empty chunk."""
+
+    size = _cardinality(container)
+    if size == 0:
+        return None
+    if container.dtype == np.uint64 and size <= ARRAY_MAX:
+        return _to_array(container)
+    if container.dtype == np.uint16 and size > ARRAY_MAX:
+        return _to_words(container)
+    return container
+
+
+def _combine(op: str, a: np.ndarray, b: np.ndarray) -> np.ndarray | None:
+    if a.dtype == np.uint16 and b.dtype == np.uint16:
+        if op == "and":
+            return _shrink(np.intersect1d(a, b, assume_unique=True))
+        if op == "or":
+            return _shrink(np.union1d(a, b))
+        return _shrink(np.setdiff1d(a, b, assume_unique=True))
+    if op == "and" and a.dtype != b.dtype:
+        # Probe the array container against the bitmap one.
+        array, words = (a, b) if a.dtype == np.uint16 else (b, a)
+        hit = (words[array >> 6] >> (array & 63).astype(np.uint64)) & np.uint64(1)
+        return _shrink(array[hit.astype(bool)])
+    a, b = _to_words(a), _to_words(b)
+    if op == "and":
+        return _shrink(a & b)
+    if op == "or":
+        return _shrink(a | b)
+    return _shrink(a & ~b)
+
+
+class Bitmap:
+    """Compressed set of non-negative row numbers."""
+
+    __slots__ = ("_chunks",)
+
+    def __init__(self, rows: Iterable[int] | np.ndarray = ()) -> None:
+        self._chunks: dict[int, np.ndarray] = {}
+        self.update(rows)
+
+    @staticmethod
+    def _groups(rows: Iterable[int] | np.ndarray) -> Iterable[tuple[int, np.ndarray]]:
+        values = np.unique(np.fromiter(rows, dtype=np.int64) if not isinstance(rows, np.ndarray) else rows)
+        if len(values) == 0:
+            return
+        highs = values >> 16
+        bounds = np.flatnonzero(np.diff(highs)) + 1
+        for group in np.split(values, bounds):
+            yield int(group[0] >> 16), (group & 0xFFFF).astype(np.uint16)
+
+    def update(self, rows: Iterable[int] | np.ndarray) -> None:
+        """Add `rows` in place."""
+
+        for high, lows in self._groups(rows):
+            existing = self._chunks.get(high)
+            merged = _shrink(lows) if existing is None else _combine("or", existing, lows)
+            if merged is not None:
+                self._chunks[high] = merged
+
+    def difference_update(self, rows: Iterable[int] | np.ndarray) -> None:
+        """Remove `rows` in place."""
+
+        for high, lows in self._groups(rows):
+            existing = self._chunks.get(high)
+            if existing is None:
+                continue
+            remaining = _combine("andnot", existing, lows)
+            if remaining is None:
+                del self._chunks[high]
+            else:
+                self._chunks[high] = remaining
+
+    def _binary(self, other: Bitmap, op: str) -> Bitmap:
+        out = Bitmap()
+        if op == "and":
+            highs: Iterable[int] = self._chunks.keys() & other._chunks.keys()
+        elif op == "or":
+            highs = self._chunks.keys() | other._chunks.keys()
+        else:
+            highs = self._chunks.keys()
+        for high in highs:
+            a, b = self._chunks.get(high), other._chunks.get(high)
+            result = a if b is None else b if a is None else _combine(op, a, b)
+            if result is not None:
+                out._chunks[high] = result
+        return out
+
+    def __and__(self, other: Bitmap) -> Bitmap:
+        return self._binary(other, "and")
+
+    def __or__(self, other: Bitmap) -> Bitmap:
+        return self._binary(other, "or")
+
+    def __sub__(self, other: Bitmap) -> Bitmap:
+        return self._binary(other, "andnot")
+
+    def __len__(self) -> int:
+        return sum(_cardinality(c) for c in self._chunks.values())
+
+    def __contains__(self, row: int) -> bool:
+        container = self._chunks.get(row >> 16)
+        if container is None:
+            return False
+        low = row & 0xFFFF
+        if container.dtype == np.uint16:
+            i = int(np.searchsorted(container, low))
+            return i < len(container) and int(container[i]) == low
+        return bool((int(container[low >> 6]) >> (low & 63)) & 1)
+
+    def to_array(self) -> np.ndarray:
+        """All rows, ascending, as an int64 array."""
+
+        parts = []
+        for high in sorted(self._chunks):
+            container = self._chunks[high]
+            lows = container if container.dtype == np.uint16 else _to_array(container)
+            parts.append(lows.astype(np.int64) + (high << 16))
+        return np.concatenate(parts) if parts else np.empty(0, dtype=np.int64)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(c.nbytes for c in self._chunks.values())
+
+
+def _value_key(value: Any) -> tuple[str, Any]:
+    # Matches are type-strict: True is not 1 and "1" is not 1.
+    return (type(value).__name__, value)
+
+
+def _posting_keys(field: str, value: Any) -> set[tuple[str, bool, tuple[str, Any]]]:
+    """(field, is_array_element, typed value) keys a metadata value is indexed under."""
+
+    if isinstance(value, list):
+        return {(field, True, _value_key(element)) for element in value}
+    if value is None:
+        return set()
+    return {(field, False, _value_key(value))}
+
+
+class FacetIndex:
+    """(field, value) -> bitmap of rows, maintained incrementally."""
+
+    def __init__(self, fields: Sequence[str] | None = None) -> None:
+        self.fields = set(fields) if fields is not None else None
+        self._rows: dict[str, int] = {}
+        self._ids: list[str | None] = []
+        self._free: list[int] = []
+        self._keys: list[set[tuple[str, bool, tuple[str, Any]]]] = []
+        self._postings: dict[tuple[str, bool, tuple[str, Any]], Bitmap] = {}
+        self._live = Bitmap()
+
+    @classmethod
+    def from_collection(
+        cls, collection: Any, fields: Sequence[str] | None = None, batch_size: int = 5000
+    ) -> FacetIndex:
+        """Build an index by paging through every record's metadata.
+
+        Pages are fetched by ID from one sorted ID snapshot rather than with
+        `limit`/`offset`, which rescans earlier rows on every page and skips or
+        repeats rows when writes land mid-scan.
+        """
+
+        index = cls(fields)
+        ids = sorted(collection.get(include=[])["ids"])
+        for start in range(0, len(ids), batch_size):
+            page = collection.get(ids=ids[start : start + batch_size], include=["metadatas"])
+            index.index(page["ids"], page["metadatas"])
+        return index
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    @property
+    def nbytes(self) -> int:
+        """Bytes held by the bitmaps (not counting the ID map)."""
+
+        return self._live.nbytes + sum(b.nbytes for b in self._postings.values())
+
+    # ── Maintenance ──
+
+    def index(self, ids: Sequence[str], metadatas: Sequence[dict[str, Any] | None]) -> None:
+        """Insert records, or replace the indexed metadata of existing ones."""
+
+        if len(ids) != len(metadatas):
+            raise ValueError(f"got {len(ids)} ids for {len(metadatas)} metadatas")
+        added: dict[Any, list[int]] = {}
+        removed: dict[Any, list[int]] = {}
+        new_rows = []
+        for record_id, metadata in zip(ids, metadatas):
+            keys: set[Any] = set()
+            for field, value in (metadata or {}).items():
+                if self.fields is None or field in self.fields:
+                    keys |= _posting_keys(field, value)
+            row = self._rows.get(record_id)
+            if row is None:
+                row = self._free.pop() if self._free else len(self._ids)
+                if row == len(self._ids):
+                    self._ids.append(record_id)
+                    self._keys.append(set())
+                else:
+                    self._ids[row] = record_id
+                self._rows[record_id] = row
+                new_rows.append(row)
+            old = self._keys[row]
+            for key in old - keys:
+                removed.setdefault(key, []).append(row)
+            for key in keys - old:
+                added.setdefault(key, []).append(row)
+            self._keys[row] = keys
+
+        self._live.update(new_rows)
+        for key, rows in removed.items():
+            self._postings[key].difference_update(rows)
+        for key, rows in added.items():
+            self._postings.setdefault(key, Bitmap()).update(rows)
+        self._drop_empty(removed)
+
+    def remove(self, ids: Iterable[str]) -> None:
+        """Forget records; unknown IDs are ignored."""
+
+        removed: dict[Any, list[int]] = {}
+        rows = []
+        for record_id in ids:
+            row = self._rows.pop(record_id, None)
+            if row is None:
+                continue
+            for key in self._keys[row]:
+                removed.setdefault(key, []).append(row)
+            self._keys[row] = set()
+            self._ids[row] = None
+            self._free.append(row)
+            rows.append(row)
+        self._live.difference_update(rows)
+        for key, key_rows in removed.items():
+            self._postings[key].difference_update(key_rows)
+        self._drop_empty(removed)
+
+    def _drop_empty(self, keys: Iterable[Any]) -> None:
+        for key in keys:
+            if not self._postings[key]._chunks:
+                del self._postings[key]
+
+    # ── Queries ──
+
+    def _posting(self, key: Any) -> Bitmap:
+        return self._postings.get(key) or Bitmap()
+
+    def _eq(self, field: str, value: Any) -> Bitmap:
+        if isinstance(value, (bool, str)):
+            return self._posting((field, False, _value_key(value)))
+        # Integer values are compared with the operand truncated, floats with it as a float.
+        return self._posting((field, False, ("int", int(value)))) | self._posting(
+            (field, False, ("float", float(value)))
+        )
+
+    def _check_field(self, field: str) -> None:
+        if self.fields is not None and field not in self.fields:
+            raise ValueError(f"field {field!r} is not indexed")
+
+    def _eval(self, node: Any) -> Bitmap:
+        kind = node[0]
+        if kind in ("and", "or"):
+            children = [self._eval(child) for child in node[1]]
+            if kind == "and":
+                children.sort(key=len)
+            result = children[0]
+            for child in children[1:]:
+                result = result & child if kind == "and" else result | child
+            return result
+
+        _, field, op, value = node
+        self._check_field(field)
+        if op in ("$contains", "$not_contains"):
+            if isinstance(value, list):
+                raise ValueError(f"{field}: {op} expects a single value, got {value!r}")
+            match = self._posting((field, True, _value_key(value)))
+            return match if op == "$contains" else self._live - match
+        if op in ("$eq", "$ne"):
+            match = self._eq(field, value)
+            return match if op == "$eq" else self._live - match
+        if op in ("$in", "$nin"):
+            match = Bitmap()
+            for item in value:
+                match = match | self._eq(field, item)
+            return match if op == "$in" else self._live - match
+        raise ValueError(f"{field}: {op} is not supported by the facet index; use get(where=...)")
+
+    def match(self, where: dict[str, Any] | None = None) -> Bitmap:
+        """Bitmap of the rows matching `where` (all rows for `None`)."""
+
+        return self._live if not where else self._eval(parse_where(where))
+
+    def count(self, where: dict[str, Any] | None = None) -> int:
+        return len(self.match(where))
+
+    def ids(self, where: dict[str, Any] | None = None) -> list[str]:
+        """Matching record IDs, e.g. as candidates for `query(ids=...)`."""
+
+        ids = self._ids
+        return [ids[row] for row in self.match(where).to_array()]
+
+    def facet_counts(
+        self, field: str, where: dict[str, Any] | None = None, top: int | None = None
+    ) -> dict[Any, int]:
+        """Count of matching records per value of `field`, largest first.
+
+        Array elements and scalar values of the same field are counted
+        together, so a record is counted once per distinct value it has.
+        """
+
+        self._check_field(field)
+        base = self.match(where) if where else None
+        by_value: dict[tuple[str, Any], Bitmap] = {}
+        for key, bitmap in self._postings.items():
+            if key[0] == field:
+                existing = by_value.get(key[2])
+                by_value[key[2]] = bitmap if existing is None else existing | bitmap
+        counts = {}
+        for (_, value), bitmap in by_value.items():
+            size = len(bitmap if base is None else bitmap & base)
+            if size:
+                counts[value] = size
+        ordered = sorted(counts.items(), key=lambda item: (-item[1], str(item[0])))
+        return dict(ordered[:top] if top is not None else ordered)
+
+
+class IndexedCollection:
+    """A collection plus a `FacetIndex` that follows writes made through it.
+
+    `upsert()` and `update()` merge metadata server-side, so after those the
+    stored metadata is read back before reindexing. Writes made through other
+    handles are not seen; rebuild with `FacetIndex.from_collection()`.
+    """
+
+    def __init__(self, collection: Any, fields: Sequence[str] | None = None, batch_size: int = 5000) -> None:
+        self.collection = collection
+        self.index = FacetIndex.from_collection(collection, fields, batch_size)
+
+    def add(self, ids: list[str], metadatas: list[dict[str, Any] | None] | None = None, **kwargs: Any) -> None:
+        self.collection.add(ids=ids, metadatas=metadatas, **kwargs)
+        self.index.index(ids, metadatas or [None] * len(ids))
+
+    def _refresh(self, ids: list[str]) -> None:
+        stored = self.collection.get(ids=ids, include=["metadatas"])
+        self.index.index(stored["ids"], stored["metadatas"])
+
+    def upsert(self, ids: list[str], **kwargs: Any) -> None:
+        self.collection.upsert(ids=ids, **kwargs)
+        self._refresh(ids)
+
+    def update(self, ids: list[str], **kwargs: Any) -> None:
+        self.collection.update(ids=ids, **kwargs)
+        self._refresh(ids)
+
+    def delete(
+        self,
+        ids: list[str] | None = None,
+        where: dict[str, Any] | None = None,
+        where_document: dict[str, Any] | None = None,
+    ) -> None:
+        if where is not None or where_document is not None:
+            ids = self.collection.get(ids=ids, where=where, where_document=where_document, include=[])["ids"]
+            if not ids:
+                return
+        self.collection.delete(ids=ids)
+        self.index.remove(ids or [])
+
+    def facet_counts(self, field: str, where: dict[str, Any] | None = None, top: int | None = None) -> dict[Any, int]:
+        return self.index.facet_counts(field, where, top)
+
+
+# ── Benchmark ──
+
+AUTHORS = [f"author-{i:03d}" for i in range(200)]
+TOPICS = [
+    "ml", "healthcare", "quantum", "cryptography", "energy", "climate", "training", "robotics",
+    "vision", "nlp", "security", "storage", "networks", "biology", "finance", "materials",
+]
+
+
+def _random_metadata(rng: random.Random) -> dict[str, Any]:
+    return {
+        "category": rng.choice(["ml", "quantum", "energy", "systems"]),
+        "authors": rng.sample(AUTHORS, rng.randint(1, 4)),
+        "topics": rng.sample(TOPICS, rng.randint(1, 3)),
+        "review_scores": [rng.randint(5, 10) for _ in range(3)],
+    }
+
+
+def _server_counts(collection: Any, field: str, values: Iterable[Any], where: dict[str, Any] | None) -> dict[Any, int]:
+    counts = {}
+    for value in values:
+        clause = {field: {"$contains": value}}
+        filter_ = {"$and": [clause, where]} if where else clause
+        size = len(collection.get(where=filter_, include=[])["ids"])
+        if size:
+            counts[value] = size
+    return counts
+
+
+def _check(indexed: IndexedCollection, where: dict[str, Any] | None) -> None:
+    expected = _server_counts(indexed.collection, "topics", TOPICS, where)
+    actual = indexed.facet_counts("topics", where=where)
+    if expected != actual:
+        raise AssertionError(f"facet counts differ for {where}: {expected} vs {actual}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark bitmap facet counts against get(where=...).")
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    bitmap = Bitmap(range(0, 200_000, 3))
+    other = Bitmap(range(0, 200_000, 5))
+    if len(bitmap & other) != len(range(0, 200_000, 15)) or 15 not in bitmap & other:
+        raise AssertionError("bitmap intersection is wrong")
+    if len(bitmap | other) != len(set(range(0, 200_000, 3)) | set(range(0, 200_000, 5))):
+        raise AssertionError("bitmap union is wrong")
+
+    rng = random.Random(0)
+    client = chromadb.EphemeralClient()
+    try:
+        client.delete_collection("facet_index_bench")
+    except Exception:
+        pass
+    collection = client.create_collection("facet_index_bench", embedding_function=None)
+    batch_size = client.get_max_batch_size()
+    for start in range(0, args.rows, batch_size):
+        end = min(start + batch_size, args.rows)
+        collection.add(
+            ids=[f"doc-{i}" for i in range(start, end)],
+            embeddings=[[rng.random(), rng.random(), rng.random()] for _ in range(start, end)],
+            metadatas=[_random_metadata(rng) for _ in range(start, end)],
+        )
+
+    started = time.perf_counter()
+    indexed = IndexedCollection(collection, fields=["category", "authors", "topics", "review_scores"])
+    build_secs = time.perf_counter() - started
+    print(
+        f"indexed {len(indexed.index):,} records in {build_secs:.1f}s, "
+        f"bitmaps={indexed.index.nbytes / 1e6:.1f} MB"
+    )
+
+    filters = [None, {"authors": {"$contains": "author-007"}}, {"category": {"$in": ["ml", "energy"]}}]
+    for where in filters:
+        _check(indexed, where)
+
+    updated = [f"doc-{i}" for i in range(0, min(args.rows, 5000), 7)]
+    indexed.upsert(
+        ids=updated,
+        embeddings=[[0.5, 0.5, 0.5]] * len(updated),
+        metadatas=[{"topics": ["ml", "robotics"], "authors": ["author-007"]} for _ in updated],
+    )
+    indexed.delete(where={"$and": [{"topics": {"$contains": "finance"}}, {"category": "systems"}]})
+    indexed.add(
+        ids=["doc-new-1", "doc-new-2"],
+        embeddings=[[0.1, 0.1, 0.1], [0.2, 0.2, 0.2]],
+        metadatas=[{"topics": ["vision"], "category": "ml"}, {"topics": ["vision", "nlp"]}],
+    )
+    for where in filters + [{"topics": {"$not_contains": "ml"}}]:
+        _check(indexed, where)
+    print("incremental add/upsert/delete: facet counts match get(where=...)")
+
+    candidates = indexed.index.ids({"$and": [{"topics": {"$contains": "vision"}}, {"category": "ml"}]})
+    via_ids = collection.query(query_embeddings=[[0.2, 0.2, 0.2]], ids=candidates, n_results=5, include=[])
+    via_where = collection.query(
+        query_embeddings=[[0.2, 0.2, 0.2]],
+        where={"$and": [{"topics": {"$contains": "vision"}}, {"category": "ml"}]},
+        n_results=5,
+        include=[],
+    )
+    if set(via_ids["ids"][0]) - set(candidates) or len(via_ids["ids"][0]) != len(via_where["ids"][0]):
+        raise AssertionError("query(ids=candidates) disagrees with query(where=...)")
+
+    for where in filters:
+        started = time.perf_counter()
+        for _ in range(args.repeats):
+            _server_counts(collection, "topics", TOPICS, where)
+        server_ms = (time.perf_counter() - started) / args.repeats * 1000
+        started = time.perf_counter()
+        for _ in range(args.repeats):
+            indexed.facet_counts("topics", where=where)
+        local_ms = (time.perf_counter() - started) / args.repeats * 1000
+        print(
+            f"topic facet counts where={where}: {len(TOPICS)} get() calls={server_ms:9.1f}ms "
+            f"bitmap={local_ms:7.2f}ms ({server_ms / local_ms:,.0f}x)"
+        )
+
+    print("\npython: facet index example passed")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,580 @@
+"""Compile Chroma `where` / `where_document` filters into a canonical form.
+
+The filters in `filter_examples.py` are written by hand. This module turns any
+such dict into a canonical, cached form before it is sent to Chroma:
+
+- validates operators and operand types;
+- rewrites shorthand (`{"category": "ml"}`) to explicit `$eq` and multi-key
+  dicts to `$and`;
+- flattens nested `$and`/`$or`, drops duplicate clauses and unwraps
+  single-clause groups;
+- merges `$eq`/`$in` checks on the same field inside `$or` into one `$in`,
+  and intersects them inside `$and`;
+- detects filters that can never match (`x == a AND x == b`, empty ranges,
+  `$in: []`, `$contains` together with `$not_contains` of the same value) so
+  the query can be skipped without a round trip;
+- given per-field statistics from a collection sample, estimates the
+  selectivity of each clause and puts the most selective ones first.
+
+Usage:
+    from filter_compiler import FilterCompiler, collect_stats
+
+    compiler = FilterCompiler(stats=collect_stats(collection))
+    result = compiler.get(collection, where={"$or": [{"category": "ml"}, {"category": "quantum"}]})
+
+Run the benchmark on the filter_examples dataset scaled up (local, no server):
+    python filter_compiler.py --rows 1000000
+"""
+
+from __future__ import annotations
+
+import argparse
+import bisect
+import json
+import random
+import time
+from collections import Counter, OrderedDict
+from dataclasses import dataclass, field
+from typing import Any
+
+import chromadb
+
+COMPARISON_OPS = {"$eq", "$ne", "$gt", "$gte", "$lt", "$lte", "$in", "$nin", "$contains", "$not_contains"}
+LOGICAL_OPS = {"$and", "$or"}
+DOCUMENT_OPS = {"$contains", "$not_contains", "$regex", "$not_regex"}
+RANGE_OPS = {"$gt", "$gte", "$lt", "$lte"}
+SCALAR_TYPES = (str, int, float, bool)
+
+NEVER = "never"
+
+
+@dataclass
+class FieldStats:
+    """Value distribution of one metadata field in a collection sample."""
+
+    rows: int = 0  # sampled rows
+    present: int = 0  # sampled rows carrying this field
+    values: Counter = field(default_factory=Counter)  # rows per (array element) value
+    numbers: list[float] = field(default_factory=list)  # sorted numeric values
+
+    @property
+    def fraction_present(self) -> float:
+        return self.present / self.rows if self.rows else 0.5
+
+    def fraction_eq(self, value: Any) -> float:
+        if not self.rows:
+            return 0.5
+        count = self.values.get(_key(value), 0)
+        # Unseen values are rare, but not impossible outside the sample.
+        return max(count, 0.5) / self.rows
+
+    def fraction_range(self, op: str, value: float) -> float:
+        if not self.numbers:
+            return 0.5
+        if op in ("$gt", "$lte"):
+            below = bisect.bisect_right(self.numbers, value)
+        else:
+            below = bisect.bisect_left(self.numbers, value)
+        under = below / len(self.numbers)
+        return (1 - under if op in ("$gt", "$gte") else under) * self.fraction_present
+
+
+def _key(value: Any) -> tuple[str, Any]:
+    # Keep True and 1 apart; Chroma does not treat booleans as numbers.
+    if isinstance(value, bool):
+        return ("bool", value)
+    if isinstance(value, (int, float)):
+        return ("num", value)
+    return ("str", value)
+
+
+def collect_stats(collection: Any, sample_size: int = 10_000, seed: int = 0) -> dict[str, FieldStats]:
+    """Sample up to `sample_size` records and collect per-field value statistics."""
+
+    ids = collection.get(include=[])["ids"]
+    if len(ids) > sample_size:
+        ids = random.Random(seed).sample(ids, sample_size)
+    stats: dict[str, FieldStats] = {}
+    for start in range(0, len(ids), 1000):
+        batch = collection.get(ids=ids[start : start + 1000], include=["metadatas"])
+        for metadata in batch["metadatas"]:
+            for name, value in (metadata or {}).items():
+                field_stats = stats.setdefault(name, FieldStats())
+                field_stats.present += 1
+                items = value if isinstance(value, list) else [value]
+                for item in set(_key(v) for v in items):
+                    field_stats.values[item] += 1
+                    if item[0] == "num":
+                        field_stats.numbers.append(float(item[1]))
+    for field_stats in stats.values():
+        field_stats.numbers.sort()
+        field_stats.rows = len(ids)
+    return stats
+
+
+# ── Parsing and validation ──
+
+
+def _check_scalar(value: Any, context: str) -> None:
+    if not isinstance(value, SCALAR_TYPES):
+        raise ValueError(f"{context}: expected str, int, float or bool, got {value!r}")
+
+
+def parse_where(where: Any) -> Any:
+    """Validate a `where` dict and return it as a tuple tree of `cmp`/`and`/`or` nodes."""
+
+    if not isinstance(where, dict) or not where:
+        raise ValueError(f"Expected where to be a non-empty dict, got {where!r}")
+    if len(where) > 1:
+        return ("and", [parse_where({k: v}) for k, v in where.items()])
+
+    (key, value), = where.items()
+    if key in LOGICAL_OPS:
+        if not isinstance(value, list) or not value:
+            raise ValueError(f"Expected {key} to be a non-empty list, got {value!r}")
+        return (key[1:], [parse_where(clause) for clause in value])
+    if key.startswith("$"):
+        raise ValueError(f"Unknown logical operator {key}")
+
+    if not isinstance(value, dict):
+        _check_scalar(value, key)
+        return ("cmp", key, "$eq", value)
+    if len(value) != 1:
+        return ("and", [parse_where({key: {op: v}}) for op, v in value.items()])
+
+    (op, operand), = value.items()
+    if op not in COMPARISON_OPS:
+        raise ValueError(f"{key}: unknown operator {op}")
+    if op in ("$in", "$nin"):
+        if not isinstance(operand, list):
+            raise ValueError(f"{key}: {op} expects a list, got {operand!r}")
+        for item in operand:
+            _check_scalar(item, key)
+        return ("cmp", key, op, tuple(operand))
+    _check_scalar(operand, key)
+    if op in RANGE_OPS and isinstance(operand, (bool, str)):
+        raise ValueError(f"{key}: {op} expects a number, got {operand!r}")
+    return ("cmp", key, op, operand)
+
+
+def parse_document(where_document: Any) -> Any:
+    """Validate a `where_document` dict and return it as a tuple tree of `doc`/`and`/`or` nodes."""
+
+    if not isinstance(where_document, dict) or len(where_document) != 1:
+        raise ValueError(f"Expected where_document to have exactly one operator, got {where_document!r}")
+    (op, value), = where_document.items()
+    if op in LOGICAL_OPS:
+        if not isinstance(value, list) or not value:
+            raise ValueError(f"Expected {op} to be a non-empty list, got {value!r}")
+        return (op[1:], [parse_document(clause) for clause in value])
+    if op not in DOCUMENT_OPS:
+        raise ValueError(f"Unknown where_document operator {op}")
+    if not isinstance(value, str) or not value:
+        raise ValueError(f"{op} expects a non-empty string, got {value!r}")
+    return ("doc", op, value)
+
+
+# ── Normalization ──
+
+
+def _sort_key(node: Any) -> str:
+    return json.dumps(_emit(node), sort_keys=True, default=str)
+
+
+def _merge_or(field: str, clauses: list[Any]) -> list[Any]:
+    """`x == a OR x == b OR x in [c]` -> `x in [a, b, c]`."""
+
+    # Chroma requires every $in value to have the same type, so merge per type.
+    by_type: dict[str, dict[Any, Any]] = {}
+    for _, _, op, value in clauses:
+        for item in value if op == "$in" else [value]:
+            by_type.setdefault(type(item).__name__, {})[item] = item
+    out = []
+    for _, values in sorted(by_type.items()):
+        unique = sorted(values)
+        if len(unique) == 1:
+            out.append(("cmp", field, "$eq", unique[0]))
+        else:
+            out.append(("cmp", field, "$in", tuple(unique)))
+    return out
+
+
+def _merge_and(field: str, clauses: list[Any]) -> list[Any] | str:
+    """Intersect equality/membership and range checks on one field."""
+
+    # Chroma truncates float operands when comparing them with integer values
+    # ({"$eq": 2023.5} matches 2023), so only reason about non-float operands.
+    operands = [v for c in clauses for v in (c[3] if isinstance(c[3], tuple) else [c[3]])]
+    if any(isinstance(v, float) for v in operands):
+        return clauses
+
+    allowed: set | None = None
+    excluded: set = set()
+    lower: tuple[float, bool] | None = None  # (bound, inclusive)
+    upper: tuple[float, bool] | None = None
+    contains: set = set()
+    not_contains: set = set()
+    rest: list[Any] = []
+
+    for clause in clauses:
+        _, _, op, value = clause
+        if op in ("$eq", "$in"):
+            keys = {_key(v) for v in (value if op == "$in" else [value])}
+            allowed = keys if allowed is None else allowed & keys
+        elif op in ("$ne", "$nin"):
+            excluded |= {_key(v) for v in (value if op == "$nin" else [value])}
+        elif op in ("$gt", "$gte"):
+            bound = (float(value), op == "$gte")
+            if lower is None or bound[0] > lower[0] or (bound[0] == lower[0] and not bound[1]):
+                lower = bound
+            rest.append(clause)
+        elif op in ("$lt", "$lte"):
+            bound = (float(value), op == "$lte")
+            if upper is None or bound[0] < upper[0] or (bound[0] == upper[0] and not bound[1]):
+                upper = bound
+            rest.append(clause)
+        elif op == "$contains":
+            contains.add(_key(value))
+            rest.append(clause)
+        else:
+            not_contains.add(_key(value))
+            rest.append(clause)
+
+    if contains & not_contains:
+        return NEVER
+    if lower and upper and (lower[0] > upper[0] or (lower[0] == upper[0] and not (lower[1] and upper[1]))):
+        return NEVER
+
+    out: list[Any] = []
+    if allowed is not None:
+        def in_range(key: tuple[str, Any]) -> bool:
+            kind, v = key
+            if kind != "num":
+                return lower is None and upper is None
+            if lower and (v < lower[0] or (v == lower[0] and not lower[1])):
+                return False
+            if upper and (v > upper[0] or (v == upper[0] and not upper[1])):
+                return False
+            return True
+
+        remaining = sorted(k for k in allowed - excluded if in_range(k))
+        if not remaining:
+            return NEVER
+        if len(remaining) == 1:
+            out.append(("cmp", field, "$eq", remaining[0][1]))
+        else:
+            out.append(("cmp", field, "$in", tuple(v for _, v in remaining)))
+        # Ranges are implied by the explicit value set.
+        rest = [c for c in rest if c[2] not in RANGE_OPS]
+    elif excluded:
+        # Like $in, a $nin list must be single-typed: emit one $ne / $nin per type.
+        by_type: dict[str, list[Any]] = {}
+        for _, v in sorted(excluded):
+            by_type.setdefault(type(v).__name__, []).append(v)
+        for _, values in sorted(by_type.items()):
+            out.append(("cmp", field, "$ne", values[0]) if len(values) == 1 else ("cmp", field, "$nin", tuple(values)))
+
+    # Keep only the tightest bound on each side.
+    for clause in rest:
+        _, _, op, value = clause
+        if op in ("$gt", "$gte") and (float(value), op == "$gte") != lower:
+            continue
+        if op in ("$lt", "$lte") and (float(value), op == "$lte") != upper:
+            continue
+        out.append(clause)
+    return out
+
+
+def _normalize(node: Any) -> Any:
+    kind = node[0]
+    if kind in ("cmp", "doc"):
+        if kind == "cmp" and node[2] == "$in" and not node[3]:
+            return NEVER
+        return node
+
+    children: list[Any] = []
+    for child in (_normalize(c) for c in node[1]):
+        if child == NEVER:
+            if kind == "and":
+                return NEVER
+            continue
+        # Flatten nested groups of the same kind.
+        children.extend(child[1] if child[0] == kind else [child])
+    if not children:
+        return NEVER
+
+    by_field: dict[str, list[Any]] = {}
+    others: list[Any] = []
+    for child in children:
+        if child[0] == "cmp" and (kind == "and" or child[2] in ("$eq", "$in")):
+            by_field.setdefault(child[1], []).append(child)
+        else:
+            others.append(child)
+    for name, clauses in by_field.items():
+        merged = _merge_and(name, clauses) if kind == "and" else _merge_or(name, clauses)
+        if merged == NEVER:
+            return NEVER
+        others.extend(merged)
+    if kind == "and":
+        docs = {c[2] for c in others if c[0] == "doc" and c[1] == "$contains"}
+        if any(c[0] == "doc" and c[1] == "$not_contains" and c[2] in docs for c in others):
+            return NEVER
+
+    unique = list({_sort_key(c): c for c in others}.values())
+    if len(unique) == 1:
+        return unique[0]
+    return (kind, sorted(unique, key=_sort_key))
+
+
+def _emit(node: Any) -> dict[str, Any]:
+    kind = node[0]
+    if kind == "cmp":
+        _, name, op, value = node
+        return {name: {op: list(value) if isinstance(value, tuple) else value}}
+    if kind == "doc":
+        return {node[1]: node[2]}
+    return {f"${kind}": [_emit(child) for child in node[1]]}
+
+
+# ── Selectivity ──
+
+
+def estimate(node: Any, stats: dict[str, FieldStats]) -> float:
+    """Estimated fraction of rows matching `node` (independence assumed)."""
+
+    kind = node[0]
+    if kind == "doc":
+        return 0.5
+    if kind == "and":
+        out = 1.0
+        for child in node[1]:
+            out *= estimate(child, stats)
+        return out
+    if kind == "or":
+        miss = 1.0
+        for child in node[1]:
+            miss *= 1 - estimate(child, stats)
+        return 1 - miss
+
+    _, name, op, value = node
+    field_stats = stats.get(name)
+    if field_stats is None:
+        return 0.5
+    present = field_stats.fraction_present
+    if op in ("$eq", "$contains"):
+        return field_stats.fraction_eq(value)
+    if op in ("$ne", "$not_contains"):
+        return max(present - field_stats.fraction_eq(value), 0.0)
+    if op == "$in":
+        return min(sum(field_stats.fraction_eq(v) for v in value), 1.0)
+    if op == "$nin":
+        return max(present - sum(field_stats.fraction_eq(v) for v in value), 0.0)
+    return field_stats.fraction_range(op, value)
+
+
+def _reorder(node: Any, stats: dict[str, FieldStats]) -> Any:
+    if node[0] not in ("and", "or"):
+        return node
+    children = [_reorder(child, stats) for child in node[1]]
+    # Most selective first for $and; most likely match first for $or.
+    children.sort(key=lambda c: estimate(c, stats), reverse=node[0] == "or")
+    return (node[0], children)
+
+
+# ── Public API ──
+
+
+@dataclass(frozen=True)
+class CompiledFilter:
+    """Result of compiling a `where` / `where_document` pair."""
+
+    where: dict[str, Any] | None
+    where_document: dict[str, Any] | None
+    never_matches: bool
+    selectivity: float | None = None
+
+
+class FilterCompiler:
+    """Compiles filters and caches the results by their canonical structure."""
+
+    def __init__(self, stats: dict[str, FieldStats] | None = None, cache_size: int = 1024) -> None:
+        self.stats = stats
+        self.cache_size = cache_size
+        self._cache: OrderedDict[str, CompiledFilter] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def compile(
+        self, where: dict[str, Any] | None = None, where_document: dict[str, Any] | None = None
+    ) -> CompiledFilter:
+        key = json.dumps([where, where_document], sort_keys=True, default=str)
+        cached = self._cache.get(key)
+        if cached is not None:
+            self.hits += 1
+            self._cache.move_to_end(key)
+            return cached
+        self.misses += 1
+
+        where_node = _normalize(parse_where(where)) if where else None
+        doc_node = _normalize(parse_document(where_document)) if where_document else None
+        never = NEVER in (where_node, doc_node)
+        selectivity = None
+        if not never and where_node is not None and self.stats is not None:
+            where_node = _reorder(where_node, self.stats)
+            selectivity = estimate(where_node, self.stats)
+        compiled = CompiledFilter(
+            where=None if never or where_node is None else _emit(where_node),
+            where_document=None if never or doc_node is None else _emit(doc_node),
+            never_matches=never,
+            selectivity=selectivity,
+        )
+        self._cache[key] = compiled
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return compiled
+
+    def get(self, collection: Any, where: Any = None, where_document: Any = None, **kwargs: Any) -> dict:
+        compiled = self.compile(where, where_document)
+        if compiled.never_matches:
+            include = kwargs.get("include", ["metadatas", "documents"])
+            return {"ids": [], "included": include, **{k: [] for k in include}}
+        return collection.get(where=compiled.where, where_document=compiled.where_document, **kwargs)
+
+    def query(self, collection: Any, where: Any = None, where_document: Any = None, **kwargs: Any) -> dict:
+        compiled = self.compile(where, where_document)
+        if compiled.never_matches:
+            count = _query_count(kwargs)
+            include = kwargs.get("include", ["metadatas", "documents", "distances"])
+            return {
+                "ids": [[] for _ in range(count)],
+                "included": include,
+                **{k: [[] for _ in range(count)] for k in include},
+            }
+        return collection.query(where=compiled.where, where_document=compiled.where_document, **kwargs)
+
+
+def _query_count(kwargs: dict[str, Any]) -> int:
+    """Number of queries in a `query()` call; inputs may be NumPy arrays, so no truthiness tests."""
+
+    for name in ("query_embeddings", "query_texts", "query_images", "query_uris"):
+        queries = kwargs.get(name)
+        if queries is None:
+            continue
+        if isinstance(queries, str) or getattr(queries, "ndim", None) == 1:
+            return 1
+        if name == "query_embeddings" and len(queries) > 0 and isinstance(queries[0], (int, float)):
+            return 1  # a single embedding given as a flat list
+        return len(queries)
+    return 1
+
+
+# ── Benchmark ──
+
+CATEGORIES = ["ml", "quantum", "energy", "biology", "finance", "robotics", "climate", "security"]
+AUTHORS = ["Chen", "Okafor", "Patel", "Johansson", "Williams", "Nguyen", "Singh", "Garcia"]
+TEMPLATES = [
+    "Machine learning is transforming healthcare diagnostics.",
+    "Quantum computing may revolutionize cryptography.",
+    "Renewable energy adoption is accelerating worldwide.",
+    "Deep learning models require large datasets for training.",
+]
+
+BENCH_FILTERS = {
+    "or_eq_to_in": {"$or": [{"category": "ml"}, {"category": "quantum"}, {"category": "ml"}]},
+    "nested_and": {
+        "$and": [
+            {"year": {"$gte": 2018}},
+            {"$and": [{"citations": {"$gt": 100}}, {"citations": {"$gt": 250}}]},
+            {"authors": {"$contains": "Chen"}},
+            {"category": {"$in": ["ml", "quantum", "energy"]}},
+            {"category": "ml"},
+        ]
+    },
+    "contradiction": {"$and": [{"category": "ml"}, {"category": "quantum"}]},
+    "empty_range": {"$and": [{"year": {"$gt": 2023}}, {"year": {"$lt": 2020}}]},
+}
+
+
+def _seed(collection: Any, rows: int, batch_size: int) -> None:
+    rng = random.Random(0)
+    for start in range(0, rows, batch_size):
+        end = min(start + batch_size, rows)
+        collection.add(
+            ids=[f"doc-{i}" for i in range(start, end)],
+            documents=[TEMPLATES[i % len(TEMPLATES)] for i in range(start, end)],
+            embeddings=[[rng.random(), rng.random(), rng.random()] for _ in range(start, end)],
+            metadatas=[
+                {
+                    "category": rng.choice(CATEGORIES),
+                    "year": rng.randint(2010, 2025),
+                    "citations": rng.randint(0, 400),
+                    "authors": rng.sample(AUTHORS, 2),
+                    "review_scores": [rng.randint(5, 10) for _ in range(3)],
+                }
+                for _ in range(start, end)
+            ],
+        )
+
+
+def _latency(fn: Any, repeats: int) -> float:
+    started = time.perf_counter()
+    for _ in range(repeats):
+        fn()
+    return (time.perf_counter() - started) / repeats * 1000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark compiled vs hand-written filters.")
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--repeats", type=int, default=20)
+    args = parser.parse_args()
+
+    compiler = FilterCompiler()
+    compiled = compiler.compile({"category": "ml", "year": {"$gte": 2020, "$lte": 2024}})
+    expected = {"$and": [{"category": {"$eq": "ml"}}, {"year": {"$gte": 2020}}, {"year": {"$lte": 2024}}]}
+    if compiled.where != expected:
+        raise AssertionError(f"unexpected canonical form: {compiled.where}")
+    if compiler.compile(**{"where": {"category": "ml", "year": {"$gte": 2020, "$lte": 2024}}}) is not compiled:
+        raise AssertionError("expected a cache hit")
+    for name in ("contradiction", "empty_range"):
+        if not compiler.compile(BENCH_FILTERS[name]).never_matches:
+            raise AssertionError(f"{name} should never match")
+    mixed = compiler.compile({"$and": [{"x": {"$ne": "a"}}, {"x": {"$ne": 1}}, {"x": {"$ne": "b"}}]})
+    if mixed.where != {"$and": [{"x": {"$ne": 1}}, {"x": {"$nin": ["a", "b"]}}]}:
+        raise AssertionError(f"mixed-type exclusions must stay single-typed: {mixed.where}")
+
+    client = chromadb.EphemeralClient()
+    try:
+        client.delete_collection("filter_compiler_bench")
+    except Exception:
+        pass
+    collection = client.create_collection("filter_compiler_bench", embedding_function=None)
+    _seed(collection, args.rows, client.get_max_batch_size())
+
+    compiler = FilterCompiler(stats=collect_stats(collection))
+    query = [[0.1, 0.2, 0.3]]
+    for name, where in BENCH_FILTERS.items():
+        compiled = compiler.compile(where)
+        raw_ms = _latency(
+            lambda: collection.query(query_embeddings=query, n_results=10, where=where), args.repeats
+        )
+        compiled_ms = _latency(
+            lambda: compiler.query(collection, where=where, query_embeddings=query, n_results=10),
+            args.repeats,
+        )
+        raw_ids = set(collection.get(where=where, include=[])["ids"])
+        compiled_ids = set(compiler.get(collection, where=where, include=[])["ids"])
+        if raw_ids != compiled_ids:
+            raise AssertionError(f"{name}: compiled filter changed the result set")
+        print(
+            f"{name:<14} raw={raw_ms:8.2f}ms compiled={compiled_ms:8.2f}ms "
+            f"est_selectivity={compiled.selectivity if compiled.selectivity is not None else 0:.4f} "
+            f"-> {json.dumps(compiled.where)}"
+        )
+    print(f"compile cache: hits={compiler.hits} misses={compiler.misses}")
+
+    print("\npython: filter compiler example passed")
+
+
+if __name__ == "__main__":
+    main()
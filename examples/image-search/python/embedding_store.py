@@ -0,0 +1,455 @@
+"""Persistent, memory-mapped embedding store keyed by image content.
+
+`image_search.py` wipes its database and re-embeds every image on each run,
+and the same thing happens whenever a collection is rebuilt or cloned. On CPU,
+OpenCLIP inference is by far the most expensive step of indexing. An
+`EmbeddingStore` remembers every embedding it has computed, keyed by
+(model name + checkpoint, SHA-256 of the image file bytes), so an unchanged
+image is embedded once per model no matter how many collections it ends up in.
+
+On disk, each model gets its own directory holding:
+
+- `vectors-<generation>.f32`: append-only float32 rows, read through `np.memmap`;
+- `keys-<generation>.bin`: append-only index of (32-byte digest, int64 row)
+  records, where row -1 marks a discarded key. It is loaded into a dict on open;
+- `meta.json`: the model id, the dimension and the current generation.
+
+Vectors are appended before their index records, and any partial trailing
+record is ignored on open, so a crash never leaves a key pointing at a
+half-written row. `compact()` rewrites only the live rows into the next
+generation and then switches `meta.json` atomically. Use one writing process
+per store.
+
+`HashingImageLoader` and `CachedOpenCLIPEmbeddingFunction` drop into the usual
+`ImageLoader` + `OpenCLIPEmbeddingFunction` pair. The loader tags each decoded
+image with the SHA-256 of its file, and the embedding function looks the digest
+up before running inference. `image_ingest.ingest_images(..., store=...)` skips
+decoding as well for images the store already holds.
+
+Usage:
+    from embedding_store import build_cached_openclip_components
+
+    embedding_function, image_loader = build_cached_openclip_components("./embedding_store")
+    collection = client.create_collection(
+        "images", embedding_function=embedding_function, data_loader=image_loader
+    )
+    collection.add(ids=ids, uris=uris)          # only unseen images reach the model
+    print(embedding_function.store.stats)       # hits, misses, hit rate
+
+Rebuild a collection from a warm store vs re-embedding (`--random-weights`
+saves a seeded random checkpoint instead of downloading one):
+    python embedding_store.py --images 256 --random-weights
+"""
+
+from __future__ import annotations
+
+import argparse
+import hashlib
+import io
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Iterable, Sequence
+
+import numpy as np
+
+from image_search import _build_openclip_components
+from openclip_registry import SharedOpenCLIPEmbeddingFunction
+
+try:
+    from chromadb.utils.data_loaders import ImageLoader
+except ImportError as exc:
+    raise SystemExit(
+        "Missing optional image-search dependencies. From this directory, install with:\n"
+        "  pip install -r requirements.txt"
+    ) from exc
+
+_RECORD = np.dtype([("digest", "V32"), ("row", "<i8")])
+
+
+@dataclass
+class StoreStats:
+    hits: int = 0
+    misses: int = 0
+    appended: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def __str__(self) -> str:
+        return f"hits={self.hits} misses={self.misses} hit_rate={self.hit_rate:.1%} appended={self.appended}"
+
+
+def content_digest(data: bytes) -> bytes:
+    return hashlib.sha256(data).digest()
+
+
+def openclip_model_id(model_name: str, checkpoint: str) -> str:
+    return f"open_clip:{model_name}:{checkpoint}"
+
+
+class EmbeddingStore:
+    """Append-only float32 embeddings for one model, keyed by content digest."""
+
+    def __init__(self, path: str | Path, model_id: str) -> None:
+        self.model_id = model_id
+        self.path = Path(path) / hashlib.sha256(model_id.encode()).hexdigest()[:16]
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.stats = StoreStats()
+        self._lock = threading.Lock()
+        self._rows: dict[bytes, int] = {}
+        self._index_records = 0
+        self._view: np.ndarray | None = None
+        self._vectors_file: Any = None
+        self._keys_file: Any = None
+
+        meta_path = self.path / "meta.json"
+        if meta_path.exists():
+            meta = json.loads(meta_path.read_text())
+            if meta["model"] != model_id:
+                raise ValueError(f"{self.path} holds embeddings for {meta['model']!r}, not {model_id!r}")
+            self.dim: int | None = meta["dim"]
+            self.generation: int = meta["generation"]
+        else:
+            self.dim, self.generation = None, 0
+        self._open()
+
+    # ── Files ──
+
+    def _file(self, kind: str, generation: int | None = None) -> Path:
+        generation = self.generation if generation is None else generation
+        suffix = "f32" if kind == "vectors" else "bin"
+        return self.path / f"{kind}-{generation}.{suffix}"
+
+    def _write_meta(self) -> None:
+        tmp = self.path / "meta.json.tmp"
+        tmp.write_text(json.dumps({"model": self.model_id, "dim": self.dim, "generation": self.generation}))
+        tmp.replace(self.path / "meta.json")
+
+    def _open(self) -> None:
+        vectors_path, keys_path = self._file("vectors"), self._file("keys")
+        self._vector_rows = 0
+        if self.dim is not None and vectors_path.exists():
+            self._vector_rows = vectors_path.stat().st_size // (self.dim * 4)
+            # Drop a partially written trailing row left by a crash.
+            os.truncate(vectors_path, self._vector_rows * self.dim * 4)
+        records = np.fromfile(keys_path, dtype=_RECORD) if keys_path.exists() else np.empty(0, _RECORD)
+        # Index records are written after their vectors; ignore any that point past the end.
+        valid = len(records)
+        while valid and records[valid - 1]["row"] >= self._vector_rows:
+            valid -= 1
+        if keys_path.exists():
+            os.truncate(keys_path, valid * _RECORD.itemsize)
+        self._rows.clear()
+        for digest, row in zip(records["digest"][:valid].tolist(), records["row"][:valid].tolist()):
+            if row < 0:
+                self._rows.pop(digest, None)
+            else:
+                self._rows[digest] = row
+        self._index_records = valid
+        self._view = None
+        self._vectors_file = open(vectors_path, "ab")
+        self._keys_file = open(keys_path, "ab")
+
+    def _vectors(self, row: int) -> np.ndarray:
+        # The file only grows, so remap once a row lands past the current mapping.
+        if self._view is None or row >= len(self._view):
+            self._view = np.memmap(self._file("vectors"), dtype=np.float32, mode="r").reshape(-1, self.dim)
+        return self._view
+
+    def close(self) -> None:
+        with self._lock:
+            for handle in (self._vectors_file, self._keys_file):
+                if handle is not None:
+                    handle.close()
+            self._vectors_file = self._keys_file = self._view = None
+
+    # ── Lookups and appends ──
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def __contains__(self, digest: bytes) -> bool:
+        return digest in self._rows
+
+    @property
+    def garbage_ratio(self) -> float:
+        """Fraction of stored vector rows no key points at; compact when this grows large."""
+
+        return 1 - len(self._rows) / self._vector_rows if self._vector_rows else 0.0
+
+    def get_many(self, digests: Sequence[bytes]) -> list[np.ndarray | None]:
+        """Return a copy of each stored embedding, or None for a miss."""
+
+        with self._lock:
+            rows = [self._rows.get(digest) for digest in digests]
+            found = [row for row in rows if row is not None]
+            self.stats.hits += len(found)
+            self.stats.misses += len(rows) - len(found)
+            if not found:
+                return [None] * len(rows)
+            view = self._vectors(max(found))
+            return [None if row is None else np.array(view[row]) for row in rows]
+
+    def get(self, digest: bytes) -> np.ndarray | None:
+        return self.get_many([digest])[0]
+
+    def put_many(self, digests: Sequence[bytes], vectors: Any) -> int:
+        """Append embeddings for digests not stored yet; returns how many were appended."""
+
+        vectors = np.asarray(vectors, dtype=np.float32)
+        with self._lock:
+            if self.dim is None:
+                self.dim = int(vectors.shape[1])
+                self._write_meta()
+            elif vectors.shape[1] != self.dim:
+                raise ValueError(f"expected {self.dim}-dimensional embeddings, got {vectors.shape[1]}")
+            fresh: dict[bytes, int] = {}
+            for i, digest in enumerate(digests):
+                if digest not in self._rows and digest not in fresh:
+                    fresh[digest] = i
+            if not fresh:
+                return 0
+            records = np.empty(len(fresh), dtype=_RECORD)
+            records["digest"] = np.frombuffer(b"".join(fresh), dtype="V32")
+            records["row"] = np.arange(self._vector_rows, self._vector_rows + len(fresh))
+            self._vectors_file.write(np.ascontiguousarray(vectors[list(fresh.values())]).tobytes())
+            self._vectors_file.flush()
+            self._keys_file.write(records.tobytes())
+            self._keys_file.flush()
+            for digest, row in zip(fresh, records["row"].tolist()):
+                self._rows[digest] = row
+            self._vector_rows += len(fresh)
+            self._index_records += len(fresh)
+            self.stats.appended += len(fresh)
+            return len(fresh)
+
+    def discard(self, digests: Iterable[bytes]) -> int:
+        """Forget `digests`; their rows stay on disk until the next `compact()`."""
+
+        with self._lock:
+            gone = [digest for digest in dict.fromkeys(digests) if self._rows.pop(digest, None) is not None]
+            if gone:
+                records = np.empty(len(gone), dtype=_RECORD)
+                records["digest"] = np.frombuffer(b"".join(gone), dtype="V32")
+                records["row"] = -1
+                self._keys_file.write(records.tobytes())
+                self._keys_file.flush()
+                self._index_records += len(gone)
+            return len(gone)
+
+    def compact(self, keep: Iterable[bytes] | None = None) -> int:
+        """Rewrite only live rows (restricted to `keep` if given); returns the bytes reclaimed."""
+
+        with self._lock:
+            if self.dim is None:
+                return 0
+            before = self._vector_rows * self.dim * 4 + self._index_records * _RECORD.itemsize
+            live = self._rows if keep is None else {d: self._rows[d] for d in keep if d in self._rows}
+            nxt = self.generation + 1
+            records = np.empty(len(live), dtype=_RECORD)
+            if live:
+                records["digest"] = np.frombuffer(b"".join(live), dtype="V32")
+            records["row"] = np.arange(len(live))
+            view = self._vectors(max(live.values(), default=0)) if live else None
+            with open(self._file("vectors", nxt), "wb") as handle:
+                rows = np.fromiter(live.values(), dtype=np.int64, count=len(live))
+                for start in range(0, len(rows), 65_536):
+                    handle.write(np.ascontiguousarray(view[rows[start : start + 65_536]]).tobytes())
+                handle.flush()
+                os.fsync(handle.fileno())
+            with open(self._file("keys", nxt), "wb") as handle:
+                handle.write(records.tobytes())
+                handle.flush()
+                os.fsync(handle.fileno())
+            old = self.generation
+            self._vectors_file.close()
+            self._keys_file.close()
+            self._view = None
+            self.generation = nxt
+            self._write_meta()  # the switch to the new generation is this one atomic rename
+            for kind in ("vectors", "keys"):
+                self._file(kind, old).unlink(missing_ok=True)
+            self._open()
+            return before - (len(live) * self.dim * 4 + len(live) * _RECORD.itemsize)
+
+
+# ── Chroma integration ──
+
+
+class ContentImage(np.ndarray):
+    """A decoded image that remembers the SHA-256 of the bytes it was decoded from."""
+
+    sha256: bytes | None = None
+
+
+def image_digest(image: np.ndarray) -> bytes:
+    """Digest of an image: its file's SHA-256 when known, else one over the raw pixels."""
+
+    digest = getattr(image, "sha256", None)
+    if digest is not None:
+        return digest
+    pixels = np.ascontiguousarray(image)
+    return content_digest(f"pixels:{pixels.dtype.str}:{pixels.shape}:".encode() + pixels.tobytes())
+
+
+class HashingImageLoader(ImageLoader):
+    """`ImageLoader` that tags every image with the SHA-256 of its file."""
+
+    def _load_image(self, uri: str | None) -> ContentImage | None:
+        if uri is None:
+            return None
+        data = Path(uri).read_bytes()
+        image = np.array(self._PILImage.open(io.BytesIO(data))).view(ContentImage)
+        image.sha256 = content_digest(data)
+        return image
+
+
+class CachedOpenCLIPEmbeddingFunction(SharedOpenCLIPEmbeddingFunction):
+    """Shared-model OpenCLIP embedding function that consults an `EmbeddingStore` before encoding images."""
+
+    def __init__(
+        self,
+        store_path: str | Path,
+        model_name: str = "ViT-B-32",
+        checkpoint: str = "laion2b_s34b_b79k",
+        device: str | None = "cpu",
+    ) -> None:
+        if checkpoint is None:
+            raise ValueError("randomly initialized weights differ on every load; there is nothing to cache")
+        super().__init__(model_name=model_name, checkpoint=checkpoint, device=device)
+        # int8 embeddings differ slightly from float ones, so they get their own key space.
+        model_id = openclip_model_id(model_name, checkpoint) + (":int8" if self.quantize else "")
+        self.store = EmbeddingStore(store_path, model_id)
+
+    def __call__(self, input: Any) -> Any:
+        from chromadb.api.types import is_image
+
+        images = [i for i, item in enumerate(input) if is_image(item)]
+        digests = [image_digest(input[i]) for i in images]
+        cached = dict(zip(images, self.store.get_many(digests)))
+        missing = [(i, digest) for i, digest in zip(images, digests) if cached[i] is None]
+        if missing:
+            computed = [np.array(self._encode_image(input[i]), dtype=np.float32) for i, _ in missing]
+            self.store.put_many([digest for _, digest in missing], computed)
+            cached.update((i, vector) for (i, _), vector in zip(missing, computed))
+        texts = [item for item in input if not is_image(item)]
+        encoded_texts = iter(super().__call__(texts) if texts else [])
+        return [cached[i] if i in cached else next(encoded_texts) for i in range(len(input))]
+
+
+def build_cached_openclip_components(
+    store_path: str | Path, model_name: str = "ViT-B-32", checkpoint: str = "laion2b_s34b_b79k"
+) -> tuple[CachedOpenCLIPEmbeddingFunction, HashingImageLoader]:
+    try:
+        embedding_function = CachedOpenCLIPEmbeddingFunction(store_path, model_name, checkpoint)
+    except Exception as exc:
+        raise SystemExit(
+            f"OpenCLIP initialization failed: {exc}\n"
+            "If dependencies are missing, from this directory install with:\n"
+            "  pip install -r requirements.txt"
+        ) from exc
+    return embedding_function, HashingImageLoader()
+
+
+# ── Benchmark ──
+
+
+def _add_all(collection: Any, uris: list[str], chunk: int) -> float:
+    started = time.perf_counter()
+    for start in range(0, len(uris), chunk):
+        collection.add(ids=uris[start : start + chunk], uris=uris[start : start + chunk])
+    return time.perf_counter() - started
+
+
+def main() -> None:
+    import chromadb
+    import torch
+
+    from image_ingest import _generate_images, ingest_images
+
+    parser = argparse.ArgumentParser(description="Rebuild a collection from a warm embedding store.")
+    parser.add_argument("--images", type=int, default=256)
+    parser.add_argument("--random-weights", action="store_true", help="use a seeded random checkpoint file")
+    args = parser.parse_args()
+
+    workdir = Path(tempfile.mkdtemp(prefix="embedding-store-"))
+    try:
+        uris = _generate_images(workdir, args.images, np.random.default_rng(0))
+        checkpoint = "laion2b_s34b_b79k"
+        if args.random_weights:
+            torch.manual_seed(0)
+            random_init, _ = _build_openclip_components(checkpoint=None)
+            checkpoint = str(workdir / "vit-b-32-random-seed0.pt")
+            torch.save(random_init._model.state_dict(), checkpoint)
+            del random_init
+        store_path = workdir / "store"
+        embedding_function, image_loader = build_cached_openclip_components(store_path, checkpoint=checkpoint)
+        store = embedding_function.store
+        client = chromadb.EphemeralClient()
+        chunk = client.get_max_batch_size()
+
+        def collection(name: str) -> Any:
+            return client.create_collection(name, embedding_function=embedding_function, data_loader=image_loader)
+
+        cold = _add_all(collection("store_cold"), uris, chunk)
+        print(f"cold store:   {len(uris)} images in {cold:.1f}s ({len(uris) / cold:.1f} img/s); {store.stats}")
+        if store.stats.hits or len(store) != len(uris):
+            raise AssertionError(f"expected {len(uris)} misses on a cold store, got {store.stats}")
+
+        # A rebuilt collection and a clone with 25% new images, from a store reopened from disk.
+        store.close()
+        embedding_function.store = store = EmbeddingStore(store_path, store.model_id)
+        warm = _add_all(collection("store_warm"), uris, chunk)
+        print(f"warm rebuild: {len(uris)} images in {warm:.1f}s ({len(uris) / warm:.1f} img/s); {store.stats}")
+        print(f"rebuild speedup: {cold / warm:.1f}x")
+        (workdir / "new").mkdir()
+        extra = _generate_images(workdir / "new", len(uris) // 4, np.random.default_rng(1))
+        store.stats.hits = store.stats.misses = 0
+        _add_all(collection("store_clone"), uris + extra, chunk)
+        print(f"clone with {len(extra)} new images: {store.stats}")
+        if store.stats.misses != len(extra):
+            raise AssertionError(f"expected {len(extra)} misses, got {store.stats}")
+
+        # Stored embeddings are the ones the model computes.
+        sample = uris[:8]
+        a, b = (
+            np.asarray([dict(zip(got["ids"], got["embeddings"]))[i] for i in sample])
+            for got in (client.get_collection(name).get(ids=sample, include=["embeddings"])
+                        for name in ("store_cold", "store_warm"))
+        )
+        if not np.allclose(a, b, atol=1e-6):
+            raise AssertionError("cached embeddings differ from computed ones")
+
+        # The bulk pipeline skips decoding for stored images too.
+        stats = ingest_images(collection("store_bulk"), embedding_function, uris, write_batch_size=chunk, store=store)
+        print(f"ingest_images with store: {stats}")
+        if stats.cached != len(uris):
+            raise AssertionError(f"expected {len(uris)} cached images, got {stats.cached}")
+
+        # Drop the images that left the catalogue and compact.
+        kept = {content_digest(Path(p).read_bytes()) for p in uris[: len(uris) // 2]}
+        reclaimed = store.compact(keep=kept)
+        if len(store) != len(kept) or store.get(next(iter(kept))) is None:
+            raise AssertionError("compaction lost live embeddings")
+        store.close()
+        reopened = EmbeddingStore(store_path, store.model_id)
+        if len(reopened) != len(kept):
+            raise AssertionError("compacted store did not reopen with its live keys")
+        print(f"compacted to {len(reopened)} embeddings, reclaimed {reclaimed / 1024:.0f} KiB")
+        reopened.close()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print("\npython: embedding store example passed")
+
+
+if __name__ == "__main__":
+    main()
@@ -30,10 +30,19 @@ def _first_result_group(results: dict[str, Any], key: str) -> list[Any]:
     return []
 
 
-def _build_openclip_components() -> tuple[Any, Any]:
+def _build_openclip_components(
+    model_name: str = "ViT-B-32", checkpoint: str | None = "laion2b_s34b_b79k"
+) -> tuple[Any, Any]:
+    """Embedding function and loader for `model_name`; the model itself loads on first use.
+
+    The model comes from `openclip_registry.REGISTRY`, so every embedding function
+    built here (and every one Chroma rebuilds from a collection's config) shares it.
+    """
+
     try:
         from chromadb.utils.data_loaders import ImageLoader
-        from chromadb.utils.embedding_functions import OpenCLIPEmbeddingFunction
+
+        from openclip_registry import SharedOpenCLIPEmbeddingFunction
     except ImportError as exc:
         raise SystemExit(
             "Missing optional image-search dependencies. From this directory, install with:\n"
@@ -41,7 +50,7 @@ def _build_openclip_components() -> tuple[Any, Any]:
         ) from exc
 
     try:
-        return OpenCLIPEmbeddingFunction(), ImageLoader()
+        return SharedOpenCLIPEmbeddingFunction(model_name=model_name, checkpoint=checkpoint), ImageLoader()
     except Exception as exc:
         raise SystemExit(
             f"OpenCLIP initialization failed: {exc}\n"
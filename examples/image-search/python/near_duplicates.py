@@ -0,0 +1,335 @@
+"""Perceptual-hash gate that keeps near-duplicate images away from the model.
+
+A catalogue often holds the same picture several times: resized, re-encoded,
+or exported again. `collection.add(uris=...)` embeds every copy, which wastes
+inference time and fills result lists with the same image. `NearDuplicateGate`
+sits in front of ingestion:
+
+1. it computes a 64-bit difference hash (dHash) of each image. JPEGs are
+   decoded at reduced size (`Image.draft`), so hashing takes a few
+   milliseconds per image, compared with roughly 100ms for CPU inference;
+2. it looks the hash up in a `MultiIndexHash` of the images already indexed.
+   The hash is split into `max_distance + 1` chunks. Any two hashes within
+   `max_distance` bits share at least one chunk exactly, so only the buckets
+   of matching chunks are compared bit by bit;
+3. it either skips the duplicate (`mode="skip"`) or holds it back to be
+   linked (`mode="link"`). Once the canonical images are ingested, `link()`
+   adds each copy with its canonical's embedding and a `duplicate_of`
+   metadata field. Copies are then still retrievable by ID and URI, but never
+   reach the model.
+
+Canonical records get their hash in a `phash` metadata field, so
+`NearDuplicateGate.from_collection()` picks up where the last run stopped.
+
+Usage:
+    from near_duplicates import NearDuplicateGate
+    from image_ingest import ingest_images, iter_image_files
+
+    gate = NearDuplicateGate.from_collection(collection, mode="link")
+    ids, uris, metadatas = zip(*gate.filter(uris, uris))
+    batch_size = client.get_max_batch_size()
+    ingest_images(collection, embedding_function, uris, ids=ids, metadatas=metadatas, write_batch_size=batch_size)
+    gate.link(collection, batch_size)
+    print(gate.stats)
+
+Dedup rate and time saved on CPU for a generated catalogue where a third of
+the files are resized / re-encoded copies:
+    python near_duplicates.py --images 96 --copies 48 --random-weights
+"""
+
+from __future__ import annotations
+
+import argparse
+import shutil
+import tempfile
+import time
+from dataclasses import dataclass
+from itertools import repeat
+from pathlib import Path
+from typing import Any, Iterable, Iterator
+
+import numpy as np
+
+
+def dhash(source: Any, hash_size: int = 8) -> int:
+    """Difference hash of an image path or PIL image: one bit per horizontally adjacent pixel pair."""
+
+    from PIL import Image
+
+    image = Image.open(source) if isinstance(source, (str, Path)) else source
+    try:
+        # Let the JPEG decoder downscale by up to 8x instead of decoding full resolution.
+        image.draft("L", (hash_size * 4, hash_size * 4))
+        small = image.convert("L").resize((hash_size + 1, hash_size), Image.Resampling.BOX)
+    finally:
+        if image is not source:
+            image.close()
+    pixels = np.asarray(small, dtype=np.int16)
+    bits = (pixels[:, 1:] > pixels[:, :-1]).ravel()
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+class MultiIndexHash:
+    """Exact Hamming-radius lookups over fixed-width hashes, via pigeonhole chunk tables."""
+
+    def __init__(self, bits: int = 64, max_distance: int = 8) -> None:
+        self.bits = bits
+        self.max_distance = max_distance
+        chunks = max_distance + 1
+        bounds = [bits * i // chunks for i in range(chunks + 1)]
+        self._chunks = [(start, (1 << (end - start)) - 1) for start, end in zip(bounds, bounds[1:])]
+        self._tables: list[dict[int, list[int]]] = [{} for _ in self._chunks]
+        self._hashes: list[int] = []
+        self._keys: list[str] = []
+
+    def __len__(self) -> int:
+        return len(self._hashes)
+
+    def add(self, key: str, value: int) -> None:
+        slot = len(self._hashes)
+        self._hashes.append(value)
+        self._keys.append(key)
+        for table, (shift, mask) in zip(self._tables, self._chunks):
+            table.setdefault((value >> shift) & mask, []).append(slot)
+
+    def nearest(self, value: int) -> tuple[str, int] | None:
+        """The closest stored key within `max_distance` bits, as (key, distance)."""
+
+        best: tuple[int, int] | None = None
+        seen: set[int] = set()
+        for table, (shift, mask) in zip(self._tables, self._chunks):
+            for slot in table.get((value >> shift) & mask, ()):
+                if slot in seen:
+                    continue
+                seen.add(slot)
+                distance = (self._hashes[slot] ^ value).bit_count()
+                if distance <= self.max_distance and (best is None or distance < best[1]):
+                    best = (slot, distance)
+                    if distance == 0:
+                        return self._keys[slot], 0
+        return (self._keys[best[0]], best[1]) if best is not None else None
+
+
+@dataclass
+class DedupStats:
+    seen: int = 0
+    duplicates: int = 0
+    unhashable: int = 0
+    hash_seconds: float = 0.0
+
+    @property
+    def dedup_rate(self) -> float:
+        return self.duplicates / self.seen if self.seen else 0.0
+
+    def __str__(self) -> str:
+        per_image = self.hash_seconds / self.seen * 1000 if self.seen else 0.0
+        return (
+            f"{self.duplicates}/{self.seen} near-duplicates ({self.dedup_rate:.1%}); "
+            f"hashing {per_image:.2f}ms/image; unhashable={self.unhashable}"
+        )
+
+
+@dataclass
+class Duplicate:
+    id: str
+    uri: str
+    metadata: dict[str, Any] | None
+    canonical_id: str
+    distance: int
+
+
+class NearDuplicateGate:
+    """Filters an ingestion stream down to images not within `max_distance` bits of one already seen."""
+
+    def __init__(self, max_distance: int = 8, mode: str = "skip", hash_size: int = 8) -> None:
+        if mode not in ("skip", "link"):
+            raise ValueError(f"mode must be 'skip' or 'link', got {mode!r}")
+        self.mode = mode
+        self.hash_size = hash_size
+        self.index = MultiIndexHash(bits=hash_size * hash_size, max_distance=max_distance)
+        self.stats = DedupStats()
+        self.duplicates: list[Duplicate] = []
+
+    @classmethod
+    def from_collection(cls, collection: Any, page_size: int = 1000, **kwargs: Any) -> NearDuplicateGate:
+        """A gate that already knows the canonical images stored in `collection`."""
+
+        gate = cls(**kwargs)
+        # Page by ID over one snapshot: offset paging rescans earlier rows and drifts under writes.
+        ids = sorted(collection.get(include=[])["ids"])
+        for start in range(0, len(ids), page_size):
+            page = collection.get(ids=ids[start : start + page_size], include=["metadatas"])
+            for record_id, metadata in zip(page["ids"], page["metadatas"]):
+                if metadata and "phash" in metadata and "duplicate_of" not in metadata:
+                    gate.index.add(record_id, int(metadata["phash"], 16))
+        return gate
+
+    def filter(
+        self,
+        ids: Iterable[str],
+        uris: Iterable[str],
+        metadatas: Iterable[dict[str, Any] | None] | None = None,
+    ) -> Iterator[tuple[str, str, dict[str, Any]]]:
+        """Yield (id, uri, metadata) for images to embed; near-duplicates are held in `duplicates`."""
+
+        metadatas = metadatas if metadatas is not None else repeat(None)
+        for record_id, uri, metadata in zip(ids, uris, metadatas):
+            self.stats.seen += 1
+            started = time.perf_counter()
+            try:
+                value = dhash(uri, self.hash_size)
+            except Exception:
+                self.stats.unhashable += 1  # let the ingestion stage report it
+                yield record_id, uri, dict(metadata or {})
+                continue
+            finally:
+                self.stats.hash_seconds += time.perf_counter() - started
+            match = self.index.nearest(value)
+            if match is not None:
+                self.stats.duplicates += 1
+                self.duplicates.append(Duplicate(record_id, uri, metadata, *match))
+                continue
+            self.index.add(record_id, value)
+            yield record_id, uri, {**(metadata or {}), "phash": f"{value:016x}"}
+
+    def link(self, collection: Any, batch_size: int) -> int:
+        """Add held-back duplicates with their canonical's embedding; returns how many were added."""
+
+        if self.mode != "link" or not self.duplicates:
+            self.duplicates.clear()
+            return 0
+        added = 0
+        while self.duplicates:
+            batch, self.duplicates = self.duplicates[:batch_size], self.duplicates[batch_size:]
+            canonical_ids = list(dict.fromkeys(d.canonical_id for d in batch))
+            got = collection.get(ids=canonical_ids, include=["embeddings"])
+            embeddings = dict(zip(got["ids"], got["embeddings"]))
+            batch = [d for d in batch if d.canonical_id in embeddings]  # canonical failed to ingest
+            if not batch:
+                continue
+            collection.add(
+                ids=[d.id for d in batch],
+                uris=[d.uri for d in batch],
+                embeddings=np.asarray([embeddings[d.canonical_id] for d in batch]),
+                metadatas=[{**(d.metadata or {}), "duplicate_of": d.canonical_id} for d in batch],
+            )
+            added += len(batch)
+        return added
+
+
+# ── Benchmark ──
+
+
+def _generate_catalogue(directory: Path, originals: int, copies: int, seed: int = 0) -> tuple[list[str], dict]:
+    """Distinct scenes of random shapes, plus resized / re-encoded / re-exported copies of some of them."""
+
+    from PIL import Image, ImageDraw
+
+    rng = np.random.default_rng(seed)
+    paths: list[str] = []
+    source_of: dict[str, str] = {}
+    for i in range(originals):
+        width, height = int(rng.integers(480, 1280)), int(rng.integers(360, 960))
+        image = Image.new("RGB", (width, height), tuple(int(c) for c in rng.integers(0, 256, 3)))
+        draw = ImageDraw.Draw(image)
+        for _ in range(12):
+            x0, y0 = int(rng.integers(0, width)), int(rng.integers(0, height))
+            box = (x0, y0, x0 + int(rng.integers(40, width // 2)), y0 + int(rng.integers(40, height // 2)))
+            color = tuple(int(c) for c in rng.integers(0, 256, 3))
+            (draw.ellipse if rng.random() < 0.5 else draw.rectangle)(box, fill=color)
+        pixels = np.asarray(image, dtype=np.float32) + rng.normal(0, 8, (height, width, 3))
+        path = directory / f"img-{i:06d}.jpg"
+        Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8)).save(path, quality=90)
+        paths.append(str(path))
+    for i in range(copies):
+        source = paths[int(rng.integers(0, originals))]
+        with Image.open(source) as image:
+            kind = i % 3
+            if kind == 0:  # thumbnail
+                scale = float(rng.uniform(0.3, 0.7))
+                image = image.resize((int(image.width * scale), int(image.height * scale)), Image.Resampling.LANCZOS)
+                path, options = directory / f"copy-{i:06d}.jpg", {"quality": 85}
+            elif kind == 1:  # aggressive re-encode
+                path, options = directory / f"copy-{i:06d}.jpg", {"quality": int(rng.integers(30, 60))}
+            else:  # re-exported as PNG
+                path, options = directory / f"copy-{i:06d}.png", {}
+            image.save(path, **options)
+        paths.append(str(path))
+        source_of[str(path)] = source
+    order = rng.permutation(len(paths))
+    return [paths[i] for i in order], source_of
+
+
+def main() -> None:
+    import chromadb
+
+    from image_ingest import ingest_images
+    from image_search import _build_openclip_components
+
+    parser = argparse.ArgumentParser(description="Dedup rate and time saved by the near-duplicate gate.")
+    parser.add_argument("--images", type=int, default=96, help="distinct images")
+    parser.add_argument("--copies", type=int, default=48, help="resized / re-encoded copies among them")
+    parser.add_argument("--max-distance", type=int, default=8)
+    parser.add_argument("--random-weights", action="store_true", help="skip the checkpoint download")
+    args = parser.parse_args()
+
+    workdir = Path(tempfile.mkdtemp(prefix="near-duplicates-"))
+    try:
+        uris, source_of = _generate_catalogue(workdir, args.images, args.copies)
+        print(f"catalogue: {len(uris)} files, {args.copies} of them copies of another file")
+        embedding_function, image_loader = _build_openclip_components(
+            checkpoint=None if args.random_weights else "laion2b_s34b_b79k"
+        )
+        client = chromadb.EphemeralClient()
+
+        def collection(name: str) -> Any:
+            return client.create_collection(name, embedding_function=embedding_function, data_loader=image_loader)
+
+        embedding_function(["warm up"])  # load the model outside the timings
+        baseline = ingest_images(
+            collection("dedup_baseline"), embedding_function, uris, write_batch_size=client.get_max_batch_size()
+        )
+        print(f"without gate: {baseline}")
+
+        gated = collection("dedup_gated")
+        gate = NearDuplicateGate(max_distance=args.max_distance, mode="link")
+        started = time.perf_counter()
+        ids, kept_uris, metadatas = zip(*gate.filter(uris, uris))
+        stats = ingest_images(
+            gated,
+            embedding_function,
+            kept_uris,
+            ids=ids,
+            metadatas=metadatas,
+            write_batch_size=client.get_max_batch_size(),
+        )
+        linked = gate.link(gated, client.get_max_batch_size())
+        elapsed = time.perf_counter() - started
+        print(f"gate: {gate.stats}")
+        print(f"with gate:    {stats.write.items} embedded + {linked} linked in {elapsed:.1f}s")
+        print(f"time saved:   {baseline.elapsed - elapsed:.1f}s ({1 - elapsed / baseline.elapsed:.0%})")
+
+        # Every flagged image is a real copy of its canonical (or of a copy of the same source).
+        records = gated.get(include=["metadatas"])
+        root = {uri: source_of.get(uri, uri) for uri in uris}
+        flagged = {rid: m["duplicate_of"] for rid, m in zip(records["ids"], records["metadatas"]) if "duplicate_of" in m}
+        false_positives = [rid for rid, canonical in flagged.items() if root[rid] != root[canonical]]
+        missed = args.copies - len(flagged)
+        print(f"false positives: {len(false_positives)}; copies missed: {missed}")
+        if false_positives:
+            raise AssertionError(f"distinct images flagged as duplicates: {false_positives[:3]}")
+        if gated.count() != len(uris):
+            raise AssertionError(f"expected all {len(uris)} records in link mode, got {gated.count()}")
+
+        # A later run over the same files only sees duplicates.
+        again = NearDuplicateGate.from_collection(gated, max_distance=args.max_distance)
+        if list(again.filter(uris, uris)):
+            raise AssertionError("a gate rebuilt from the collection let known images through")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print("\npython: near duplicates example passed")
+
+
+if __name__ == "__main__":
+    main()
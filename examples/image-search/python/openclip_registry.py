@@ -0,0 +1,415 @@
+"""Process-wide, lazily loaded OpenCLIP models shared by every embedding function.
+
+`OpenCLIPEmbeddingFunction` loads its model in `__init__`, and Chroma builds a
+new one from the collection's stored config whenever it needs one, which
+happens on every `add()`. Each collection, each config rebuild and each worker
+process therefore pays the multi-second load and holds its own copy of the
+weights. `OpenCLIPRegistry` keeps one model per
+(model name, checkpoint, device) per process:
+
+- `SharedOpenCLIPEmbeddingFunction` takes the same config as
+  `OpenCLIPEmbeddingFunction` and is registered under the same `open_clip`
+  name. Config rebuilds in this process therefore reuse the shared model, and
+  collections persisted by either class open with the other. Nothing is loaded
+  until the first text (`query_texts`) or image (`query_uris`, `add(uris=...)`)
+  is embedded.
+- `quantize=True` applies int8 dynamic quantization to the `nn.Linear`
+  layers of the image tower for CPU inference. This is opt-in, because it changes embeddings
+  slightly; `main()` measures by how much.
+- `weights_dir` exports each model's float weights once to
+  `<weights_dir>/<model>--<checkpoint>.pt`. Later loads map that file
+  read-only (`torch.load(mmap=True)`), so every process on the host shares
+  the same page-cache copy instead of holding a private one.
+- `preload()` before forking workers shares the loaded model copy-on-write.
+
+Deployment settings (`quantize`, `weights_dir`) live on the registry rather
+than in the collection config, so they can differ per process without
+touching stored collections.
+
+Usage:
+    from openclip_registry import REGISTRY, SharedOpenCLIPEmbeddingFunction
+
+    REGISTRY.configure(quantize=True, weights_dir="/var/cache/openclip")
+    embedding_function = SharedOpenCLIPEmbeddingFunction()   # no model load yet
+    collection = client.create_collection(
+        "images", embedding_function=embedding_function, data_loader=ImageLoader()
+    )
+
+Startup time and RSS/PSS per forked worker for eager, preloaded, mmap'd and
+int8 models, plus the int8 text->image recall against the float model:
+    python openclip_registry.py --workers 2 --random-weights
+"""
+
+from __future__ import annotations
+
+import argparse
+import importlib
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import warnings
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any
+
+try:
+    from chromadb.utils.embedding_functions import OpenCLIPEmbeddingFunction, register_embedding_function
+except ImportError as exc:
+    raise SystemExit(
+        "Missing optional image-search dependencies. From this directory, install with:\n"
+        "  pip install -r requirements.txt"
+    ) from exc
+
+
+@dataclass
+class LoadedModel:
+    model: Any
+    preprocess: Any
+    tokenizer: Any
+    load_seconds: float
+    quantized: bool
+    mmapped: bool
+
+
+class OpenCLIPRegistry:
+    """Loads each OpenCLIP model once per process, on first use."""
+
+    def __init__(self, quantize: bool = False, weights_dir: str | Path | None = None) -> None:
+        self.quantize = quantize
+        self.weights_dir = Path(weights_dir) if weights_dir is not None else None
+        self._models: dict[tuple[str, str | None, str, bool], LoadedModel] = {}
+        self._lock = threading.Lock()
+
+    def configure(self, quantize: bool | None = None, weights_dir: str | Path | None = None) -> None:
+        """Change settings for models loaded from now on (already loaded ones are kept)."""
+
+        if quantize is not None:
+            self.quantize = quantize
+        if weights_dir is not None:
+            self.weights_dir = Path(weights_dir)
+
+    def get(
+        self, model_name: str, checkpoint: str | None, device: str = "cpu", quantize: bool | None = None
+    ) -> LoadedModel:
+        """The model for these settings; `quantize=None` means the registry's current setting."""
+
+        quantize = self.quantize if quantize is None else quantize
+        key = (model_name, checkpoint, device, quantize)
+        loaded = self._models.get(key)
+        if loaded is None:
+            with self._lock:
+                loaded = self._models.get(key)
+                if loaded is None:
+                    loaded = self._models[key] = self._load(model_name, checkpoint, device, quantize)
+        return loaded
+
+    def preload(self, model_name: str = "ViT-B-32", checkpoint: str | None = "laion2b_s34b_b79k") -> LoadedModel:
+        """Load now, e.g. in a parent process before forking workers."""
+
+        return self.get(model_name, checkpoint)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._models.clear()
+
+    def weights_file(self, model_name: str, checkpoint: str | None) -> Path | None:
+        if self.weights_dir is None:
+            return None
+        slug = re.sub(r"[^A-Za-z0-9._-]+", "_", f"{model_name}--{checkpoint or 'random'}")
+        return self.weights_dir / f"{slug}.pt"
+
+    def _load(self, model_name: str, checkpoint: str | None, device: str, quantize: bool) -> LoadedModel:
+        import open_clip
+        import torch
+
+        started = time.perf_counter()
+        path = self.weights_file(model_name, checkpoint)
+        if path is not None and not path.exists():
+            model, _, _ = open_clip.create_model_and_transforms(model_name=model_name, pretrained=checkpoint)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = path.with_suffix(f".tmp-{os.getpid()}")
+            torch.save(model.state_dict(), tmp)
+            tmp.replace(path)
+            del model
+        mmapped = path is not None and device == "cpu"
+        if mmapped:
+            # Build the module without allocating weights, then point its parameters at the mapped file.
+            model, _, preprocess = open_clip.create_model_and_transforms(
+                model_name=model_name, pretrained=None, device="meta"
+            )
+            model.load_state_dict(torch.load(path, mmap=True, weights_only=True), assign=True)
+            _materialize_buffers(model)
+        else:
+            model, _, preprocess = open_clip.create_model_and_transforms(
+                model_name=model_name, pretrained=str(path) if path is not None else checkpoint
+            )
+            model.to(device)
+        model.eval()
+        if quantize:
+            if device != "cpu":
+                raise ValueError("int8 dynamic quantization is a CPU inference mode")
+            # Only the image tower: it is where the time goes, and OpenCLIP's text path reads
+            # float weight dtypes that quantized linear layers no longer expose.
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore")  # torch.ao.quantization deprecation notices
+                model.visual = torch.ao.quantization.quantize_dynamic(
+                    model.visual, {torch.nn.Linear}, dtype=torch.qint8
+                )
+        return LoadedModel(
+            model=model,
+            preprocess=preprocess,
+            tokenizer=open_clip.get_tokenizer(model_name=model_name),
+            load_seconds=time.perf_counter() - started,
+            quantized=quantize,
+            mmapped=mmapped,
+        )
+
+
+def _materialize_buffers(model: Any) -> None:
+    """Recreate non-persistent buffers, which are not in the state dict, after a meta-device build."""
+
+    import torch
+
+    for module in model.modules():
+        for name, buffer in list(module._buffers.items()):
+            if buffer is None or not buffer.is_meta:
+                continue
+            if name != "attn_mask":
+                raise ValueError(f"cannot rebuild buffer {name!r} of {type(module).__name__}")
+            # OpenCLIP's text tower uses an additive causal mask.
+            module._buffers[name] = torch.full(tuple(buffer.shape), float("-inf")).triu_(1)
+
+
+REGISTRY = OpenCLIPRegistry()
+
+
+@register_embedding_function
+class SharedOpenCLIPEmbeddingFunction(OpenCLIPEmbeddingFunction):
+    """`OpenCLIPEmbeddingFunction` backed by a registry model that loads on first use."""
+
+    def __init__(
+        self,
+        model_name: str = "ViT-B-32",
+        checkpoint: str | None = "laion2b_s34b_b79k",
+        device: str | None = "cpu",
+        registry: OpenCLIPRegistry | None = None,
+        quantize: bool | None = None,
+    ) -> None:
+        """`quantize=None` takes the registry's setting now; later `configure()` calls do not change it."""
+
+        # Deliberately not calling super().__init__(): it loads a private model copy.
+        try:
+            importlib.import_module("open_clip")
+            self._torch = importlib.import_module("torch")
+            self._PILImage = importlib.import_module("PIL.Image")
+        except ImportError as exc:
+            raise ValueError(
+                f"OpenCLIP needs open-clip-torch, torch and pillow installed ({exc}). "
+                "Install them with `pip install open-clip-torch pillow`."
+            ) from exc
+        self.model_name = model_name
+        self.checkpoint = checkpoint
+        self.device = device or "cpu"
+        self.registry = registry or REGISTRY
+        self.quantize = self.registry.quantize if quantize is None else quantize
+
+    @property
+    def loaded(self) -> LoadedModel:
+        return self.registry.get(self.model_name, self.checkpoint, self.device, self.quantize)
+
+    @property
+    def _model(self) -> Any:
+        return self.loaded.model
+
+    @property
+    def _preprocess(self) -> Any:
+        return self.loaded.preprocess
+
+    @property
+    def _tokenizer(self) -> Any:
+        return self.loaded.tokenizer
+
+    @staticmethod
+    def build_from_config(config: dict[str, Any]) -> SharedOpenCLIPEmbeddingFunction:
+        return SharedOpenCLIPEmbeddingFunction(
+            model_name=config.get("model_name", "ViT-B-32"),
+            checkpoint=config.get("checkpoint"),
+            device=config.get("device", "cpu"),
+        )
+
+
+# ── Benchmark ──
+
+
+def _memory_kib() -> tuple[int, int]:
+    """(RSS, PSS) of this process in KiB. PSS splits shared pages among the processes that map them."""
+
+    rss = pss = 0
+    with open("/proc/self/smaps_rollup") as handle:
+        for line in handle:
+            if line.startswith("Rss:"):
+                rss = int(line.split()[1])
+            elif line.startswith("Pss:"):
+                pss = int(line.split()[1])
+    return rss, pss
+
+
+def _worker(mode: str, checkpoint: str, images: list[str], results: Any) -> None:
+    import torch
+    from chromadb.utils.data_loaders import ImageLoader
+
+    torch.set_num_threads(1)
+    try:
+        started = time.perf_counter()
+        if mode == "eager":
+            embedding_function: Any = OpenCLIPEmbeddingFunction(checkpoint=checkpoint)
+        else:
+            embedding_function = SharedOpenCLIPEmbeddingFunction(checkpoint=checkpoint)
+        embedding_function(ImageLoader(max_workers=1)(images[:1]))
+        ready = time.perf_counter() - started
+        embedding_function(ImageLoader(max_workers=1)(images))
+        embedding_function(["a photo of a dog"])
+        results.put((ready, *_memory_kib()))
+    except BaseException as exc:
+        results.put(f"{type(exc).__name__}: {exc}")
+        raise
+
+
+def _child(args: argparse.Namespace) -> None:
+    """One mode in a fresh process: optionally preload, then fork `--workers` workers."""
+
+    import multiprocessing
+
+    images = json.loads(args.images_json)
+    if args.mode in ("mmap", "mmap-int8"):
+        REGISTRY.configure(weights_dir=args.weights_dir)
+    if args.mode.endswith("int8"):
+        REGISTRY.configure(quantize=True)
+    parent_load = 0.0
+    if args.mode in ("preload", "int8", "mmap", "mmap-int8"):
+        parent_load = REGISTRY.preload(checkpoint=args.checkpoint).load_seconds
+    context = multiprocessing.get_context("fork")
+    results = context.Queue()
+    workers = [
+        context.Process(target=_worker, args=(args.mode, args.checkpoint, images, results))
+        for _ in range(args.workers)
+    ]
+    for worker in workers:
+        worker.start()
+    measured = [results.get() for _ in workers]
+    for worker in workers:
+        worker.join()
+    errors = [result for result in measured if isinstance(result, str)]
+    if errors:
+        raise SystemExit(f"{args.mode} worker failed: {errors[0]}")
+    print(json.dumps({"parent_load": parent_load, "workers": measured}))
+
+
+def _recall(checkpoint: str, images: list[str], texts: list[str], k: int = 10) -> tuple[float, float]:
+    """Mean recall@k of int8 text->image rankings against the float model's, and mean image cosine."""
+
+    import numpy as np
+    from chromadb.utils.data_loaders import ImageLoader
+
+    loaded = ImageLoader()(images)
+    embeddings = {}
+    for quantize in (False, True):
+        registry = OpenCLIPRegistry(quantize=quantize)
+        embedding_function = SharedOpenCLIPEmbeddingFunction(checkpoint=checkpoint, registry=registry)
+        embeddings[quantize] = (
+            np.asarray(embedding_function(loaded)),
+            np.asarray(embedding_function(texts)),
+        )
+    (image_f, text_f), (image_q, text_q) = embeddings[False], embeddings[True]
+    top_f = np.argsort(-(text_f @ image_f.T), axis=1)[:, :k]
+    top_q = np.argsort(-(text_q @ image_q.T), axis=1)[:, :k]
+    recall = np.mean([len(set(a) & set(b)) / k for a, b in zip(top_f, top_q)])
+    cosine = float(np.mean(np.sum(image_f * image_q, axis=1)))
+    return float(recall), cosine
+
+
+CAPTIONS = [
+    "a photo of a dog", "a photo of a cat", "a red car on a street", "a bowl of fruit",
+    "a mountain landscape", "a city skyline at night", "a person riding a bicycle", "a sandy beach",
+    "a plate of pasta", "a snowy forest", "a close-up of a flower", "an old wooden door",
+    "a cup of coffee", "a group of people at a concert", "a sailing boat", "a bookshelf full of books",
+]
+
+
+def main() -> None:
+    import numpy as np
+    import torch
+
+    from image_ingest import _generate_images
+
+    parser = argparse.ArgumentParser(description="Startup, memory and recall of shared / int8 OpenCLIP models.")
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--images", type=int, default=64, help="images for the recall comparison")
+    parser.add_argument("--random-weights", action="store_true", help="use a seeded random checkpoint file")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    parser.add_argument("--mode", help=argparse.SUPPRESS)
+    parser.add_argument("--checkpoint", default="laion2b_s34b_b79k", help=argparse.SUPPRESS)
+    parser.add_argument("--weights-dir", help=argparse.SUPPRESS)
+    parser.add_argument("--images-json", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        _child(args)
+        return
+
+    workdir = Path(tempfile.mkdtemp(prefix="openclip-registry-"))
+    try:
+        images = _generate_images(workdir, args.images, np.random.default_rng(0))
+        checkpoint = args.checkpoint
+        if args.random_weights:
+            torch.manual_seed(0)
+            checkpoint = str(workdir / "vit-b-32-random-seed0.pt")
+            torch.save(OpenCLIPRegistry().get("ViT-B-32", None).model.state_dict(), checkpoint)
+        weights_dir = workdir / "weights"
+        # Export the mmap file up front so no mode pays for it.
+        OpenCLIPRegistry(weights_dir=weights_dir).get("ViT-B-32", checkpoint)
+
+        print(f"{args.workers} forked workers per mode; KiB per worker, after embedding 8 images and a text")
+        print(f"{'mode':<10} {'parent load':>11} {'worker ready':>12} {'RSS':>10} {'PSS':>10}")
+        for mode in ("eager", "preload", "mmap", "int8", "mmap-int8"):
+            command = [
+                sys.executable, __file__, "--child", "1", "--mode", mode, "--workers", str(args.workers),
+                "--checkpoint", checkpoint, "--weights-dir", str(weights_dir), "--images-json", json.dumps(images[:8]),
+            ]
+            output = subprocess.run(command, check=True, capture_output=True, text=True).stdout
+            report = json.loads(output.strip().splitlines()[-1])
+            ready, rss, pss = (float(np.mean(column)) for column in zip(*report["workers"]))
+            print(f"{mode:<10} {report['parent_load']:>10.2f}s {ready:>11.2f}s {rss:>10,.0f} {pss:>10,.0f}")
+
+        # Config rebuilds (one per add()) reuse the registry model instead of reloading.
+        import chromadb
+
+        client = chromadb.EphemeralClient()
+        collection = client.create_collection(
+            "registry_rebuilds", embedding_function=SharedOpenCLIPEmbeddingFunction(checkpoint=checkpoint)
+        )
+        collection.add(ids=["text-0"], documents=[CAPTIONS[0]])  # loads the model
+        started = time.perf_counter()
+        for i in range(1, 6):
+            collection.add(ids=[f"text-{i}"], documents=[CAPTIONS[i]])
+        per_add = (time.perf_counter() - started) / 5 * 1000
+        print(f"\nadd() with a registry model: {per_add:.0f}ms per call (config rebuilds share the loaded model)")
+
+        recall, cosine = _recall(checkpoint, images, CAPTIONS)
+        print(f"int8 vs float: text->image recall@10 {recall:.3f}, mean image embedding cosine {cosine:.4f}")
+        if cosine < 0.95:
+            raise AssertionError(f"int8 embeddings drifted too far from float (cosine {cosine:.4f})")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print("\npython: openclip registry example passed")
+
+
+if __name__ == "__main__":
+    main()
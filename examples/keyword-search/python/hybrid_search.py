@@ -0,0 +1,483 @@
+"""BM25 lexical index and rank-fusion hybrid search beside a Chroma collection.
+
+`keyword_search.py` constrains a vector query with `$contains`, which is a
+yes/no filter: it cannot rank exact-term matches (error codes, SKUs) above
+documents that merely mention a query word. This example adds:
+
+- `BM25Index`: an inverted index of the collection's documents, scored with
+  Okapi BM25. It is updated incrementally (`add` replaces an existing ID,
+  `delete` tombstones rows that `compact` later drops) and saved to a single
+  compressed `.npz` file (vocabulary, posting lists, term frequencies,
+  document lengths).
+- `HybridCollection`: wraps a collection, keeps the index in sync with writes
+  made through it, and answers `search()` by running the BM25 and vector
+  retrievals concurrently and fusing them with reciprocal rank fusion
+  (`mode="rrf"`) or min-max normalized weighted scores (`mode="weighted"`).
+
+Usage:
+    from hybrid_search import BM25Index, HybridCollection
+
+    hybrid = HybridCollection(collection, BM25Index.load("bm25.npz"))
+    hits = hybrid.search("ERR-4821 timeout", query_embedding=embed("ERR-4821 timeout"), n_results=10)
+    hybrid.add(ids=new_ids, documents=new_docs, embeddings=new_embeddings)
+    hybrid.index.save("bm25.npz")
+
+Run the latency/quality benchmark against the plain `$contains` approach
+(local, no server):
+    python hybrid_search.py --docs 100000
+"""
+
+from __future__ import annotations
+
+import argparse
+import math
+import os
+import random
+import re
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Iterable, Sequence
+
+import chromadb
+import numpy as np
+
+# Keeps codes such as "ERR-4821", "SKU-88.1" or "gpt_4" as single tokens.
+TOKEN_RE = re.compile(r"[a-z0-9_]+(?:[-.][a-z0-9_]+)*")
+
+
+def tokenize(text: str) -> list[str]:
+    return TOKEN_RE.findall(text.lower())
+
+
+class BM25Index:
+    """Incrementally updatable Okapi BM25 index over document text.
+
+    Safe to share between threads: writes, flushes and searches take one lock.
+    """
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75, flush_rows: int = 50_000) -> None:
+        self.k1 = k1
+        self.b = b
+        self.flush_rows = flush_rows
+        self._ids: list[str | None] = []
+        self._rows: dict[str, int] = {}
+        self._live = np.zeros(0, dtype=bool)
+        self._lengths = np.zeros(0, dtype=np.uint32)
+        self._total_length = 0
+        self._postings: dict[str, tuple[np.ndarray, np.ndarray]] = {}
+        self._pending: dict[str, tuple[list[int], list[int]]] = {}
+        self._pending_rows = 0
+        self._dead = 0
+        # Public methods take the lock; the underscored bodies they share assume it is held.
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_collection(cls, collection: Any, batch_size: int = 5000, **kwargs: Any) -> BM25Index:
+        index = cls(**kwargs)
+        # Page by ID over one snapshot: offset paging rescans earlier rows and drifts under writes.
+        ids = sorted(collection.get(include=[])["ids"])
+        for start in range(0, len(ids), batch_size):
+            page = collection.get(ids=ids[start : start + batch_size], include=["documents"])
+            index.add(page["ids"], page["documents"])
+        index._flush()
+        return index
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    # ── Maintenance ──
+
+    def add(self, ids: Sequence[str], documents: Sequence[str | None]) -> None:
+        """Index documents; an ID that is already indexed is replaced."""
+
+        if len(ids) != len(documents):
+            raise ValueError(f"got {len(ids)} ids for {len(documents)} documents")
+        with self._lock:
+            self._add(ids, documents)
+
+    def _add(self, ids: Sequence[str], documents: Sequence[str | None]) -> None:
+        self._delete([record_id for record_id in ids if record_id in self._rows])
+        start = len(self._ids)
+        lengths = np.zeros(len(ids), dtype=np.uint32)
+        pending = self._pending
+        for offset, (record_id, document) in enumerate(zip(ids, documents)):
+            row = start + offset
+            self._rows[record_id] = row
+            tokens = tokenize(document or "")
+            lengths[offset] = len(tokens)
+            counts: dict[str, int] = {}
+            for token in tokens:
+                counts[token] = counts.get(token, 0) + 1
+            for token, tf in counts.items():
+                entry = pending.get(token)
+                if entry is None:
+                    pending[token] = ([row], [tf])
+                else:
+                    entry[0].append(row)
+                    entry[1].append(tf)
+        self._ids.extend(ids)
+        self._live = np.concatenate([self._live, np.ones(len(ids), dtype=bool)])
+        self._lengths = np.concatenate([self._lengths, lengths])
+        self._total_length += int(lengths.sum())
+        self._pending_rows += len(ids)
+        if self._pending_rows >= self.flush_rows:
+            self._flush()
+
+    def delete(self, ids: Iterable[str]) -> None:
+        """Forget documents; unknown IDs are ignored."""
+
+        with self._lock:
+            self._delete(ids)
+
+    def _delete(self, ids: Iterable[str]) -> None:
+        for record_id in ids:
+            row = self._rows.pop(record_id, None)
+            if row is not None:
+                self._live[row] = False
+                self._ids[row] = None
+                self._total_length -= int(self._lengths[row])
+                self._dead += 1
+        if self._dead > len(self._rows) // 4:
+            self._compact()
+
+    def _flush(self) -> None:
+        # Rows only grow, so appending keeps every posting list sorted.
+        for term, (rows, tfs) in self._pending.items():
+            new_rows = np.asarray(rows, dtype=np.int32)
+            new_tfs = np.asarray(tfs, dtype=np.uint16)
+            old = self._postings.get(term)
+            if old is None:
+                self._postings[term] = (new_rows, new_tfs)
+            else:
+                self._postings[term] = (np.concatenate([old[0], new_rows]), np.concatenate([old[1], new_tfs]))
+        self._pending = {}
+        self._pending_rows = 0
+
+    def compact(self) -> None:
+        """Drop deleted rows from the posting lists and renumber the rest densely."""
+
+        with self._lock:
+            self._compact()
+
+    def _compact(self) -> None:
+        self._flush()
+        keep = np.flatnonzero(self._live)
+        remap = np.full(len(self._live), -1, dtype=np.int32)
+        remap[keep] = np.arange(len(keep), dtype=np.int32)
+        for term, (rows, tfs) in list(self._postings.items()):
+            alive = self._live[rows]
+            if alive.any():
+                self._postings[term] = (remap[rows[alive]], tfs[alive])
+            else:
+                del self._postings[term]
+        self._ids = [self._ids[row] for row in keep]
+        self._rows = {record_id: row for row, record_id in enumerate(self._ids)}
+        self._lengths = self._lengths[keep]
+        self._live = np.ones(len(keep), dtype=bool)
+        self._dead = 0
+
+    # ── Persistence ──
+
+    def save(self, path: str) -> None:
+        """Write a compacted snapshot to one compressed `.npz` file, atomically."""
+
+        with self._lock:
+            self._save(path)
+
+    def _save(self, path: str) -> None:
+        self._compact()
+        terms = sorted(self._postings)
+        offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(self._postings[t][0]) for t in terms])
+        rows = [self._postings[t][0] for t in terms]
+        # Posting lists are sorted, so row gaps are small and compress well.
+        gaps = [np.diff(r, prepend=0).astype(np.uint32) for r in rows]
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez_compressed(
+                f,
+                params=np.array([self.k1, self.b]),
+                terms=np.array(terms, dtype=str),
+                ids=np.array(self._ids, dtype=str),
+                offsets=offsets,
+                gaps=np.concatenate(gaps) if gaps else np.zeros(0, dtype=np.uint32),
+                tfs=np.concatenate([self._postings[t][1] for t in terms]) if terms else np.zeros(0, dtype=np.uint16),
+                lengths=self._lengths,
+            )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> BM25Index:
+        with np.load(path) as data:
+            k1, b = data["params"].tolist()
+            index = cls(k1=k1, b=b)
+            terms = data["terms"].tolist()
+            index._ids = data["ids"].tolist()
+            offsets, gaps, tfs = data["offsets"], data["gaps"], data["tfs"]
+            for i, term in enumerate(terms):
+                start, end = offsets[i], offsets[i + 1]
+                index._postings[term] = (np.cumsum(gaps[start:end]).astype(np.int32), tfs[start:end])
+            index._lengths = data["lengths"]
+        index._rows = {record_id: row for row, record_id in enumerate(index._ids)}
+        index._live = np.ones(len(index._ids), dtype=bool)
+        index._total_length = int(index._lengths.sum())
+        return index
+
+    # ── Scoring ──
+
+    def search(self, text: str, n_results: int = 10) -> list[tuple[str, float]]:
+        """Top `n_results` (id, BM25 score) pairs for a free-text query."""
+
+        with self._lock:
+            return self._search(text, n_results)
+
+    def _search(self, text: str, n_results: int) -> list[tuple[str, float]]:
+        self._flush()
+        n_docs = len(self._rows)
+        if not n_docs:
+            return []
+        avg_length = self._total_length / n_docs
+        all_rows, all_scores = [], []
+        for term in set(tokenize(text)):
+            posting = self._postings.get(term)
+            if posting is None:
+                continue
+            rows, tfs = posting
+            alive = self._live[rows]
+            rows, tf = rows[alive], tfs[alive].astype(np.float32)
+            df = len(rows)
+            if not df:
+                continue
+            idf = math.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+            norm = self.k1 * (1 - self.b + self.b * self._lengths[rows] / avg_length)
+            all_rows.append(rows)
+            all_scores.append(idf * tf * (self.k1 + 1) / (tf + norm))
+        if not all_rows:
+            return []
+        rows, inverse = np.unique(np.concatenate(all_rows), return_inverse=True)
+        scores = np.bincount(inverse, weights=np.concatenate(all_scores))
+        top = np.argpartition(-scores, min(n_results, len(scores)) - 1)[:n_results]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [(self._ids[rows[i]], float(scores[i])) for i in top]
+
+
+@dataclass
+class Hit:
+    id: str
+    score: float
+    lexical_rank: int | None
+    vector_rank: int | None
+
+
+def fuse(
+    lexical: list[tuple[str, float]],
+    vector: list[tuple[str, float]],
+    n_results: int,
+    mode: str = "rrf",
+    alpha: float = 0.5,
+    rrf_k: int = 60,
+) -> list[Hit]:
+    """Fuse BM25 (id, score) and vector (id, distance) lists, best first.
+
+    `rrf`: sum of 1 / (rrf_k + rank). `weighted`: `alpha` * normalized vector
+    similarity + (1 - `alpha`) * normalized BM25 score.
+    """
+
+    if mode not in ("rrf", "weighted"):
+        raise ValueError(f"unknown fusion mode {mode!r}")
+    lexical_rank = {record_id: rank for rank, (record_id, _) in enumerate(lexical, 1)}
+    vector_rank = {record_id: rank for rank, (record_id, _) in enumerate(vector, 1)}
+    scores: dict[str, float] = {}
+    if mode == "rrf":
+        for ranks in (lexical_rank, vector_rank):
+            for record_id, rank in ranks.items():
+                scores[record_id] = scores.get(record_id, 0.0) + 1 / (rrf_k + rank)
+    else:
+
+        def normalized(values: list[float]) -> list[float]:
+            low, high = min(values, default=0.0), max(values, default=0.0)
+            return [(v - low) / (high - low) if high > low else 1.0 for v in values]
+
+        # Smaller distances are better, so negate them before normalizing.
+        for weight, hits, sign in ((1 - alpha, lexical, 1), (alpha, vector, -1)):
+            for (record_id, _), value in zip(hits, normalized([sign * s for _, s in hits])):
+                scores[record_id] = scores.get(record_id, 0.0) + weight * value
+    ordered = sorted(scores.items(), key=lambda item: -item[1])[:n_results]
+    return [Hit(i, s, lexical_rank.get(i), vector_rank.get(i)) for i, s in ordered]
+
+
+class HybridCollection:
+    """A collection plus a `BM25Index` that follows writes made through it."""
+
+    def __init__(self, collection: Any, index: BM25Index | None = None, workers: int = 4) -> None:
+        self.collection = collection
+        self.index = index if index is not None else BM25Index.from_collection(collection)
+        self._pool = ThreadPoolExecutor(max_workers=workers)
+
+    def add(self, ids: list[str], documents: list[str], **kwargs: Any) -> None:
+        self.collection.add(ids=ids, documents=documents, **kwargs)
+        self.index.add(ids, documents)
+
+    def upsert(self, ids: list[str], documents: list[str], **kwargs: Any) -> None:
+        self.collection.upsert(ids=ids, documents=documents, **kwargs)
+        self.index.add(ids, documents)
+
+    def update(self, ids: list[str], documents: list[str] | None = None, **kwargs: Any) -> None:
+        self.collection.update(ids=ids, documents=documents, **kwargs)
+        if documents is not None:
+            self.index.add(ids, documents)
+
+    def delete(self, ids: list[str]) -> None:
+        self.collection.delete(ids=ids)
+        self.index.delete(ids)
+
+    def search(
+        self,
+        text: str,
+        query_embedding: Any = None,
+        n_results: int = 10,
+        mode: str = "rrf",
+        alpha: float = 0.5,
+        candidates: int = 50,
+    ) -> list[Hit]:
+        """Fused top `n_results` for `text`, retrieving `candidates` from each side concurrently.
+
+        Without `query_embedding`, `text` is embedded by the collection's
+        embedding function.
+        """
+
+        lexical = self._pool.submit(self.index.search, text, candidates)
+        query_input = {"query_embeddings": [query_embedding]} if query_embedding is not None else {"query_texts": [text]}
+        result = self.collection.query(n_results=candidates, include=["distances"], **query_input)
+        vector = list(zip(result["ids"][0], result["distances"][0]))
+        return fuse(lexical.result(), vector, n_results, mode=mode, alpha=alpha)
+
+    def close(self) -> None:
+        self._pool.shutdown()
+
+
+# ── Benchmark ──
+
+
+def hashed_embedding(text: str, dim: int = 128) -> np.ndarray:
+    """Deterministic bag-of-words stand-in for an embedding model."""
+
+    vector = np.zeros(dim, dtype=np.float32)
+    for token in tokenize(text):
+        h = zlib.crc32(token.encode())
+        vector[h % dim] += 1.0 if h & 0x80000000 else -1.0
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+def _corpus(size: int, seed: int) -> tuple[list[str], list[str]]:
+    rng = random.Random(seed)
+    vocabulary = [f"w{i}" for i in range(3000)]
+    codes = [f"ERR-{i:05d}" for i in range(size)]
+    rng.shuffle(codes)
+    docs = []
+    for i in range(size):
+        words = rng.choices(vocabulary, k=rng.randint(8, 30))
+        words.insert(rng.randrange(len(words)), codes[i])
+        docs.append(" ".join(words))
+    return docs, codes
+
+
+def _summary(samples: list[float]) -> str:
+    values = np.asarray(samples) * 1000
+    return f"p50={np.percentile(values, 50):6.2f}ms p95={np.percentile(values, 95):6.2f}ms"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark BM25 hybrid search against $contains filtering.")
+    parser.add_argument("--docs", type=int, default=100_000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    docs, codes = _corpus(args.docs, args.seed)
+    ids = [f"doc-{i:07d}" for i in range(args.docs)]
+    embeddings = np.stack([hashed_embedding(d) for d in docs])
+    client = chromadb.EphemeralClient()
+    try:
+        client.delete_collection("hybrid_bench")
+    except Exception:
+        pass
+    collection = client.create_collection("hybrid_bench", embedding_function=None)
+    batch_size = client.get_max_batch_size()
+    for start in range(0, args.docs, batch_size):
+        end = min(start + batch_size, args.docs)
+        collection.add(ids=ids[start:end], documents=docs[start:end], embeddings=embeddings[start:end])
+
+    started = time.perf_counter()
+    hybrid = HybridCollection(collection)
+    print(f"BM25 index over {len(hybrid.index):,} documents built in {time.perf_counter() - started:.1f}s")
+
+    # Incremental updates and the on-disk round trip must not change results.
+    hybrid.upsert(ids=[ids[0]], documents=["ERR-99999 replaced text"], embeddings=[hashed_embedding("ERR-99999")])
+    hybrid.delete(ids=[ids[1]])
+    docs[0], codes[0] = "ERR-99999 replaced text", "ERR-99999"
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bm25_bench.npz")
+    try:
+        hybrid.index.save(path)
+        reloaded = BM25Index.load(path)
+        print(f"saved index: {os.path.getsize(path) / 1e6:.1f} MB")
+    finally:
+        if os.path.exists(path):
+            os.remove(path)
+    if hybrid.index.search("ERR-99999 w12") != reloaded.search("ERR-99999 w12"):
+        raise AssertionError("reloaded index scores differ")
+    if hybrid.index.search(codes[1]) and hybrid.index.search(codes[1])[0][0] == ids[1]:
+        raise AssertionError("deleted document is still searchable")
+    hybrid.index = reloaded
+
+    rng = random.Random(args.seed + 1)
+    targets = rng.sample(range(2, args.docs), args.queries)
+    queries = []
+    for i in targets:
+        words = [w for w in docs[i].split() if not w.startswith("ERR-")]
+        queries.append((ids[i], " ".join([codes[i], *rng.sample(words, 2)])))
+
+    def contains(text: str) -> list[str]:
+        tokens = text.split()
+        where_document = {"$or": [{"$contains": t} for t in tokens]}
+        result = collection.query(
+            query_embeddings=[hashed_embedding(text)], n_results=args.k, where_document=where_document, include=[]
+        )
+        return result["ids"][0]
+
+    def vector(text: str) -> list[str]:
+        return collection.query(query_embeddings=[hashed_embedding(text)], n_results=args.k, include=[])["ids"][0]
+
+    methods = {
+        "vector only": vector,
+        "vector + $contains": contains,
+        "bm25 only": lambda text: [i for i, _ in hybrid.index.search(text, args.k)],
+        "hybrid rrf": lambda text: [h.id for h in hybrid.search(text, hashed_embedding(text), args.k)],
+        "hybrid weighted": lambda text: [
+            h.id for h in hybrid.search(text, hashed_embedding(text), args.k, mode="weighted", alpha=0.3)
+        ],
+    }
+    for name, method in methods.items():
+        latencies, reciprocal_ranks = [], []
+        for target, text in queries:
+            started = time.perf_counter()
+            found = method(text)
+            latencies.append(time.perf_counter() - started)
+            reciprocal_ranks.append(1 / (found.index(target) + 1) if target in found else 0.0)
+        hits = sum(r > 0 for r in reciprocal_ranks)
+        print(
+            f"{name:<20} recall@{args.k}={hits / len(queries):.3f} "
+            f"MRR={sum(reciprocal_ranks) / len(queries):.3f} {_summary(latencies)}"
+        )
+    hybrid.close()
+
+    print("\npython: hybrid search example passed")
+
+
+if __name__ == "__main__":
+    main()
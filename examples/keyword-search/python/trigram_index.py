@@ -0,0 +1,513 @@
+"""Local trigram index that narrows `$regex` / `$not_regex` document filters.
+
+`keyword_search.py` filters with `where_document={"$regex": "technology.*pace"}`.
+`TrigramIndex` keeps, beside the collection, a posting list of record rows for
+every three-character substring of each document. A regex is turned into the
+trigrams any match must contain (`technology.*pace` needs `tec`, `ech`, ...,
+`pac`, `ace`), the posting lists give a candidate ID set, and the exact regex
+then runs only on the candidate documents, fetched with `get(ids=...)`:
+
+- `$regex`: the verified matches are passed to `query(ids=...)` /
+  `get(ids=...)`; an empty match set skips the call entirely.
+- `$not_regex`: records outside the candidate set cannot match the regex, so
+  only the candidates are checked and the matches are excluded.
+
+The check runs on Python's `re`, which agrees with Chroma's Rust regex engine
+for common syntax but not for every construct.
+
+Patterns the analysis cannot use (no literal of three or more characters,
+case-insensitive flags, syntax Python's `re` does not parse) fall back to a
+plain Chroma filter, so results never change, only the cost. Matching is
+case-sensitive, like Chroma's.
+
+The index follows `add()` / `delete()` calls; deleted rows are dropped from
+the posting lists by `compact()`, which runs automatically once a quarter of
+the rows are dead.
+
+Usage:
+    from trigram_index import TrigramIndex
+
+    index = TrigramIndex.from_collection(collection)
+    index.query(collection, "technology.*pace", query_embeddings=[q], n_results=3)
+    index.get(collection, "Innovation.*topic", negate=True, include=["documents"])
+    collection.add(ids=new_ids, documents=new_docs, embeddings=new_embeddings)
+    index.add(new_ids, new_docs)
+
+Run the benchmark on a generated corpus (local, no server):
+    python trigram_index.py --docs 1000000
+"""
+
+from __future__ import annotations
+
+import argparse
+import random
+import re
+import time
+from typing import Any, Iterable, Sequence
+
+import chromadb
+import numpy as np
+
+try:
+    from re import _constants as sre_constants, _parser as sre_parse
+except ImportError:  # Python < 3.11
+    import sre_constants  # type: ignore[no-redef]
+    import sre_parse  # type: ignore[no-redef]
+
+ALL = ("all",)
+MAX_EXACT = 64
+MAX_CLASS = 8
+QUERY_FIELDS = ("ids", "embeddings", "documents", "uris", "metadatas", "distances")
+
+
+def trigrams(text: str) -> set[str]:
+    return {text[i : i + 3] for i in range(len(text) - 2)}
+
+
+def _and(parts: list[Any]) -> Any:
+    parts = [p for p in parts if p is not ALL]
+    if not parts:
+        return ALL
+    return parts[0] if len(parts) == 1 else ("and", parts)
+
+
+def _or(parts: list[Any]) -> Any:
+    if not parts or any(p is ALL for p in parts):
+        return ALL
+    return parts[0] if len(parts) == 1 else ("or", parts)
+
+
+def _exact_query(strings: set[str]) -> Any:
+    """A match contains one of `strings`, so it contains all trigrams of one of them."""
+
+    return _or([_and([("tri", t) for t in sorted(trigrams(s))]) for s in sorted(strings)])
+
+
+def _analyze(items: Any) -> tuple[Any, set[str] | None]:
+    """(trigram query, set of exact strings or None) for a parsed regex sequence."""
+
+    parts: list[Any] = []
+    current: set[str] | None = {""}
+    exact = True
+    for op, av in items:
+        if op is sre_constants.AT:
+            continue  # Zero-width: literals on both sides stay adjacent.
+        if op is sre_constants.LITERAL:
+            query, strings = ALL, {chr(av)}
+        elif op is sre_constants.IN and len(av) <= MAX_CLASS and all(
+            item_op is sre_constants.LITERAL for item_op, _ in av
+        ):
+            query, strings = ALL, {chr(c) for _, c in av}
+        elif op is sre_constants.SUBPATTERN:
+            _, add_flags, _, sub = av
+            if add_flags & sre_constants.SRE_FLAG_IGNORECASE:
+                query, strings = ALL, None
+            else:
+                query, strings = _analyze(sub)
+        elif op is sre_constants.BRANCH:
+            branches = [_analyze(alternative) for alternative in av[1]]
+            union: set[str] | None = set()
+            for branch_query, branch_strings in branches:
+                if branch_strings is None or union is None:
+                    union = None
+                else:
+                    union |= branch_strings
+            if union is not None and len(union) <= MAX_EXACT:
+                query, strings = ALL, union
+            else:
+                query = _or([q if s is None else _exact_query(s) for q, s in branches])
+                strings = None
+        elif op in (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT) or op.name == "POSSESSIVE_REPEAT":
+            low, _, sub = av
+            sub_query, sub_strings = _analyze(sub)
+            query = (sub_query if sub_strings is None else _exact_query(sub_strings)) if low else ALL
+            strings = None
+        else:
+            query, strings = ALL, None
+
+        if strings is not None and current is not None and len(current) * len(strings) <= MAX_EXACT:
+            current = {a + b for a in current for b in strings}
+            continue
+        exact = False
+        if current is not None:
+            parts.append(_exact_query(current))
+        parts.append(query)
+        current = strings if strings is not None else {""}
+
+    if current is not None:
+        parts.append(_exact_query(current))
+    return _and(parts), current if exact else None
+
+
+def regex_trigram_query(pattern: str) -> Any:
+    """Trigram query every document matching `pattern` satisfies, or `ALL`."""
+
+    try:
+        parsed = sre_parse.parse(pattern)
+    except Exception:
+        return ALL  # Rust regex syntax Python does not parse: no prefilter.
+    if parsed.state.flags & sre_constants.SRE_FLAG_IGNORECASE:
+        return ALL
+    return _analyze(parsed)[0]
+
+
+class TrigramIndex:
+    """Trigram -> sorted row posting lists for the documents of one collection."""
+
+    def __init__(self, flush_rows: int = 50_000) -> None:
+        self.flush_rows = flush_rows
+        self._ids: list[str | None] = []
+        self._rows: dict[str, int] = {}
+        self._live = np.zeros(0, dtype=bool)
+        self._postings: dict[str, np.ndarray] = {}
+        self._pending: dict[str, list[int]] = {}
+        self._pending_rows = 0
+        self._dead = 0
+
+    @classmethod
+    def from_collection(cls, collection: Any, batch_size: int = 5000) -> TrigramIndex:
+        index = cls()
+        # Page by ID over one snapshot: offset paging rescans earlier rows and drifts under writes.
+        ids = sorted(collection.get(include=[])["ids"])
+        for start in range(0, len(ids), batch_size):
+            page = collection.get(ids=ids[start : start + batch_size], include=["documents"])
+            index.add(page["ids"], page["documents"])
+        index._flush()
+        return index
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(p.nbytes for p in self._postings.values()) + self._live.nbytes
+
+    # ── Maintenance ──
+
+    def add(self, ids: Sequence[str], documents: Sequence[str | None]) -> None:
+        """Index documents; an ID that is already indexed is replaced (upsert)."""
+
+        if len(ids) != len(documents):
+            raise ValueError(f"got {len(ids)} ids for {len(documents)} documents")
+        self.delete([record_id for record_id in ids if record_id in self._rows])
+        start = len(self._ids)
+        self._ids.extend(ids)
+        self._live = np.concatenate([self._live, np.ones(len(ids), dtype=bool)])
+        pending = self._pending
+        for row, (record_id, document) in enumerate(zip(ids, documents), start):
+            self._rows[record_id] = row
+            for trigram in trigrams(document or ""):
+                rows = pending.get(trigram)
+                if rows is None:
+                    pending[trigram] = [row]
+                else:
+                    rows.append(row)
+        self._pending_rows += len(ids)
+        if self._pending_rows >= self.flush_rows:
+            self._flush()
+
+    def delete(self, ids: Iterable[str]) -> None:
+        """Forget documents; unknown IDs are ignored."""
+
+        for record_id in ids:
+            row = self._rows.pop(record_id, None)
+            if row is not None:
+                self._live[row] = False
+                self._ids[row] = None
+                self._dead += 1
+        if self._dead > len(self._rows) // 4:
+            self.compact()
+
+    def _flush(self) -> None:
+        # Rows only grow, so appending keeps every posting list sorted.
+        for trigram, rows in self._pending.items():
+            new = np.asarray(rows, dtype=np.int32)
+            old = self._postings.get(trigram)
+            self._postings[trigram] = new if old is None else np.concatenate([old, new])
+        self._pending = {}
+        self._pending_rows = 0
+
+    def compact(self) -> None:
+        """Drop deleted rows from the posting lists."""
+
+        self._flush()
+        for trigram, rows in list(self._postings.items()):
+            kept = rows[self._live[rows]]
+            if len(kept):
+                self._postings[trigram] = kept
+            else:
+                del self._postings[trigram]
+        self._dead = 0
+
+    # ── Candidates ──
+
+    def _eval(self, node: Any) -> np.ndarray | None:
+        if node is ALL:
+            return None
+        if node[0] == "tri":
+            return self._postings.get(node[1], np.empty(0, dtype=np.int32))
+        children = [self._eval(child) for child in node[1]]
+        if node[0] == "or":
+            if any(child is None for child in children):
+                return None
+            return np.unique(np.concatenate(children))
+        result = None
+        for child in sorted((c for c in children if c is not None), key=len):
+            result = child if result is None else np.intersect1d(result, child, assume_unique=True)
+            if not len(result):
+                break
+        return result
+
+    def candidates(self, pattern: str) -> list[str] | None:
+        """IDs of the documents that may match `pattern`; `None` if every document may."""
+
+        self._flush()
+        rows = self._eval(regex_trigram_query(pattern))
+        if rows is None:
+            return None
+        ids = self._ids
+        return [ids[row] for row in rows[self._live[rows]]]
+
+    # ── Search ──
+
+    def matches(self, collection: Any, pattern: str, batch_size: int = 5000) -> list[str] | None:
+        """IDs whose document matches `pattern`, checking only the candidates.
+
+        Candidate documents are fetched and checked with Python's `re`;
+        `None` if the index cannot narrow the pattern.
+        """
+
+        candidates = self.candidates(pattern)
+        if candidates is None:
+            return None
+        regex = re.compile(pattern)
+        matched = []
+        for start in range(0, len(candidates), batch_size):
+            page = collection.get(ids=candidates[start : start + batch_size], include=["documents"])
+            matched.extend(
+                record_id
+                for record_id, document in zip(page["ids"], page["documents"])
+                if document is not None and regex.search(document)
+            )
+        return matched
+
+    def get(
+        self,
+        collection: Any,
+        pattern: str,
+        negate: bool = False,
+        batch_size: int = 5000,
+        **get_kwargs: Any,
+    ) -> dict[str, Any]:
+        """`collection.get(where_document={"$regex" | "$not_regex": pattern})`, narrowed by the index.
+
+        Returns every match; `limit` / `offset` are not supported.
+        """
+
+        if "limit" in get_kwargs or "offset" in get_kwargs:
+            raise ValueError("limit/offset are not supported; page over the returned IDs instead")
+        matched = self.matches(collection, pattern, batch_size)
+        if matched is None:
+            op = "$not_regex" if negate else "$regex"
+            return collection.get(where_document={op: pattern}, **get_kwargs)
+        if negate:
+            excluded = set(matched)
+            matched = [record_id for record_id in self._rows if record_id not in excluded]
+        return _get_ids(collection, matched, batch_size, **get_kwargs)
+
+    def query(
+        self,
+        collection: Any,
+        pattern: str,
+        negate: bool = False,
+        n_results: int = 10,
+        max_candidates: int = 20_000,
+        **query_kwargs: Any,
+    ) -> dict[str, Any]:
+        """`collection.query(where_document={"$regex" | "$not_regex": pattern})`, narrowed by the index.
+
+        Patterns with more than `max_candidates` candidates are cheaper to
+        leave to Chroma, so those queries go through unchanged.
+        """
+
+        candidates = self.candidates(pattern)
+        if candidates is None or len(candidates) > max_candidates:
+            op = "$not_regex" if negate else "$regex"
+            return collection.query(where_document={op: pattern}, n_results=n_results, **query_kwargs)
+        matched = self.matches(collection, pattern) or []
+        if not negate:
+            if not matched:
+                return _empty_query_result(query_kwargs)
+            return collection.query(ids=matched, n_results=n_results, **query_kwargs)
+        # Over-fetch by the number of matches, then drop them: exact for the top n_results.
+        result = collection.query(n_results=n_results + len(matched), **query_kwargs)
+        return _drop_ids(result, set(matched), n_results)
+
+
+def _get_ids(collection: Any, ids: list[str], batch_size: int, **get_kwargs: Any) -> dict[str, Any]:
+    include = list(get_kwargs.get("include", ["metadatas", "documents"]))
+    merged: dict[str, Any] = {k: None for k in QUERY_FIELDS if k != "distances"}
+    for key in ["ids", *include]:
+        merged[key] = []
+    merged["included"] = include
+    for start in range(0, len(ids), batch_size):
+        page = collection.get(ids=ids[start : start + batch_size], **get_kwargs)
+        for key in ["ids", *include]:
+            merged[key].extend(page[key])
+    return merged
+
+
+def _empty_query_result(query_kwargs: dict[str, Any]) -> dict[str, Any]:
+    inputs = next(
+        (query_kwargs[k] for k in ("query_embeddings", "query_texts", "query_images", "query_uris") if k in query_kwargs),
+        [None],
+    )
+    include = list(query_kwargs.get("include", ["metadatas", "documents", "distances"]))
+    result: dict[str, Any] = {k: None for k in QUERY_FIELDS}
+    for key in ["ids", *include]:
+        result[key] = [[] for _ in inputs]
+    result["included"] = include
+    return result
+
+
+def _drop_ids(result: dict[str, Any], exclude: set[str], n_results: int) -> dict[str, Any]:
+    out = dict(result)
+    keep_rows = [[i for i, record_id in enumerate(row) if record_id not in exclude][:n_results] for row in result["ids"]]
+    for key in QUERY_FIELDS:
+        if result.get(key) is not None:
+            out[key] = [[group[i] for i in keep] for group, keep in zip(result[key], keep_rows)]
+    return out
+
+
+# ── Benchmark ──
+
+PATTERNS = [
+    "technology.*pace",
+    "Innovation.*topic",
+    "(GPU|CUDA) driver",
+    "tech[a-z]+ogy",
+    "\\bAI\\b",  # two characters only: goes to Chroma unchanged
+]
+
+
+def _corpus(size: int, seed: int) -> list[str]:
+    rng = random.Random(seed)
+    alphabet = "abcdefghijklmnopqrstuvwxyz"
+    words = ["".join(rng.choice(alphabet) for _ in range(rng.randint(3, 9))) for _ in range(5000)]
+    docs = []
+    for i in range(size):
+        text = rng.sample(words, 10)
+        if i % 1000 == 0:
+            text[3:3] = ["AI", "technology"]
+            text.append("pace")
+        if i % 2500 == 7:
+            text[1:1] = ["Innovation", "in"]
+            text.append("topic")
+        if i % 5000 == 11:
+            text[5:5] = [rng.choice(["GPU", "CUDA"]), "driver"]
+        docs.append(" ".join(text))
+    return docs
+
+
+def _timed(fn: Any, repeats: int) -> tuple[Any, float]:
+    started = time.perf_counter()
+    for _ in range(repeats):
+        result = fn()
+    return result, (time.perf_counter() - started) / repeats * 1000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark trigram-narrowed regex filters.")
+    parser.add_argument("--docs", type=int, default=1_000_000)
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    for pattern, expected in [
+        ("technology.*pace", "and"),
+        ("(GPU|CUDA) driver", "or"),
+        ("ab", "all"),
+        ("(?i)technology", "all"),
+    ]:
+        query = regex_trigram_query(pattern)
+        if query[0] != expected:
+            raise AssertionError(f"unexpected trigram query for {pattern!r}: {query}")
+
+    docs = _corpus(args.docs, args.seed)
+    ids = [f"doc-{i:08d}" for i in range(args.docs)]
+    rng = np.random.default_rng(args.seed)
+    client = chromadb.EphemeralClient()
+    try:
+        client.delete_collection("trigram_bench")
+    except Exception:
+        pass
+    collection = client.create_collection("trigram_bench", embedding_function=None)
+    batch_size = client.get_max_batch_size()
+    started = time.perf_counter()
+    for start in range(0, args.docs, batch_size):
+        end = min(start + batch_size, args.docs)
+        collection.add(
+            ids=ids[start:end],
+            documents=docs[start:end],
+            embeddings=rng.random((end - start, 8), dtype=np.float32),
+        )
+    print(f"seeded {args.docs:,} documents in {time.perf_counter() - started:.0f}s")
+
+    started = time.perf_counter()
+    index = TrigramIndex()
+    for start in range(0, args.docs, 10_000):
+        index.add(ids[start : start + 10_000], docs[start : start + 10_000])
+    index.compact()
+    print(
+        f"indexed in {time.perf_counter() - started:.1f}s, "
+        f"{len(index._postings):,} trigrams, postings={index.nbytes / 1e6:.0f} MB"
+    )
+
+    removed = ids[3 :: max(1, args.docs // 200)]
+    collection.delete(ids=removed)
+    index.delete(removed)
+    extra_ids = [f"new-{i}" for i in range(3)]
+    extra_docs = ["fresh technology at a steady pace", "Innovation is the topic", "CUDA driver notes"]
+    collection.add(ids=extra_ids, documents=extra_docs, embeddings=rng.random((3, 8), dtype=np.float32))
+    index.add(extra_ids, extra_docs)
+
+    query = rng.random((1, 8), dtype=np.float32)
+    for pattern in PATTERNS:
+        for negate in (False, True):
+            op = "$not_regex" if negate else "$regex"
+            if not negate:
+                plain, plain_ms = _timed(
+                    lambda: collection.get(where_document={op: pattern}, include=[]), args.repeats
+                )
+                narrowed, narrowed_ms = _timed(
+                    lambda: index.get(collection, pattern, include=[]), args.repeats
+                )
+                if sorted(plain["ids"]) != sorted(narrowed["ids"]):
+                    raise AssertionError(f"get {op} {pattern!r}: results differ")
+                print(
+                    f"get   {op:<10} {pattern!r:<22} matches={len(plain['ids']):>7,} "
+                    f"chroma={plain_ms:8.1f}ms indexed={narrowed_ms:8.1f}ms"
+                )
+            plain, plain_ms = _timed(
+                lambda: collection.query(
+                    query_embeddings=query, n_results=10, where_document={op: pattern}, include=["distances"]
+                ),
+                args.repeats,
+            )
+            narrowed, narrowed_ms = _timed(
+                lambda: index.query(
+                    collection, pattern, negate=negate, query_embeddings=query, n_results=10, include=["distances"]
+                ),
+                args.repeats,
+            )
+            if not np.allclose(plain["distances"][0], narrowed["distances"][0], rtol=1e-5):
+                raise AssertionError(f"query {op} {pattern!r}: top-k distances differ")
+            print(
+                f"query {op:<10} {pattern!r:<22} chroma={plain_ms:8.1f}ms indexed={narrowed_ms:8.1f}ms"
+            )
+
+    print("\npython: trigram index example passed")
+
+
+if __name__ == "__main__":
+    main()
@@ -6,14 +6,30 @@ Shows a full roundtrip:
 3) read back and validate again
 4) run a filtered query and parse top metadata result
 
+`insert_validated_record()` / `read_validated_record()` make one Pydantic
+call and one Chroma round trip per record. For ingest jobs,
+`insert_validated_records()` validates the whole batch in one pass with a
+compiled list-level `TypeAdapter` and collects every rejection with its index. It then
+inserts the valid rows in `max_batch_size` chunks and returns a
+`BulkInsertReport`. `read_validated_records()` is the matching bulk read.
+
 Requires a running Chroma server, for example:
     docker run --rm -p 8000:8000 chromadb/chroma:1.5.3
+
+Bulk path vs the per-record loop (insert + read back):
+    python schema_validation.py --bench --records 100000
 """
 
-from typing import Any, Literal
+import argparse
+import contextlib
+import io
+import time
+from dataclasses import dataclass, field
+from typing import Annotated, Any, Literal, Sequence
 
 import chromadb
-from pydantic import BaseModel, ConfigDict, Field, ValidationError
+from pydantic import BaseModel, ConfigDict, Field, TypeAdapter, ValidationError, WrapValidator
+from typing_extensions import TypedDict  # pydantic needs it instead of typing.TypedDict before Python 3.12
 
 
 class RecordMetadata(BaseModel):
@@ -66,8 +82,226 @@ def read_validated_record(collection: Any, record_id: str) -> RecordMetadata:
     return parsed
 
 
+# ── Bulk path ──
+
+@dataclass
+class _Invalid:
+    errors: list[dict[str, Any]]
+
+
+def _capture_errors(value: Any, handler: Any) -> Any:
+    try:
+        return handler(value)
+    except ValidationError as exc:
+        return _Invalid(exc.errors(include_url=False))
+
+
+def _row_type(model: type[BaseModel]) -> Any:
+    """A TypedDict with `model`'s fields, constraints and config, validated straight into plain dicts.
+
+    Skips building a model instance and dumping it again per record. All of
+    `RecordMetadata`'s fields are required, so rows equal `model_dump()` output.
+    """
+
+    fields = {
+        name: Annotated[(info.annotation, *info.metadata)] if info.metadata else info.annotation
+        for name, info in model.model_fields.items()
+    }
+    row = TypedDict(f"{model.__name__}Row", fields)  # type: ignore[misc]
+    row.__pydantic_config__ = model.model_config  # type: ignore[attr-defined]
+    return row
+
+
+# Built once: pydantic compiles each adapter's validator. A plain list validator fails
+# the whole list on one bad item; the wrap validator turns each bad item into an
+# `_Invalid`, so a batch is validated in a single pass.
+_METADATA_BATCH = TypeAdapter(list[Annotated[_row_type(RecordMetadata), WrapValidator(_capture_errors)]])
+_METADATA_LIST = TypeAdapter(list[RecordMetadata])
+
+
+@dataclass
+class Rejection:
+    index: int
+    id: str
+    errors: list[dict[str, Any]]
+
+
+@dataclass
+class BulkInsertReport:
+    received: int = 0
+    inserted: int = 0
+    batches: int = 0
+    rejected: list[Rejection] = field(default_factory=list)
+    validate_seconds: float = 0.0
+    insert_seconds: float = 0.0
+
+    def __str__(self) -> str:
+        return (
+            f"inserted {self.inserted}/{self.received} in {self.batches} batches, "
+            f"rejected {len(self.rejected)}; validate {self.validate_seconds:.2f}s insert {self.insert_seconds:.2f}s"
+        )
+
+
+def insert_validated_records(
+    collection: Any, records: Sequence[RawRecord], batch_size: int
+) -> BulkInsertReport:
+    """Validate a batch in one call, then insert the valid rows in `batch_size` chunks.
+
+    Pass the client's `get_max_batch_size()` as `batch_size`.
+    """
+
+    report = BulkInsertReport(received=len(records))
+    started = time.perf_counter()
+    results = _METADATA_BATCH.validate_python([record.metadata for record in records])
+    accepted: dict[str, int] = {}
+    rows: list[dict[str, Any]] = []
+    for index, (record, result) in enumerate(zip(records, results)):
+        errors = list(result.errors) if isinstance(result, _Invalid) else []
+        # Chroma rejects a whole add() that repeats an ID, so catch repeats per record here.
+        if record.id in accepted:
+            errors.append({"type": "duplicate_id", "loc": ("id",), "msg": f"duplicate of index {accepted[record.id]}"})
+        if errors:
+            report.rejected.append(Rejection(index, record.id, errors))
+        else:
+            accepted[record.id] = index
+            rows.append(result)
+    records = [records[index] for index in accepted.values()]
+    report.validate_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    for start in range(0, len(records), batch_size):
+        chunk = records[start : start + batch_size]
+        collection.add(
+            ids=[record.id for record in chunk],
+            documents=[record.document for record in chunk],
+            embeddings=[record.embedding for record in chunk],
+            metadatas=rows[start : start + batch_size],
+        )
+        report.batches += 1
+        report.inserted += len(chunk)
+    report.insert_seconds = time.perf_counter() - started
+    return report
+
+
+def read_validated_records(
+    collection: Any, record_ids: Sequence[str], batch_size: int
+) -> dict[str, RecordMetadata]:
+    """Read records by id in `batch_size` chunks and parse each chunk's metadata in one call."""
+
+    record_ids = list(dict.fromkeys(record_ids))  # a repeated id is read once, not counted as missing
+    parsed: dict[str, RecordMetadata] = {}
+    for start in range(0, len(record_ids), batch_size):
+        result = collection.get(ids=list(record_ids[start : start + batch_size]), include=["metadatas"])
+        parsed.update(zip(result["ids"], _METADATA_LIST.validate_python(result["metadatas"])))
+    missing = len(record_ids) - len(parsed)
+    if missing:
+        raise ValueError(f"{missing} of {len(record_ids)} records not found")
+    return parsed
+
+
+def _random_records(count: int, dim: int, invalid_every: int = 50) -> list[RawRecord]:
+    """Synthetic records; every `invalid_every`-th one breaks the contract in some way."""
+
+    doc_types = ("policy", "faq", "runbook")
+    breakages = (
+        {"priority": 9},
+        {"doc_type": "memo"},
+        {"tenant_id": ""},
+        {"quality_score": 1.5},
+        {"owner": "unknown-field"},
+    )
+    records = []
+    for i in range(count):
+        metadata = {
+            "tenant_id": f"tenant-{i % 20}",
+            "doc_type": doc_types[i % 3],
+            "published": i % 2 == 0,
+            "priority": i % 5 + 1,
+            "quality_score": (i % 100) / 100,
+        }
+        if i % invalid_every == invalid_every - 1:
+            metadata.update(breakages[(i // invalid_every) % len(breakages)])
+        records.append(
+            RawRecord.model_construct(
+                id=f"doc-{i}",
+                document=f"Document {i} for tenant {i % 20}.",
+                embedding=[((i * 31 + j * 17) % 1000) / 1000 for j in range(dim)],
+                metadata=metadata,
+            )
+        )
+    return records
+
+
+def bench(client: Any, count: int, dim: int) -> None:
+    records = _random_records(count, dim)
+    print(f"{count:,} records ({count // 50:,} invalid), {dim}-dim embeddings")
+
+    # Validation alone: per-record model_validate()/model_dump() vs one batch pass.
+    metadatas = [record.metadata for record in records]
+    started = time.perf_counter()
+    for metadata in metadatas:
+        try:
+            RecordMetadata.model_validate(metadata).model_dump()
+        except ValidationError as exc:
+            exc.errors()
+    loop_validate = time.perf_counter() - started
+    started = time.perf_counter()
+    _METADATA_BATCH.validate_python(metadatas)
+    batch_validate = time.perf_counter() - started
+    print(f"validation only: per-record {loop_validate:.2f}s, batch {batch_validate:.2f}s")
+
+    for name in ("metadata_schema_bulk", "metadata_schema_loop"):
+        try:
+            client.delete_collection(name=name)
+        except Exception:
+            pass
+
+    bulk = client.create_collection(name="metadata_schema_bulk")
+    started = time.perf_counter()
+    report = insert_validated_records(bulk, records, client.get_max_batch_size())
+    bulk_insert = time.perf_counter() - started
+    rejected = {rejection.index for rejection in report.rejected}
+    inserted = [record.id for i, record in enumerate(records) if i not in rejected]
+    started = time.perf_counter()
+    read_validated_records(bulk, inserted, client.get_max_batch_size())
+    bulk_read = time.perf_counter() - started
+    print(f"bulk:       insert {bulk_insert:6.1f}s ({count / bulk_insert:8,.0f} rec/s)  read {bulk_read:5.1f}s  {report}")
+
+    loop = client.create_collection(name="metadata_schema_loop")
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):  # the helpers print one line per record
+        loop_ids = [record.id for record in records if insert_validated_record(loop, record) is not None]
+    loop_insert = time.perf_counter() - started
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        for record_id in loop_ids:
+            read_validated_record(loop, record_id)
+    loop_read = time.perf_counter() - started
+    print(f"per-record: insert {loop_insert:6.1f}s ({count / loop_insert:8,.0f} rec/s)  read {loop_read:5.1f}s")
+    print(f"speedup: insert {loop_insert / bulk_insert:.0f}x, read {loop_read / bulk_read:.0f}x")
+
+    if loop_ids != inserted or bulk.count() != loop.count():
+        raise AssertionError("bulk and per-record paths accepted different records")
+    sample = inserted[:: max(1, len(inserted) // 100)]
+    a, b = (c.get(ids=sample, include=["metadatas"]) for c in (bulk, loop))
+    if dict(zip(a["ids"], a["metadatas"])) != dict(zip(b["ids"], b["metadatas"])):
+        raise AssertionError("bulk and per-record paths stored different metadata")
+    for name in ("metadata_schema_bulk", "metadata_schema_loop"):
+        client.delete_collection(name=name)
+
+
 def main() -> None:
+    parser = argparse.ArgumentParser(description="Pydantic-validated writes to Chroma.")
+    parser.add_argument("--bench", action="store_true", help="benchmark the bulk path against the per-record loop")
+    parser.add_argument("--records", type=int, default=100_000)
+    parser.add_argument("--dim", type=int, default=16)
+    args = parser.parse_args()
+
     client = chromadb.HttpClient(host="localhost", port=8000)
+    if args.bench:
+        bench(client, args.records, args.dim)
+        return
+
     collection_name = "metadata_schema_python"
 
     try:
@@ -146,6 +380,22 @@ def main() -> None:
         parsed = RecordMetadata.model_validate(top_meta)
         print(f"query top metadata (typed): {parsed.model_dump()}")
 
+    # The same records through the bulk path: one validation call, chunked inserts, a structured report.
+    bulk_name = f"{collection_name}_bulk"
+    try:
+        client.delete_collection(name=bulk_name)
+    except Exception:
+        pass
+    bulk = client.create_collection(name=bulk_name)
+    report = insert_validated_records(bulk, raw_records, client.get_max_batch_size())
+    print(f"bulk insert: {report}")
+    for rejection in report.rejected:
+        print(f"  rejected [{rejection.index}] {rejection.id}: {[e['msg'] for e in rejection.errors]}")
+    rejected = {rejection.index for rejection in report.rejected}
+    inserted = [record.id for i, record in enumerate(raw_records) if i not in rejected]
+    read_back = read_validated_records(bulk, inserted + inserted[:1], client.get_max_batch_size())
+    print(f"bulk read: {len(read_back)} records ({inserted[0]} requested twice)")
+
 
 if __name__ == "__main__":
     main()
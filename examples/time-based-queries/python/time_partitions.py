@@ -0,0 +1,411 @@
+"""Route time-stamped records into per-period collections and prune on query.
+
+The time-based queries strategy keeps every record in one collection and
+filters on an epoch `date` field, so the collection and its HNSW index grow
+without bound and a "last 7 days" query still searches all of history.
+`TimePartitionedCollection` shards writes into one collection per day, week
+or month (`<prefix>_<period key>`) and:
+
+- answers a time-bounded `query()` / `get()` by searching only the partitions
+  that overlap the window, in parallel, with a `date` filter only on the
+  partitions the window cuts through, then merges a global top-k by distance;
+- implements retention by dropping whole partitions (`drop_before()`) instead
+  of deleting rows one by one.
+
+A record's partition is decided by its timestamp, so IDs are unique per
+partition; to move a record to another time, `delete()` it and add it again.
+
+Usage:
+    from time_partitions import TimePartitionedCollection
+
+    events = TimePartitionedCollection(client, "events", period="day")
+    events.add(ids=ids, embeddings=vectors, timestamps=epoch_seconds, documents=docs)
+    recent = events.query(query_embeddings=[q], n_results=10, start=time.time() - 7 * 86400)
+    events.drop_before(time.time() - 30 * 86400)
+
+Run the recent-window benchmark against a single collection (local, no server):
+    python time_partitions.py --rows 200000 --days 90
+"""
+
+from __future__ import annotations
+
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import Any, Sequence
+
+import chromadb
+import numpy as np
+
+PERIODS = ("day", "week", "month")
+
+
+def period_bounds(timestamp: float, period: str) -> tuple[str, float, float]:
+    """(partition key, start epoch, end epoch) of the UTC period containing `timestamp`."""
+
+    moment = datetime.fromtimestamp(timestamp, tz=timezone.utc)
+    day = moment.replace(hour=0, minute=0, second=0, microsecond=0)
+    if period == "day":
+        start, end, key = day, day + timedelta(days=1), day.strftime("%Y%m%d")
+    elif period == "week":
+        start = day - timedelta(days=day.weekday())
+        year, week, _ = start.isocalendar()
+        end, key = start + timedelta(days=7), f"{year}w{week:02d}"
+    elif period == "month":
+        start = day.replace(day=1)
+        end = (start + timedelta(days=32)).replace(day=1)
+        key = start.strftime("%Y%m")
+    else:
+        raise ValueError(f"period must be one of {PERIODS}, got {period!r}")
+    return key, start.timestamp(), end.timestamp()
+
+
+def _and(*clauses: dict[str, Any] | None) -> dict[str, Any] | None:
+    present = [c for c in clauses if c]
+    if not present:
+        return None
+    return present[0] if len(present) == 1 else {"$and": present}
+
+
+class TimePartitionedCollection:
+    """One logical collection stored as per-period Chroma collections."""
+
+    def __init__(
+        self,
+        client: Any,
+        prefix: str,
+        period: str = "day",
+        field: str = "date",
+        configuration: dict[str, Any] | None = None,
+        workers: int = 8,
+        batch_size: int | None = None,
+    ) -> None:
+        period_bounds(0, period)  # validates `period`
+        self.client = client
+        self.prefix = prefix
+        self.period = period
+        self.field = field
+        self.configuration = configuration
+        self.batch_size = batch_size or client.get_max_batch_size()
+        self._pool = ThreadPoolExecutor(max_workers=workers)
+        # key -> (start, end, collection); existing partitions are picked up by name.
+        self._partitions: dict[str, tuple[float, float, Any]] = {}
+        for collection in client.list_collections():
+            name = collection.name
+            if name.startswith(f"{prefix}_"):
+                key = name[len(prefix) + 1 :]
+                bounds = self._key_bounds(key)
+                if bounds is not None:  # e.g. `events_archive` is not a partition
+                    self._partitions[key] = (*bounds, client.get_collection(name))
+
+    def _key_bounds(self, key: str) -> tuple[float, float] | None:
+        """(start, end) of the period named by `key`, or None if `key` is not a key for `period`."""
+
+        try:
+            if self.period == "week":
+                year, week = key.split("w")
+                moment = datetime.fromisocalendar(int(year), int(week), 1).replace(tzinfo=timezone.utc)
+            else:
+                fmt = "%Y%m%d" if self.period == "day" else "%Y%m"
+                moment = datetime.strptime(key, fmt).replace(tzinfo=timezone.utc)
+        except ValueError:
+            return None
+        canonical, start, end = period_bounds(moment.timestamp(), self.period)
+        return (start, end) if canonical == key else None
+
+    def _partition(self, timestamp: float) -> Any:
+        key, start, end = period_bounds(timestamp, self.period)
+        partition = self._partitions.get(key)
+        if partition is None:
+            collection = self.client.get_or_create_collection(
+                f"{self.prefix}_{key}", configuration=self.configuration, embedding_function=None
+            )
+            partition = self._partitions[key] = (start, end, collection)
+        return partition[2]
+
+    def partitions(self) -> list[str]:
+        return sorted(self._partitions)
+
+    def count(self) -> int:
+        return sum(c.count() for _, _, c in self._partitions.values())
+
+    def close(self) -> None:
+        self._pool.shutdown()
+
+    # ── Writes ──
+
+    def _write(
+        self,
+        method: str,
+        ids: Sequence[str],
+        embeddings: Any,
+        timestamps: Sequence[float],
+        documents: Sequence[str] | None,
+        metadatas: Sequence[dict[str, Any] | None] | None,
+    ) -> None:
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        groups: dict[int, list[int]] = {}
+        collections: dict[int, Any] = {}
+        for row, timestamp in enumerate(timestamps):
+            collection = self._partition(timestamp)
+            groups.setdefault(id(collection), []).append(row)
+            collections[id(collection)] = collection
+        for key, rows in groups.items():
+            write = getattr(collections[key], method)
+            for start in range(0, len(rows), self.batch_size):
+                chunk = rows[start : start + self.batch_size]
+                write(
+                    ids=[ids[i] for i in chunk],
+                    embeddings=embeddings[chunk],
+                    documents=[documents[i] for i in chunk] if documents is not None else None,
+                    # The timestamp is stored too, so window edges can be filtered inside a partition.
+                    metadatas=[
+                        {**((metadatas[i] if metadatas is not None else None) or {}), self.field: int(timestamps[i])}
+                        for i in chunk
+                    ],
+                )
+
+    def add(
+        self,
+        ids: Sequence[str],
+        embeddings: Any,
+        timestamps: Sequence[float],
+        documents: Sequence[str] | None = None,
+        metadatas: Sequence[dict[str, Any] | None] | None = None,
+    ) -> None:
+        self._write("add", ids, embeddings, timestamps, documents, metadatas)
+
+    def upsert(
+        self,
+        ids: Sequence[str],
+        embeddings: Any,
+        timestamps: Sequence[float],
+        documents: Sequence[str] | None = None,
+        metadatas: Sequence[dict[str, Any] | None] | None = None,
+    ) -> None:
+        self._write("upsert", ids, embeddings, timestamps, documents, metadatas)
+
+    def delete(self, ids: Sequence[str], timestamps: Sequence[float] | None = None) -> None:
+        """Delete `ids` from the partitions their `timestamps` route to, or from every partition."""
+
+        if timestamps is None:
+            targets = [(c, list(ids)) for _, _, c in self._partitions.values()]
+        else:
+            if len(timestamps) != len(ids):
+                raise ValueError(f"got {len(ids)} ids but {len(timestamps)} timestamps")
+            groups: dict[str, list[str]] = {}
+            for record_id, timestamp in zip(ids, timestamps):
+                groups.setdefault(period_bounds(timestamp, self.period)[0], []).append(record_id)
+            targets = [(self._partitions[key][2], group) for key, group in groups.items() if key in self._partitions]
+        jobs = [
+            self._pool.submit(collection.delete, ids=chunk[start : start + self.batch_size])
+            for collection, chunk in targets
+            for start in range(0, len(chunk), self.batch_size)
+        ]
+        for job in jobs:
+            job.result()
+
+    def drop_before(self, cutoff: float) -> list[str]:
+        """Retention: drop every partition that ends at or before `cutoff`."""
+
+        dropped = [key for key, (_, end, _) in self._partitions.items() if end <= cutoff]
+        for key in dropped:
+            self.client.delete_collection(f"{self.prefix}_{key}")
+            del self._partitions[key]
+        return sorted(dropped)
+
+    # ── Reads ──
+
+    def _plan(
+        self, start: float | None, end: float | None, where: dict[str, Any] | None
+    ) -> list[tuple[Any, dict[str, Any] | None]]:
+        """(collection, where) for each partition overlapping [start, end)."""
+
+        plan = []
+        for key in sorted(self._partitions):
+            p_start, p_end, collection = self._partitions[key]
+            if (start is not None and p_end <= start) or (end is not None and p_start >= end):
+                continue  # pruned
+            bounds = []
+            if start is not None and start > p_start:
+                bounds.append({self.field: {"$gte": int(start)}})
+            if end is not None and end < p_end:
+                bounds.append({self.field: {"$lt": int(end)}})
+            plan.append((collection, _and(where, *bounds)))
+        return plan
+
+    def query(
+        self,
+        query_embeddings: Any,
+        n_results: int = 10,
+        start: float | None = None,
+        end: float | None = None,
+        where: dict[str, Any] | None = None,
+        where_document: dict[str, Any] | None = None,
+        include: Sequence[str] = ("metadatas", "documents", "distances"),
+    ) -> dict[str, Any]:
+        """Top `n_results` across the partitions overlapping [start, end), per query vector."""
+
+        queries = np.asarray(query_embeddings, dtype=np.float32)
+        fetch = list(dict.fromkeys([*include, "distances"]))
+
+        def search(collection: Any, partition_where: dict[str, Any] | None) -> dict[str, Any]:
+            return collection.query(
+                query_embeddings=queries,
+                n_results=n_results,
+                where=partition_where,
+                where_document=where_document,
+                include=fetch,
+            )
+
+        results = list(self._pool.map(lambda task: search(*task), self._plan(start, end, where)))
+        merged: dict[str, Any] = {key: [] for key in ["ids", *include]}
+        for q in range(len(queries)):
+            hits = [
+                (result["distances"][q][i], r, i)
+                for r, result in enumerate(results)
+                for i in range(len(result["ids"][q]))
+            ]
+            hits.sort(key=lambda hit: hit[0])
+            for key in merged:
+                merged[key].append([results[r][key][q][i] for _, r, i in hits[:n_results]])
+        merged["included"] = list(include)
+        return merged
+
+    def get(
+        self,
+        start: float | None = None,
+        end: float | None = None,
+        where: dict[str, Any] | None = None,
+        include: Sequence[str] = ("metadatas", "documents"),
+    ) -> dict[str, Any]:
+        """All records in [start, end), oldest partition first."""
+
+        plan = self._plan(start, end, where)
+        results = self._pool.map(lambda task: task[0].get(where=task[1], include=list(include)), plan)
+        merged: dict[str, Any] = {key: [] for key in ["ids", *include]}
+        for result in results:
+            for key in merged:
+                merged[key].extend(result[key])
+        merged["included"] = list(include)
+        return merged
+
+
+# ── Benchmark ──
+
+
+def _exact_top_k(vectors: np.ndarray, query: np.ndarray, k: int) -> np.ndarray:
+    distances = ((vectors - query) ** 2).sum(axis=1)
+    top = np.argpartition(distances, min(k, len(distances) - 1))[:k]
+    return top[np.argsort(distances[top])]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark time partitions against one filtered collection.")
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--days", type=int, default=90)
+    parser.add_argument("--dim", type=int, default=64)
+    parser.add_argument("--period", choices=PERIODS, default="day")
+    parser.add_argument("--window-days", type=int, default=7)
+    parser.add_argument("--retain-days", type=int, default=30)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--k", type=int, default=10)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    now = datetime(2026, 1, 1, tzinfo=timezone.utc).timestamp()
+    timestamps = np.sort(now - rng.random(args.rows) * args.days * 86400)
+    vectors = rng.random((args.rows, args.dim), dtype=np.float32)
+    ids = [f"evt-{i:08d}" for i in range(args.rows)]
+
+    client = chromadb.EphemeralClient()
+    for collection in client.list_collections():
+        if collection.name.startswith("timebench"):
+            client.delete_collection(collection.name)
+    single = client.create_collection("timebench_single", embedding_function=None)
+    batch_size = client.get_max_batch_size()
+    started = time.perf_counter()
+    for start in range(0, args.rows, batch_size):
+        end = min(start + batch_size, args.rows)
+        single.add(
+            ids=ids[start:end],
+            embeddings=vectors[start:end],
+            metadatas=[{"date": int(t)} for t in timestamps[start:end]],
+        )
+    single_secs = time.perf_counter() - started
+
+    started = time.perf_counter()
+    partitioned = TimePartitionedCollection(client, "timebench_p", period=args.period)
+    partitioned.add(ids, vectors, timestamps)
+    partitioned_secs = time.perf_counter() - started
+    print(
+        f"ingest {args.rows:,} rows: single={args.rows / single_secs:,.0f}/s "
+        f"partitioned={args.rows / partitioned_secs:,.0f}/s ({len(partitioned.partitions())} partitions)"
+    )
+
+    window_start = now - args.window_days * 86400 - 3600  # not aligned to a partition edge
+    in_window = np.flatnonzero(timestamps >= window_start)
+    queries = rng.random((args.queries, args.dim), dtype=np.float32)
+    for name, run in (
+        (
+            "single + where",
+            lambda q: single.query(
+                query_embeddings=[q], n_results=args.k, where={"date": {"$gte": int(window_start)}}, include=[]
+            )["ids"][0],
+        ),
+        (
+            "partitioned",
+            lambda q: partitioned.query([q], n_results=args.k, start=window_start, include=[])["ids"][0],
+        ),
+    ):
+        latencies, hits = [], 0
+        for q in queries:
+            started = time.perf_counter()
+            found = run(q)
+            latencies.append(time.perf_counter() - started)
+            truth = {ids[i] for i in in_window[_exact_top_k(vectors[in_window], q, args.k)]}
+            hits += len(truth & set(found))
+        ms = np.asarray(latencies) * 1000
+        print(
+            f"last {args.window_days}d query {name:<15} p50={np.percentile(ms, 50):7.2f}ms "
+            f"p95={np.percentile(ms, 95):7.2f}ms recall@{args.k}={hits / (args.queries * args.k):.3f}"
+        )
+
+    cutoff = now - args.retain_days * 86400
+    expected = int((timestamps >= cutoff).sum())
+    started = time.perf_counter()
+    single.delete(where={"date": {"$lt": int(cutoff)}})
+    delete_secs = time.perf_counter() - started
+    started = time.perf_counter()
+    dropped = partitioned.drop_before(cutoff)
+    drop_secs = time.perf_counter() - started
+    # The partition holding the cutoff is kept whole, so rows in it just before the cutoff remain.
+    remaining = len(partitioned.get(start=cutoff, include=[])["ids"])
+    if single.count() != expected or remaining != expected:
+        raise AssertionError(f"retention mismatch: {single.count()} / {remaining} vs {expected}")
+    print(
+        f"retention ({args.retain_days}d): per-row delete={delete_secs * 1000:,.0f}ms "
+        f"drop {len(dropped)} partitions={drop_secs * 1000:,.0f}ms"
+    )
+
+    # Reopening picks up the partitions by name and ignores unrelated `<prefix>_*` collections.
+    client.create_collection("timebench_p_archive", embedding_function=None)
+    reopened = TimePartitionedCollection(client, "timebench_p", period=args.period)
+    if reopened.partitions() != partitioned.partitions():
+        raise AssertionError("reopened partitions differ")
+    survivors = partitioned.get(start=cutoff, include=[])["ids"]
+    routed, fanned = survivors[:5], survivors[5:10]
+    by_id = dict(zip(ids, timestamps))
+    reopened.delete(routed, timestamps=[by_id[i] for i in routed])
+    reopened.delete(fanned)
+    if reopened.count() != remaining - len(routed) - len(fanned):
+        raise AssertionError("delete() left rows behind")
+    reopened.close()
+
+    partitioned.close()
+    print("\npython: time partitions example passed")
+
+
+if __name__ == "__main__":
+    main()